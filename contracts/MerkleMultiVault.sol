@@ -0,0 +1,253 @@
+pragma solidity ^0.4.8;
+
+
+import "./Crowdsale.sol";
+import "./SafeMathLib.sol";
+import "./StandardToken.sol";
+
+/**
+ * A MultiVault that stores only a Merkle root of the investor data.
+ *
+ * - Investor list is not loaded on the chain, setup is a single transaction regardless of the investor count
+ * - Leaves are sha3(investor, balance) and pairs are hashed in sorted order
+ * - Investors claim by giving their balance and the Merkle proof, built offline with helpers/merkle.py
+ * - Claim amounts are calculated pro-rata the same way as in MultiVault
+ *
+ */
+contract MerkleMultiVault is Ownable {
+
+  using SafeMathLib for uint;
+
+  /** Root of the Merkle tree of (investor, balance) leaves */
+  bytes32 public merkleRoot;
+
+  /** Sum of all balances in the tree. We use this as the distribution total amount. */
+  uint public weiRaisedTotal;
+
+  /** Investor balances that have been proven on a claim */
+  mapping(address => uint) public balances;
+
+  /** How many tokens investors have claimed */
+  mapping(address => uint) public claimed;
+
+  /** When our claim freeze is over (UNIT timestamp) */
+  uint public freezeEndsAt;
+
+  /** Our ICO contract where we will move the funds */
+  Crowdsale public crowdsale;
+
+  /** We can also define our own token, which will override the ICO one ***/
+  FractionalERC20 public token;
+
+  /** How many tokens were deposited on the vautl */
+  uint public initialTokenBalance;
+
+  /* Has owner set the initial balance */
+  bool public initialTokenBalanceFetched;
+
+  /** What is our current state. */
+  enum State{Unknown, Holding, Distributing}
+
+  /** Investor data root was set */
+  event MerkleRootChanged(bytes32 merkleRoot, uint weiRaisedTotal);
+
+  /** We distributed tokens to an investor */
+  event Distributed(address investors, uint count);
+
+  /**
+   * Create a vault where lock up ends at the given time.
+   */
+  function MerkleMultiVault(address _owner, uint _freezeEndsAt, bytes32 _merkleRoot, uint _weiRaisedTotal) {
+
+    owner = _owner;
+
+    // Give argument
+    if(_freezeEndsAt == 0) {
+      throw;
+    }
+
+    freezeEndsAt = _freezeEndsAt;
+
+    setMerkleRootInternal(_merkleRoot, _weiRaisedTotal);
+  }
+
+  /**
+   * Allow to fix fat fingers in the investor data before the distribution begins.
+   */
+  function setMerkleRoot(bytes32 _merkleRoot, uint _weiRaisedTotal) public onlyOwner {
+    if(getState() != State.Holding) throw;
+    setMerkleRootInternal(_merkleRoot, _weiRaisedTotal);
+  }
+
+  function setMerkleRootInternal(bytes32 _merkleRoot, uint _weiRaisedTotal) private {
+    if(_merkleRoot == 0) throw;
+    if(_weiRaisedTotal == 0) throw;
+    merkleRoot = _merkleRoot;
+    weiRaisedTotal = _weiRaisedTotal;
+    MerkleRootChanged(merkleRoot, weiRaisedTotal);
+  }
+
+  /**
+   * Get the token we are distributing.
+   */
+  function getToken() public constant returns(FractionalERC20) {
+    if (address(token) > 0)
+      return token;
+
+    if(address(crowdsale) == 0)  {
+      throw;
+    }
+
+    return crowdsale.token();
+  }
+
+  /**
+   * Check that (investor, balance) is a leaf in our tree.
+   */
+  function isValidProof(address investor, uint balance, bytes32[] proof) public constant returns (bool) {
+    bytes32 node = sha3(investor, balance);
+
+    for(uint i=0; i<proof.length; i++) {
+      if(node < proof[i]) {
+        node = sha3(node, proof[i]);
+      } else {
+        node = sha3(proof[i], node);
+      }
+    }
+
+    return node == merkleRoot;
+  }
+
+  /**
+   * How may tokens an investor with a given balance gets.
+   */
+  function getClaimAmountOf(uint balance) public constant returns (uint) {
+
+    if(!initialTokenBalanceFetched) {
+      throw;
+    }
+
+    return initialTokenBalance.times(balance) / weiRaisedTotal;
+  }
+
+  /**
+   * How may tokens each investor gets.
+   *
+   * Only known after the investor has made the first claim with the proof.
+   */
+  function getClaimAmount(address investor) public constant returns (uint) {
+    return getClaimAmountOf(balances[investor]);
+  }
+
+  /**
+   * How many tokens remain unclaimed for an investor that has proven the balance.
+   */
+  function getClaimLeft(address investor) public constant returns (uint) {
+    return getClaimAmount(investor).minus(claimed[investor]);
+  }
+
+  /**
+   * Claim all remaining tokens for this investor.
+   */
+  function claimAll(uint balance, bytes32[] proof) {
+    proveBalance(msg.sender, balance, proof);
+    claimInternal(msg.sender, getClaimLeft(msg.sender));
+  }
+
+  /**
+   * Claim N tokens to the investor as the msg sender.
+   */
+  function claim(uint balance, bytes32[] proof, uint amount) {
+    proveBalance(msg.sender, balance, proof);
+    claimInternal(msg.sender, amount);
+  }
+
+  /**
+   * Only owner is allowed to set the vault initial token balance.
+   *
+   * Because only owner can guarantee that the all tokens have been moved
+   * to the vault and it can begin disribution. Otherwise somecone can
+   * call this too early and lock the balance to zero or some other bad value.
+   */
+  function fetchTokenBalance() onlyOwner {
+    // Caching fetched token amount:
+    if (!initialTokenBalanceFetched) {
+        initialTokenBalance = getToken().balanceOf(address(this));
+        if(initialTokenBalance == 0) throw; // Somehow in invalid state
+        initialTokenBalanceFetched = true;
+    } else {
+      throw;
+    }
+  }
+
+  /**
+   * Verify the investor balance once and remember it for the later claims.
+   */
+  function proveBalance(address investor, uint balance, bytes32[] proof) private {
+
+    if(balances[investor] > 0) {
+      // Already proven, do not pay for the proof again
+      if(balances[investor] != balance) throw;
+      return;
+    }
+
+    if(balance == 0) throw;
+
+    if(!isValidProof(investor, balance, proof)) throw;
+
+    balances[investor] = balance;
+  }
+
+  function claimInternal(address investor, uint amount) private {
+
+    if(!initialTokenBalanceFetched) {
+      // We need to have the balance before we start
+      throw;
+    }
+
+    if(getState() != State.Distributing) {
+      // We are not distributing yet
+      throw;
+    }
+
+    if(getClaimLeft(investor) < amount) {
+      // Woops we cannot get more than we have left
+      throw;
+    }
+
+    claimed[investor] = claimed[investor].plus(amount);
+    getToken().transfer(investor, amount);
+
+    Distributed(investor, amount);
+  }
+
+  /**
+   * Set the target crowdsale where we will move presale funds when the crowdsale opens.
+   */
+  function setCrowdsale(Crowdsale _crowdsale) public onlyOwner {
+    crowdsale = _crowdsale;
+  }
+
+  /**
+   * Set the target token, which overrides the ICO token.
+   */
+  function setToken(FractionalERC20 _token) public onlyOwner {
+    token = _token;
+  }
+
+  /**
+   * Resolve the contract umambigious state.
+   */
+  function getState() public returns(State) {
+    if(now > freezeEndsAt && initialTokenBalanceFetched) {
+      return State.Distributing;
+    } else {
+      return State.Holding;
+    }
+  }
+
+  /** Explicitly call function from your wallet. */
+  function() payable {
+    throw;
+  }
+}
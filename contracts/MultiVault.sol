@@ -49,6 +49,9 @@ contract MultiVault is Ownable {
   /* Has owner set the initial balance */
   bool public initialTokenBalanceFetched;
 
+  /** Investors below this index have been pushed their tokens by distributeRange() */
+  uint public distributionCursor;
+
   /** What is our current state. */
   enum State{Unknown, Holding, Distributing}
 
@@ -95,6 +98,34 @@ contract MultiVault is Ownable {
     // Cannot invest anymore through crowdsale when moving has begun
     if(getState() != State.Holding) throw;
 
+    addInvestorInternal(investor, amount);
+  }
+
+  /**
+   * Load many investors in a single transaction.
+   *
+   * Each investor goes through the same checks as in addInvestor(),
+   * so loading an investor twice throws the whole batch.
+   */
+  function addInvestors(address[] _investors, uint[] amounts) public onlyOwner {
+
+    // Cannot invest anymore through crowdsale when moving has begun
+    if(getState() != State.Holding) throw;
+
+    if(_investors.length != amounts.length) throw;
+
+    if(_investors.length == 0) throw;
+
+    for(uint i=0; i<_investors.length; i++) {
+      addInvestorInternal(_investors[i], amounts[i]);
+    }
+  }
+
+  /**
+   * Record a new investor.
+   */
+  function addInvestorInternal(address investor, uint amount) private {
+
     if(amount == 0) throw; // No empty buys
 
     bool existing = balances[investor] > 0;
@@ -137,6 +168,42 @@ contract MultiVault is Ownable {
     return getClaimAmount(investor).minus(claimed[investor]);
   }
 
+  /**
+   * Claim entitlements for a slice of investors in one call.
+   *
+   * Returns investors[start..start+count], capped to the investor count,
+   * with their total claim amount, already claimed and remaining tokens.
+   */
+  function getClaimRange(uint start, uint count) public constant returns (address[] _investors, uint[] amounts, uint[] claimedAmounts, uint[] left) {
+
+    if(!initialTokenBalanceFetched) {
+      throw;
+    }
+
+    uint end = start.plus(count);
+    if(end > investors.length) {
+      end = investors.length;
+    }
+
+    uint size = 0;
+    if(end > start) {
+      size = end - start;
+    }
+
+    _investors = new address[](size);
+    amounts = new uint[](size);
+    claimedAmounts = new uint[](size);
+    left = new uint[](size);
+
+    for(uint i=0; i<size; i++) {
+      address investor = investors[start + i];
+      _investors[i] = investor;
+      amounts[i] = initialTokenBalance.times(balances[investor]) / weiRaisedTotal;
+      claimedAmounts[i] = claimed[investor];
+      left[i] = amounts[i].minus(claimedAmounts[i]);
+    }
+  }
+
   /**
    * Claim all remaining tokens for this investor.
    */
@@ -190,6 +257,51 @@ contract MultiVault is Ownable {
     Distributed(investor, amount);
   }
 
+  /**
+   * Owner pushes the remaining tokens to a range of investors.
+   *
+   * Walks investors[start..start+count], capped to the investor count.
+   * Investors who have already claimed everything are skipped,
+   * so ranges can be retried safely.
+   */
+  function distributeRange(uint start, uint count) public onlyOwner {
+
+    if(!initialTokenBalanceFetched) {
+      // We need to have the balance before we start
+      throw;
+    }
+
+    if(getState() != State.Distributing) {
+      // We are not distributing yet
+      throw;
+    }
+
+    uint end = start.plus(count);
+    if(end > investors.length) {
+      end = investors.length;
+    }
+
+    FractionalERC20 _token = getToken();
+
+    for(uint i=start; i<end; i++) {
+      address investor = investors[i];
+      uint amount = getClaimLeft(investor);
+      if(amount == 0) {
+        continue;
+      }
+
+      claimed[investor] = claimed[investor].plus(amount);
+      _token.transfer(investor, amount);
+
+      Distributed(investor, amount);
+    }
+
+    // Move the cursor only when the ranges are contiguous
+    if(start <= distributionCursor && end > distributionCursor) {
+      distributionCursor = end;
+    }
+  }
+
   /**
    * Set the target crowdsale where we will move presale funds when the crowdsale opens.
    */
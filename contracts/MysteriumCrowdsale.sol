@@ -16,6 +16,13 @@ contract MysteriumCrowdsale is Crowdsale {
 
   uint public hardCapCHF = 14000000 * 10000;
 
+  // Caps in wei, valid when capsCached is set. The CHF rate cannot change after the crowdsale has started.
+  bool public capsCached;
+
+  uint public hardCapInWei;
+
+  uint public minimumFundingGoalInWei;
+
   function MysteriumCrowdsale(address _token, PricingStrategy _pricingStrategy, address _multisigWallet, uint _start, uint _end)
     Crowdsale(_token, _pricingStrategy, _multisigWallet, _start, _end, 0) {
   }
@@ -42,6 +49,11 @@ contract MysteriumCrowdsale is Crowdsale {
    * Hook in to provide the soft cap time bomb.
    */
   function onInvest() internal {
+     // The CHF rate is final after the start, so the first buy after it converts the caps for the rest
+     if(!capsCached && now > startsAt) {
+         cacheCaps();
+     }
+
      if(!softCapTriggered) {
          uint softCap = MysteriumPricing(pricingStrategy).getSoftCapInWeis();
          if(weiRaised > softCap) {
@@ -50,10 +62,24 @@ contract MysteriumCrowdsale is Crowdsale {
      }
   }
 
+  /**
+   * Convert the caps to wei once and for all.
+   *
+   * Until then the caps are converted on every call.
+   */
+  function cacheCaps() private {
+    hardCapInWei = MysteriumPricing(pricingStrategy).convertToWei(hardCapCHF);
+    minimumFundingGoalInWei = MysteriumPricing(pricingStrategy).convertToWei(minimumFundingCHF);
+    capsCached = true;
+  }
+
   /**
    * Get minimum funding goal in wei.
    */
   function getMinimumFundingGoal() public constant returns (uint goalInWei) {
+    if(capsCached) {
+      return minimumFundingGoalInWei;
+    }
     return MysteriumPricing(pricingStrategy).convertToWei(minimumFundingCHF);
   }
 
@@ -62,6 +88,9 @@ contract MysteriumCrowdsale is Crowdsale {
    */
   function setMinimumFundingLimit(uint chf) onlyOwner {
     minimumFundingCHF = chf;
+    if(capsCached) {
+      minimumFundingGoalInWei = MysteriumPricing(pricingStrategy).convertToWei(minimumFundingCHF);
+    }
   }
 
   /**
@@ -72,6 +101,9 @@ contract MysteriumCrowdsale is Crowdsale {
   }
 
   function getHardCap() public constant returns (uint capInWei) {
+    if(capsCached) {
+      return hardCapInWei;
+    }
     return MysteriumPricing(pricingStrategy).convertToWei(hardCapCHF);
   }
 
@@ -82,6 +114,21 @@ contract MysteriumCrowdsale is Crowdsale {
    */
   function setHardCapCHF(uint _hardCapCHF) onlyOwner {
     hardCapCHF = _hardCapCHF;
+    if(capsCached) {
+      hardCapInWei = MysteriumPricing(pricingStrategy).convertToWei(hardCapCHF);
+    }
+  }
+
+  /**
+   * Swap the pricing strategy.
+   *
+   * Cached caps are converted again with the new pricing.
+   */
+  function setPricingStrategy(PricingStrategy _pricingStrategy) onlyOwner {
+    super.setPricingStrategy(_pricingStrategy);
+    if(capsCached) {
+      cacheCaps();
+    }
   }
 
   /**
@@ -26,11 +26,19 @@ contract MysteriumPricing is PricingStrategy, Ownable {
 
   uint public softCapCHF = 6000000 * 10000; // Soft cap set in CHF
 
+  // Derived from the above when the rate or the soft cap changes, so buying does not need to convert
+  uint public softCapInWeis;
+
+  uint public hardCapTokenPrice; // How many weis one token costs after the soft cap
+
+  uint public softCapTokenPrice; // How many weis one token costs before the soft cap
+
   //Address of the ICO contract:
   Crowdsale public crowdsale;
 
   function MysteriumPricing(uint initialChfRate) {
     chfRate = initialChfRate;
+    updateWeiPrices();
   }
 
   /// @dev Setting crowdsale for setConversionRate()
@@ -52,6 +60,7 @@ contract MysteriumPricing is PricingStrategy, Ownable {
       throw;
 
     chfRate = _chfRate;
+    updateWeiPrices();
   }
 
   /**
@@ -59,6 +68,16 @@ contract MysteriumPricing is PricingStrategy, Ownable {
    */
   function setSoftCapCHF(uint _softCapCHF) onlyOwner {
     softCapCHF = _softCapCHF;
+    updateWeiPrices();
+  }
+
+  /**
+   * Convert the CHF denominated soft cap and token prices to weis.
+   */
+  function updateWeiPrices() private {
+    softCapInWeis = convertToWei(softCapCHF);
+    hardCapTokenPrice = convertToWei(hardCapPrice);
+    softCapTokenPrice = convertToWei(softCapPrice);
   }
 
   /**
@@ -81,8 +100,8 @@ contract MysteriumPricing is PricingStrategy, Ownable {
   }
 
   /// @dev Function which tranforms CHF softcap to weis
-  function getSoftCapInWeis() public returns (uint) {
-    return convertToWei(softCapCHF);
+  function getSoftCapInWeis() public constant returns (uint) {
+    return softCapInWeis;
   }
 
   /**
@@ -93,11 +112,11 @@ contract MysteriumPricing is PricingStrategy, Ownable {
   function calculatePrice(uint value, uint weiRaised, uint tokensSold, address msgSender, uint decimals) public constant returns (uint) {
 
     uint multiplier = 10 ** decimals;
-    if (weiRaised > getSoftCapInWeis()) {
+    if (weiRaised > softCapInWeis) {
       //Here SoftCap is not active yet
-      return value.times(multiplier) / convertToWei(hardCapPrice);
+      return value.times(multiplier) / hardCapTokenPrice;
     } else {
-      return value.times(multiplier) / convertToWei(softCapPrice);
+      return value.times(multiplier) / softCapTokenPrice;
     }
   }
 
@@ -0,0 +1,366 @@
+pragma solidity ^0.4.8;
+
+
+import "./Crowdsale.sol";
+import "./SafeMathLib.sol";
+import "./StandardToken.sol";
+
+/**
+ * A MultiVault with the investor record packed in a single storage slot.
+ *
+ * - Invested balance and claimed tokens share one slot, so a claim writes a single investor slot
+ * - Investor count is the length of the investor list, there is no separate counter to update
+ * - Token address and the balance fetched flag share a slot, as every claim reads both
+ * - External functions are the same as in MultiVault, so the same scripts work with both vaults
+ *
+ */
+contract PackedMultiVault is Ownable {
+
+  using SafeMathLib for uint;
+
+  /** One slot per investor */
+  struct Investor {
+    /** How much they have invested */
+    uint128 balance;
+
+    /** How many tokens they have claimed */
+    uint128 claimed;
+  }
+
+  /** How many wei we have raised total. We use this as the distribution total amount. However because investors are added by hand this can be direct percentages too. */
+  uint public weiRaisedTotal;
+
+  /** Who are our investors (iterable) */
+  address[] public investors;
+
+  /** Balance and claimed tokens of each investor */
+  mapping(address => Investor) records;
+
+  /** When our claim freeze is over (UNIT timestamp) */
+  uint public freezeEndsAt;
+
+  /** Our ICO contract where we will move the funds */
+  Crowdsale public crowdsale;
+
+  /** We can also define our own token, which will override the ICO one ***/
+  FractionalERC20 public token;
+
+  /* Has owner set the initial balance, packed with the token address */
+  bool public initialTokenBalanceFetched;
+
+  /** How many tokens were deposited on the vautl */
+  uint public initialTokenBalance;
+
+  /** Investors below this index have been pushed their tokens by distributeRange() */
+  uint public distributionCursor;
+
+  /** What is our current state. */
+  enum State{Unknown, Holding, Distributing}
+
+  /** Somebody loaded their investment money */
+  event Invested(address investor, uint value);
+
+  /** We distributed tokens to an investor */
+  event Distributed(address investors, uint count);
+
+  /**
+   * Create presale contract where lock up period is given days
+   */
+  function PackedMultiVault(address _owner, uint _freezeEndsAt) {
+
+    owner = _owner;
+
+    // Give argument
+    if(_freezeEndsAt == 0) {
+      throw;
+    }
+
+    freezeEndsAt = _freezeEndsAt;
+  }
+
+  /**
+   * Narrow a value to the investor record width.
+   */
+  function toUint128(uint value) private constant returns (uint128) {
+    if(value >= 2**128) throw;
+    return uint128(value);
+  }
+
+  /**
+   * How many investors we have now.
+   */
+  function investorCount() public constant returns (uint) {
+    return investors.length;
+  }
+
+  /**
+   * How much an investor has invested.
+   */
+  function balances(address investor) public constant returns (uint) {
+    return records[investor].balance;
+  }
+
+  /**
+   * How many tokens an investor has claimed.
+   */
+  function claimed(address investor) public constant returns (uint) {
+    return records[investor].claimed;
+  }
+
+  /**
+   * Get the token we are distributing.
+   */
+  function getToken() public constant returns(FractionalERC20) {
+    if (address(token) > 0)
+      return token;
+
+    if(address(crowdsale) == 0)  {
+      throw;
+    }
+
+    return crowdsale.token();
+  }
+
+  /**
+   * Participate to a presale.
+   */
+  function addInvestor(address investor, uint amount) public onlyOwner {
+
+    // Cannot invest anymore through crowdsale when moving has begun
+    if(getState() != State.Holding) throw;
+
+    addInvestorInternal(investor, amount);
+  }
+
+  /**
+   * Load many investors in a single transaction.
+   *
+   * Each investor goes through the same checks as in addInvestor(),
+   * so loading an investor twice throws the whole batch.
+   */
+  function addInvestors(address[] _investors, uint[] amounts) public onlyOwner {
+
+    // Cannot invest anymore through crowdsale when moving has begun
+    if(getState() != State.Holding) throw;
+
+    if(_investors.length != amounts.length) throw;
+
+    if(_investors.length == 0) throw;
+
+    for(uint i=0; i<_investors.length; i++) {
+      addInvestorInternal(_investors[i], amounts[i]);
+    }
+  }
+
+  /**
+   * Record a new investor.
+   */
+  function addInvestorInternal(address investor, uint amount) private {
+
+    if(amount == 0) throw; // No empty buys
+
+    Investor storage record = records[investor];
+
+    if(record.balance > 0) {
+      // Guarantee data load against race conditiosn
+      // and fat fingers, so that we can load one investor only once
+      throw;
+    }
+
+    record.balance = toUint128(amount);
+    investors.push(investor);
+
+    weiRaisedTotal = weiRaisedTotal.plus(amount);
+
+    Invested(investor, amount);
+  }
+
+  /**
+   * How may tokens each investor gets.
+   */
+  function getClaimAmount(address investor) public constant returns (uint) {
+
+    if(!initialTokenBalanceFetched) {
+      throw;
+    }
+
+    return initialTokenBalance.times(records[investor].balance) / weiRaisedTotal;
+  }
+
+  /**
+   * How many tokens remain unclaimed for an investor.
+   */
+  function getClaimLeft(address investor) public constant returns (uint) {
+    return getClaimAmount(investor).minus(records[investor].claimed);
+  }
+
+  /**
+   * Claim entitlements for a slice of investors in one call.
+   *
+   * Returns investors[start..start+count], capped to the investor count,
+   * with their total claim amount, already claimed and remaining tokens.
+   */
+  function getClaimRange(uint start, uint count) public constant returns (address[] _investors, uint[] amounts, uint[] claimedAmounts, uint[] left) {
+
+    if(!initialTokenBalanceFetched) {
+      throw;
+    }
+
+    uint end = start.plus(count);
+    if(end > investors.length) {
+      end = investors.length;
+    }
+
+    uint size = 0;
+    if(end > start) {
+      size = end - start;
+    }
+
+    _investors = new address[](size);
+    amounts = new uint[](size);
+    claimedAmounts = new uint[](size);
+    left = new uint[](size);
+
+    for(uint i=0; i<size; i++) {
+      address investor = investors[start + i];
+      _investors[i] = investor;
+      amounts[i] = initialTokenBalance.times(records[investor].balance) / weiRaisedTotal;
+      claimedAmounts[i] = records[investor].claimed;
+      left[i] = amounts[i].minus(claimedAmounts[i]);
+    }
+  }
+
+  /**
+   * Claim all remaining tokens for this investor.
+   */
+  function claimAll() {
+    claim(getClaimLeft(msg.sender));
+  }
+
+  /**
+   * Only owner is allowed to set the vault initial token balance.
+   *
+   * Because only owner can guarantee that the all tokens have been moved
+   * to the vault and it can begin disribution. Otherwise somecone can
+   * call this too early and lock the balance to zero or some other bad value.
+   */
+  function fetchTokenBalance() onlyOwner {
+    // Caching fetched token amount:
+    if (!initialTokenBalanceFetched) {
+        initialTokenBalance = getToken().balanceOf(address(this));
+        if(initialTokenBalance == 0) throw; // Somehow in invalid state
+        toUint128(initialTokenBalance); // Claimed amounts must fit the investor record
+        initialTokenBalanceFetched = true;
+    } else {
+      throw;
+    }
+  }
+
+  /**
+   * Claim N bought tokens to the investor as the msg sender.
+   *
+   */
+  function claim(uint amount) {
+    address investor = msg.sender;
+
+    if(!initialTokenBalanceFetched) {
+      // We need to have the balance before we start
+      throw;
+    }
+
+    if(getState() != State.Distributing) {
+      // We are not distributing yet
+      throw;
+    }
+
+    Investor storage record = records[investor];
+    uint claimAmount = initialTokenBalance.times(record.balance) / weiRaisedTotal;
+
+    if(claimAmount.minus(record.claimed) < amount) {
+      // Woops we cannot get more than we have left
+      throw;
+    }
+
+    // Below the claim amount, so it fits
+    record.claimed = uint128(amount.plus(record.claimed));
+    getToken().transfer(investor, amount);
+
+    Distributed(investor, amount);
+  }
+
+  /**
+   * Owner pushes the remaining tokens to a range of investors.
+   *
+   * Walks investors[start..start+count], capped to the investor count.
+   * Investors who have already claimed everything are skipped,
+   * so ranges can be retried safely.
+   */
+  function distributeRange(uint start, uint count) public onlyOwner {
+
+    if(!initialTokenBalanceFetched) {
+      // We need to have the balance before we start
+      throw;
+    }
+
+    if(getState() != State.Distributing) {
+      // We are not distributing yet
+      throw;
+    }
+
+    uint end = start.plus(count);
+    if(end > investors.length) {
+      end = investors.length;
+    }
+
+    FractionalERC20 _token = getToken();
+
+    for(uint i=start; i<end; i++) {
+      address investor = investors[i];
+      Investor storage record = records[investor];
+      uint amount = (initialTokenBalance.times(record.balance) / weiRaisedTotal).minus(record.claimed);
+      if(amount == 0) {
+        continue;
+      }
+
+      record.claimed = uint128(amount.plus(record.claimed));
+      _token.transfer(investor, amount);
+
+      Distributed(investor, amount);
+    }
+
+    // Move the cursor only when the ranges are contiguous
+    if(start <= distributionCursor && end > distributionCursor) {
+      distributionCursor = end;
+    }
+  }
+
+  /**
+   * Set the target crowdsale where we will move presale funds when the crowdsale opens.
+   */
+  function setCrowdsale(Crowdsale _crowdsale) public onlyOwner {
+    crowdsale = _crowdsale;
+  }
+
+  /**
+   * Set the target token, which overrides the ICO token.
+   */
+  function setToken(FractionalERC20 _token) public onlyOwner {
+    token = _token;
+  }
+
+  /**
+   * Resolve the contract umambigious state.
+   */
+  function getState() public returns(State) {
+    if(now > freezeEndsAt && initialTokenBalanceFetched) {
+      return State.Distributing;
+    } else {
+      return State.Holding;
+    }
+  }
+
+  /** Explicitly call function from your wallet. */
+  function() payable {
+    throw;
+  }
+}
@@ -0,0 +1,172 @@
+pragma solidity ^0.4.8;
+
+import "./PricingStrategy.sol";
+import "./SafeMathLib.sol";
+import "./Crowdsale.sol";
+import "zeppelin/contracts/ownership/Ownable.sol";
+
+/**
+ * Tiered crowdsale pricing in CHF.
+ *
+ * Each tier has a CHF limit for the total raised and a CHF token price.
+ * The last tier is open ended. A purchase crossing tier limits is split,
+ * and each part is priced in its own tier.
+ *
+ * The tier of the current raised amount is found with a binary search,
+ * so the lookup cost grows logarithmically with the tier count.
+ */
+contract TieredPricing is PricingStrategy, Ownable {
+
+  using SafeMathLib for uint;
+
+  // The conversion rate, same as MysteriumPricing: CHF/ETH * chfScale
+  uint public chfRate;
+
+  uint public chfScale = 10000;
+
+  // One tier in CHF base points
+  struct Tier {
+    // Total raised where the tier ends, not enforced for the last tier
+    uint128 limitCHF;
+
+    // How much one token costs
+    uint128 priceCHF;
+  }
+
+  // Tier converted to weis when the rate changes. Both fields share one storage slot.
+  struct WeiTier {
+    uint128 limitInWei;
+    uint128 priceInWei;
+  }
+
+  // Tiers by ascending limit
+  Tier[] public tiers;
+
+  WeiTier[] public weiTiers;
+
+  //Address of the ICO contract:
+  Crowdsale public crowdsale;
+
+  function TieredPricing(uint initialChfRate, uint[] _tierLimitsCHF, uint[] _tierPricesCHF) {
+
+    if(_tierLimitsCHF.length == 0 || _tierLimitsCHF.length != _tierPricesCHF.length) {
+      throw;
+    }
+
+    for(uint i=0; i<_tierLimitsCHF.length; i++) {
+      if(_tierPricesCHF[i] == 0) {
+        throw;
+      }
+
+      if(i > 0 && _tierLimitsCHF[i] <= _tierLimitsCHF[i-1]) {
+        throw;
+      }
+
+      tiers.push(Tier(toUint128(_tierLimitsCHF[i]), toUint128(_tierPricesCHF[i])));
+    }
+
+    weiTiers.length = tiers.length;
+    chfRate = initialChfRate;
+    updateWeiPrices();
+  }
+
+  /// @dev Setting crowdsale for setConversionRate()
+  /// @param _crowdsale The address of our ICO contract
+  function setCrowdsale(Crowdsale _crowdsale) onlyOwner {
+
+    if(!_crowdsale.isCrowdsale()) {
+      throw;
+    }
+
+    crowdsale = _crowdsale;
+  }
+
+  /// @dev Here you can set the new CHF/ETH rate
+  /// @param _chfRate The rate how many weis is one CHF
+  function setConversionRate(uint _chfRate) onlyOwner {
+    //Here check if ICO is active
+    if(now > crowdsale.startsAt())
+      throw;
+
+    chfRate = _chfRate;
+    updateWeiPrices();
+  }
+
+  function updateWeiPrices() private {
+    for(uint i=0; i<tiers.length; i++) {
+      weiTiers[i] = WeiTier(toUint128(convertToWei(tiers[i].limitCHF)), toUint128(convertToWei(tiers[i].priceCHF)));
+    }
+  }
+
+  function toUint128(uint value) private constant returns (uint128) {
+    if(value >= 2**128) {
+      throw;
+    }
+    return uint128(value);
+  }
+
+  function getTierCount() public constant returns (uint) {
+    return tiers.length;
+  }
+
+  /**
+   * Get CHF/ETH pair as an integer.
+   */
+  function getEthChfPrice() public constant returns (uint) {
+    return chfRate / chfScale;
+  }
+
+  /**
+   * Currency conversion
+   *
+   * @param  chf CHF price * 10000
+   * @return wei price
+   */
+  function convertToWei(uint chf) public constant returns(uint) {
+    return chf.times(10**18) / chfRate;
+  }
+
+  /**
+   * Find the tier where the next wei is priced.
+   *
+   * @return The first tier whose limit is above weiRaised, or the last tier
+   */
+  function getTierIndex(uint weiRaised) public constant returns (uint) {
+    uint low = 0;
+    uint high = weiTiers.length - 1;
+
+    while(low < high) {
+      uint mid = (low + high) / 2;
+      if(weiTiers[mid].limitInWei > weiRaised) {
+        high = mid;
+      } else {
+        low = mid + 1;
+      }
+    }
+
+    return low;
+  }
+
+  /**
+   * Calculate the tokens for a purchase, splitting it over the tiers it crosses.
+   */
+  function calculatePrice(uint value, uint weiRaised, uint tokensSold, address msgSender, uint decimals) public constant returns (uint) {
+
+    uint multiplier = 10 ** decimals;
+    uint lastTier = weiTiers.length - 1;
+    uint tier = getTierIndex(weiRaised);
+    uint tokens = 0;
+
+    while(tier < lastTier && weiRaised.plus(value) > weiTiers[tier].limitInWei) {
+      // The part of the purchase that still fits in this tier
+      uint part = uint(weiTiers[tier].limitInWei).minus(weiRaised);
+      tokens = tokens.plus(part.times(multiplier) / weiTiers[tier].priceInWei);
+      value = value.minus(part);
+      weiRaised = weiTiers[tier].limitInWei;
+      tier++;
+    }
+
+    return tokens.plus(value.times(multiplier) / weiTiers[tier].priceInWei);
+  }
+
+}
@@ -8,31 +8,101 @@ from web3 import Web3
 from web3.contract import Contract
 
 import uuid
+from typing import List
+
+from helpers.bulksend import PipelinedSender, summarize
+from helpers.investors import InvestorRow, read_investor_data, reconcile_vault, format_reconciliation, paginate_investor_rows, estimate_page_gas
 
 p = populus.Project()
 account = "0x"  # Our controller account on Kovan
 
-def import_investor_data(contract: Contract, deploy_address: str, fname: str):
+# How many addInvestor transactions we keep in flight at once.
+# Set to None to send and wait one transaction at a time.
+SEND_WINDOW = 64
+
+# Gas limit for a single addInvestor()
+ADD_INVESTOR_GAS = 200000
+
+# Gas limit for one page of addInvestors() when the vault supports batch loading
+PAGE_GAS = 4000000
+
+
+def import_investor_data(contract: Contract, deploy_address: str, fname: str, window: int=None, paged: bool=False):
     """Load investor data to a MultiVault contract.
 
     Mysterium specific data loader.
 
-    :return: List of unconfirmed transaction ids
+    Before sending anything the CSV is reconciled against the vault balances
+    read in JSON-RPC batches. Only missing rows are sent. If any row was loaded
+    with a different amount, nothing is sent and the diff is printed.
+
+    :param window: Use pipelined bulk sending with this many transactions in flight
+    :param paged: Load investors in gas bounded pages with addInvestors(). Vaults deployed before addInvestors() existed do not support this.
+    :return: List of SendResult in bulk mode, otherwise None
+    """
+
+    reconciliation = reconcile_vault(contract.web3, contract, read_investor_data(fname))
+    print("Reconciled {} against {}".format(fname, contract.address))
+    print(format_reconciliation(reconciliation))
+
+    if reconciliation.mismatched:
+        raise RuntimeError("Vault {} has investors loaded with different amounts than in {}".format(contract.address, fname))
+
+    if paged:
+        return import_investor_data_paged(contract, deploy_address, reconciliation.missing, window or 1)
+
+    if window:
+        return import_investor_data_bulk(contract, deploy_address, reconciliation.missing, window)
+
+    for row in reconciliation.missing:
+        contract.transact({"from": deploy_address}).addInvestor(row.address, row.amount)
+        #time.sleep(1)
+
+
+def import_investor_data_bulk(contract: Contract, deploy_address: str, rows: List[InvestorRow], window: int):
+    """Load investor rows to a MultiVault contract with a pipelined sender.
+
+    Nonces are assigned locally and ``window`` transactions are kept in flight.
+    Receipts are collected in JSON-RPC batches.
+
+    :return: List of SendResult, one per row
     """
 
-    assert fname.endswith(".csv")
+    def send_row(row, tx):
+        return contract.transact(tx).addInvestor(row.address, row.amount)
+
+    def report(result):
+        print("{} nonce:{} tx:{} {} gas:{} {}".format(result.key, result.nonce, result.txid, result.status, result.gas_used, result.error or ""))
+
+    # Bind row for the closure
+    jobs = [(row.address, lambda tx, row=row: send_row(row, tx)) for row in rows]
+
+    sender = PipelinedSender(contract.web3, deploy_address, window=window, gas=ADD_INVESTOR_GAS, on_result=report)
+    results = sender.run(jobs)
+    print("Loaded {}: {}".format(contract.address, summarize(results)))
+    return results
+
+
+def import_investor_data_paged(contract: Contract, deploy_address: str, rows: List[InvestorRow], window: int):
+    """Load investor rows with addInvestors() in gas bounded pages.
+
+    :return: List of SendResult, one per page. Result key is the CSV line number of the first row of the page.
+    """
+
+    def send_page(page, tx):
+        return contract.transact(tx).addInvestors([row.address for row in page], [row.amount for row in page])
+
+    def report(result):
+        print("Page from line {} nonce:{} tx:{} {} gas:{}".format(result.key, result.nonce, result.txid, result.status, result.gas_used))
+
+    jobs = []
+    for page in paginate_investor_rows(rows, max_gas=PAGE_GAS):
+        jobs.append((page[0].line, lambda tx, page=page: send_page(page, tx), estimate_page_gas(len(page))))
 
-    txs = []
-    with open(fname, "rt") as inp:
-        for line in inp:
-            address, amount = line.split(",")
-            address = address.strip()
-            amount = amount.strip()
-            assert address.startswith("0x")
-            amount = int(float(amount) * 1000000000)  # Use this precision. CHANGED
-            if contract.call().balances(address) == 0:
-                contract.transact({"from": deploy_address}).addInvestor(address, amount)
-            #time.sleep(1)
+    sender = PipelinedSender(contract.web3, deploy_address, window=window, on_result=report)
+    results = sender.run(jobs)
+    print("Loaded {}: {}".format(contract.address, summarize(results)))
+    return results
 
 
 with p.get_chain("mainnet") as chain:
@@ -42,6 +112,6 @@ with p.get_chain("mainnet") as chain:
     seed_participant_vault2 = Contract(address="0x1962A6183412360Ca64eD34c111efDabF08b909B")
     founders_vault = Contract(address="0x33222541eaE599124dF510D02f6e70DAdA1a9331")
 
-    import_investor_data(seed_participant_vault1, "0x6efD5665ab4B345A7eBE63c679b651f375DDdB7E", "seed_investor_data.csv")
-    import_investor_data(seed_participant_vault2, "0x6efD5665ab4B345A7eBE63c679b651f375DDdB7E", "seed_investor_data.csv")
-    import_investor_data(founders_vault, "0x6efD5665ab4B345A7eBE63c679b651f375DDdB7E", "founders_data.csv")
+    import_investor_data(seed_participant_vault1, "0x6efD5665ab4B345A7eBE63c679b651f375DDdB7E", "seed_investor_data.csv", window=SEND_WINDOW)
+    import_investor_data(seed_participant_vault2, "0x6efD5665ab4B345A7eBE63c679b651f375DDdB7E", "seed_investor_data.csv", window=SEND_WINDOW)
+    import_investor_data(founders_vault, "0x6efD5665ab4B345A7eBE63c679b651f375DDdB7E", "founders_data.csv", window=SEND_WINDOW)
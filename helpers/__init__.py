@@ -0,0 +1,5 @@
+"""Mysterium deployment and operations helpers.
+
+Run the scripts from the repository root with the repository in ``PYTHONPATH``,
+so that both ``ico`` and ``helpers`` packages are importable.
+"""
@@ -0,0 +1,312 @@
+"""Pipelined transaction sender with local nonce management.
+
+Sending transactions one by one and waiting each to be mined makes
+loading thousands of rows take one block time per row. Instead we
+
+- assign nonces locally, so the node does not need to be asked for each transaction
+
+- keep a window of transactions in flight
+
+- poll receipts of all in-flight transactions in one JSON-RPC batch
+
+- detect transactions that the node dropped from its pool and resend them with the same nonce
+
+- detect transactions whose nonce was consumed by some other transaction (replaced)
+
+Example::
+
+    sender = PipelinedSender(web3, deploy_address, window=64, gas=200000)
+    jobs = [(row.address, partial(send_add_investor, contract, row)) for row in rows]
+    for result in sender.run(jobs):
+        print(result.key, result.status)
+
+"""
+import logging
+import time
+from typing import Callable, Iterable, List, Optional
+
+from web3 import Web3
+
+from helpers.rpc import batch_request, get_receipts, is_testrpc, to_int
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Transaction was mined and did not throw
+STATUS_SUCCESS = "success"
+
+#: Transaction was mined, but it threw and consumed all gas
+STATUS_FAILED = "failed"
+
+#: Node dropped the transaction and we gave up resending it
+STATUS_DROPPED = "dropped"
+
+#: Another transaction with the same nonce got mined instead of ours
+STATUS_REPLACED = "replaced"
+
+#: Node refused to accept the transaction
+STATUS_ERROR = "error"
+
+#: Transaction did not get mined before the timeout
+STATUS_TIMEOUT = "timeout"
+
+
+#: Callable that takes a transaction dict with from, nonce, gas set and broadcasts it, returning the txid
+SendFunction = Callable[[dict], str]
+
+
+class SendResult:
+    """What happened to a single queued transaction."""
+
+    def __init__(self, key, nonce: Optional[int]=None):
+
+        #: Caller given identifier for the row, e.g. investor address
+        self.key = key
+
+        #: Nonce we assigned locally
+        self.nonce = nonce
+
+        #: Gas limit given for the transaction
+        self.gas = None
+
+        #: Hash of the last broadcasted version of the transaction
+        self.txid = None
+
+        #: One of STATUS_ constants, None while in flight
+        self.status = None
+
+        #: How much gas the mined transaction used
+        self.gas_used = None
+
+        #: Block number where the transaction was mined
+        self.block_number = None
+
+        #: How many times we had to broadcast the transaction
+        self.attempts = 0
+
+        #: Error message if the node refused the transaction
+        self.error = None
+
+        #: When the last broadcast happened (UNIX timestamp)
+        self.sent_at = None
+
+        #: When the first broadcast happened (UNIX timestamp)
+        self.first_sent_at = None
+
+    def __repr__(self):
+        return "<SendResult {} nonce:{} tx:{} status:{}>".format(self.key, self.nonce, self.txid, self.status)
+
+
+class PipelinedSender:
+    """Send many transactions from one account with a window of transactions in flight.
+
+    The sender must be the only party sending transactions from ``from_address`` while it runs.
+    """
+
+    def __init__(self,
+                 web3: Web3,
+                 from_address: str,
+                 window: int=64,
+                 gas: int=200000,
+                 gas_price: Optional[int]=None,
+                 receipt_batch_size: int=100,
+                 poll_interval: float=1.0,
+                 resend_after: float=120.0,
+                 max_attempts: int=3,
+                 timeout: float=3600.0,
+                 on_result: Optional[Callable[[SendResult], None]]=None):
+        """
+        :param window: How many unconfirmed transactions we keep in the node mempool at once
+        :param gas: Gas limit we give for each transaction. Setting it explicitly avoids an estimateGas round trip.
+        :param gas_price: Gas price in wei, or None for the node default
+        :param resend_after: Seconds after we check if an unmined transaction is still known by the node
+        :param max_attempts: How many times we broadcast a dropped transaction before giving up
+        :param timeout: Seconds we wait for a single transaction before marking it timed out
+        :param on_result: Called for each row when it reaches its final status
+        """
+        assert window > 0
+        self.web3 = web3
+        self.from_address = from_address
+        self.window = window
+        self.gas = gas
+        self.gas_price = gas_price
+        self.receipt_batch_size = receipt_batch_size
+        self.poll_interval = poll_interval
+        self.resend_after = resend_after
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.on_result = on_result
+        self.next_nonce = None
+
+        # testrpc refuses the nonce field, but it mines each transaction when sent,
+        # so its nonces come out in the order we assign them anyway
+        self.send_nonce = not is_testrpc(web3)
+
+    def sync_nonce(self):
+        """Read the next nonce from the node, counting pending transactions."""
+        self.next_nonce = self.web3.eth.getTransactionCount(self.from_address, "pending")
+
+    def get_confirmed_nonce(self) -> int:
+        """Next nonce according to the latest mined block."""
+        return self.web3.eth.getTransactionCount(self.from_address, "latest")
+
+    def build_transaction(self, nonce: int, gas: int) -> dict:
+        tx = {
+            "from": self.from_address,
+            "gas": gas,
+        }
+        if self.send_nonce:
+            tx["nonce"] = nonce
+        if self.gas_price:
+            tx["gasPrice"] = self.gas_price
+        return tx
+
+    def broadcast(self, result: SendResult, send: SendFunction):
+        """Send or resend a transaction with the nonce already assigned to the result."""
+        result.attempts += 1
+        result.sent_at = time.time()
+        if result.first_sent_at is None:
+            result.first_sent_at = result.sent_at
+        result.txid = send(self.build_transaction(result.nonce, result.gas))
+        logger.debug("Broadcasted %s nonce %d as %s", result.key, result.nonce, result.txid)
+
+    def finish(self, result: SendResult, status: str):
+        result.status = status
+        if self.on_result:
+            self.on_result(result)
+
+    def process_receipts(self, inflight: dict):
+        """Check all in-flight transactions for receipts in one batch.
+
+        :return: How many transactions got mined
+        """
+        by_txid = {result.txid: nonce for nonce, (result, send) in inflight.items()}
+        receipts = get_receipts(self.web3, by_txid.keys(), batch_size=self.receipt_batch_size)
+        mined = 0
+        for txid, receipt in receipts.items():
+            if not receipt:
+                continue
+            nonce = by_txid[txid]
+            result, send = inflight.pop(nonce)
+            result.gas_used = to_int(receipt["gasUsed"])
+            result.block_number = to_int(receipt["blockNumber"])
+
+            # Byzantium nodes tell the status directly,
+            # before that a throw consumes all given gas
+            if receipt.get("status") is not None:
+                success = to_int(receipt["status"]) == 1
+            else:
+                success = result.gas_used < result.gas
+
+            self.finish(result, STATUS_SUCCESS if success else STATUS_FAILED)
+            mined += 1
+        return mined
+
+    def process_stale(self, inflight: dict):
+        """Resend dropped transactions and detect replaced ones."""
+        now = time.time()
+        stale = [nonce for nonce, (result, send) in inflight.items() if now - result.sent_at > self.resend_after]
+        if not stale:
+            return
+
+        confirmed_nonce = self.get_confirmed_nonce()
+        known = batch_request(self.web3, [("eth_getTransactionByHash", [inflight[nonce][0].txid]) for nonce in stale], batch_size=self.receipt_batch_size)
+
+        for nonce, tx in zip(stale, known):
+            result, send = inflight[nonce]
+
+            if nonce < confirmed_nonce:
+                # The nonce was used, but our receipt poll did not see our hash mined:
+                # somebody else got a transaction with the same nonce in.
+                # Check the receipt once more, as the block may have arrived between the polls.
+                receipt = get_receipts(self.web3, [result.txid])[result.txid]
+                if receipt:
+                    continue
+                del inflight[nonce]
+                self.finish(result, STATUS_REPLACED)
+                continue
+
+            if now - result.first_sent_at > self.timeout:
+                del inflight[nonce]
+                self.finish(result, STATUS_TIMEOUT)
+                continue
+
+            if tx is None:
+                # Node forgot our transaction
+                if result.attempts >= self.max_attempts:
+                    del inflight[nonce]
+                    self.finish(result, STATUS_DROPPED)
+                    continue
+                logger.info("Transaction %s for %s was dropped, resending with nonce %d", result.txid, result.key, nonce)
+                try:
+                    self.broadcast(result, send)
+                except ValueError as e:
+                    del inflight[nonce]
+                    result.error = str(e)
+                    self.finish(result, STATUS_ERROR)
+            else:
+                # Still waiting in the mempool, do not check again too soon
+                result.sent_at = now
+
+    def run(self, jobs: Iterable[tuple]) -> List[SendResult]:
+        """Send all jobs and wait until each one has a final status.
+
+        :param jobs: Iterable of (key, send function) or (key, send function, gas limit) tuples.
+            Send function gets the transaction dict with nonce and must return txid.
+        :return: SendResult for each job in the job order
+        """
+
+        if self.next_nonce is None:
+            self.sync_nonce()
+
+        jobs = iter(jobs)
+        results = []
+        inflight = {}  # nonce -> (result, send function)
+        exhausted = False
+
+        while True:
+
+            # Fill the window
+            while not exhausted and len(inflight) < self.window:
+                try:
+                    job = next(jobs)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                key, send = job[0], job[1]
+                result = SendResult(key, self.next_nonce)
+                result.gas = job[2] if len(job) > 2 else self.gas
+                results.append(result)
+                try:
+                    self.broadcast(result, send)
+                except ValueError as e:
+                    # The node refused the transaction (bad params, insufficient funds),
+                    # so the nonce was not consumed and the next job can use it
+                    result.error = str(e)
+                    result.nonce = None
+                    self.finish(result, STATUS_ERROR)
+                    continue
+
+                inflight[result.nonce] = (result, send)
+                self.next_nonce += 1
+
+            if not inflight:
+                break
+
+            mined = self.process_receipts(inflight)
+            if inflight:
+                self.process_stale(inflight)
+            if not mined:
+                time.sleep(self.poll_interval)
+
+        return results
+
+
+def summarize(results: List[SendResult]) -> dict:
+    """Count results per status."""
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+    return counts
@@ -0,0 +1,220 @@
+"""On-disk image of a deployed test chain.
+
+Deploying the full crowdsale from a YAML definition takes the most of a test run.
+We store the tester chain state after the deployment and restore it on the
+following runs instead of replaying the deployment.
+
+The image is keyed by a hash of
+
+- the compiled contract bytecode
+
+- the YAML deployment definition
+
+- the accounts doing the deployment
+
+- the source code of the modules doing the deployment
+
+- the versions of the libraries that run the chain
+
+so that any change to a contract, to the YAML or to the deployer invalidates the image.
+Images are named after the YAML file and the key. Storing a new image for a
+deployment removes its images under the older keys.
+
+Only the in-process populus ``tester`` chain is supported.
+"""
+import glob
+import hashlib
+import inspect
+import logging
+import os
+import pickle
+from types import ModuleType
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import pkg_resources
+import rlp
+from ethereum import blocks
+from web3 import Web3
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Bump when the image format changes
+IMAGE_VERSION = 1
+
+#: Distributions whose version goes to the cache key, as they create and store the chain state
+LIBRARY_DISTRIBUTIONS = ("eth-testrpc", "ethereum", "populus", "rlp", "web3")
+
+
+class ChainCacheNotSupported(Exception):
+    """The chain is not an in-process pyethereum tester chain."""
+
+
+def get_tester_evm(web3: Web3):
+    """Get pyethereum tester state behind the web3 tester provider."""
+    rpc_methods = getattr(web3.currentProvider, "rpc_methods", None)
+    if rpc_methods is None:
+        raise ChainCacheNotSupported("Provider {} is not an in-process tester".format(web3.currentProvider))
+    return rpc_methods.client.evm
+
+
+def get_compiled_contracts(project) -> dict:
+    """Compiled contract data of a populus project."""
+    compiled = getattr(project, "compiled_contracts", None)
+    if compiled is None:
+        compiled = project.compiled_contract_data
+    return compiled
+
+
+def get_library_versions() -> Dict[str, str]:
+    """Installed versions of the chain libraries."""
+    versions = {}
+    for name in LIBRARY_DISTRIBUTIONS:
+        try:
+            versions[name] = pkg_resources.get_distribution(name).version
+        except pkg_resources.DistributionNotFound:
+            versions[name] = "not installed"
+    return versions
+
+
+def calculate_cache_key(project, yaml_filename: str, accounts: Iterable[str], deployer_modules: Iterable[ModuleType]=()) -> str:
+    """Hash everything that affects the deployed chain state.
+
+    :param deployer_modules: Python modules whose code does the deployment
+    """
+    digest = hashlib.sha256()
+    digest.update("version:{}".format(IMAGE_VERSION).encode("utf-8"))
+
+    compiled = get_compiled_contracts(project)
+    for name in sorted(compiled.keys()):
+        data = compiled[name]
+        digest.update(name.encode("utf-8"))
+        for field in ("bytecode", "bytecode_runtime"):
+            digest.update(str(data.get(field, "")).encode("utf-8"))
+
+    with open(yaml_filename, "rb") as inp:
+        digest.update(inp.read())
+
+    for account in accounts:
+        digest.update(account.lower().encode("utf-8"))
+
+    for module in deployer_modules:
+        digest.update(module.__name__.encode("utf-8"))
+        with open(inspect.getsourcefile(module), "rb") as inp:
+            digest.update(inp.read())
+
+    for name, version in sorted(get_library_versions().items()):
+        digest.update("{}=={}".format(name, version).encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+def get_image_filename(cache_dir: str, yaml_filename: str, key: str) -> str:
+    """Image file of a deployment definition under a cache key."""
+    name = os.path.splitext(os.path.basename(yaml_filename))[0]
+    return os.path.join(cache_dir, "{}-{}.pickle".format(name, key))
+
+
+def remove_stale_images(cache_dir: str, yaml_filename: str, key: str):
+    """Delete the images of a deployment definition stored under other keys."""
+    keep = get_image_filename(cache_dir, yaml_filename, key)
+    # Match the hex digest only, so that e.g. foo-bar.yml images are not taken for foo.yml images
+    for fname in glob.glob(get_image_filename(cache_dir, yaml_filename, "[0-9a-f]" * 64)):
+        if fname == keep:
+            continue
+        try:
+            os.unlink(fname)
+        except FileNotFoundError:
+            # Another test worker got it first
+            continue
+        logger.info("Removed stale deployment image %s", fname)
+
+
+def save_image(web3: Web3, fname: str, key: str, contracts: Dict[str, Tuple[str, str]]):
+    """Write the chain state to a file.
+
+    :param contracts: Deployed contracts as name -> (contract name, address)
+    """
+    evm = get_tester_evm(web3)
+    image = {
+        "version": IMAGE_VERSION,
+        "key": key,
+        "db": dict(evm.db.db),
+        "blocks": [rlp.encode(block) for block in evm.blocks],
+        "head": evm.snapshot(),
+        "contracts": contracts,
+    }
+
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    # Parallel test workers may store the same image at once
+    tmp = "{}.{}.tmp".format(fname, os.getpid())
+    with open(tmp, "wb") as out:
+        pickle.dump(image, out, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, fname)
+
+
+def load_image(web3: Web3, fname: str, key: str) -> Optional[Dict[str, Tuple[str, str]]]:
+    """Restore the chain state from a file.
+
+    :return: Contracts stored in the image, or None if there is no valid image for the key
+    """
+    if not os.path.exists(fname):
+        return None
+
+    with open(fname, "rb") as inp:
+        try:
+            image = pickle.load(inp)
+        except (pickle.UnpicklingError, EOFError) as e:
+            logger.warning("Discarding broken chain image %s: %s", fname, e)
+            return None
+
+    if image.get("version") != IMAGE_VERSION or image.get("key") != key:
+        return None
+
+    evm = get_tester_evm(web3)
+
+    # Put the trie nodes in place first, as decoding blocks reads the state
+    for k, v in image["db"].items():
+        evm.db.put(k, v)
+
+    evm.blocks = [rlp.decode(data, blocks.Block, env=evm.env) for data in image["blocks"]]
+    evm.revert(image["head"])
+    return image["contracts"]
+
+
+def deploy_cached(project, chain, yaml_filename: str, accounts: Iterable[str], contract_names: Dict[str, str], deploy: Callable[[], dict], cache_dir: str, deployer_modules: Iterable[ModuleType]=()) -> dict:
+    """Restore a deployment from the cache or deploy it and store it.
+
+    Must be called on a fresh chain, as restoring replaces the whole chain state.
+
+    :param contract_names: Deployment name -> Solidity contract name, as in the YAML ``contracts`` section
+    :param deploy: Function doing the actual deployment, returns name -> Contract
+    :param deployer_modules: Python modules whose code does the deployment, a change in them invalidates the image
+    :return: Deployed contracts name -> Contract
+    """
+    web3 = chain.web3
+    accounts = list(accounts)
+    key = calculate_cache_key(project, yaml_filename, accounts, deployer_modules)
+    fname = get_image_filename(cache_dir, yaml_filename, key)
+
+    try:
+        get_tester_evm(web3)
+    except ChainCacheNotSupported:
+        return deploy()
+
+    stored = load_image(web3, fname, key)
+    if stored is not None:
+        logger.info("Restored deployment from %s", fname)
+        return {
+            name: chain.provider.get_contract_factory(contract_name)(address=address)
+            for name, (contract_name, address) in stored.items()
+        }
+
+    contracts = deploy()
+    stored = {name: (contract_names[name], contract.address) for name, contract in contracts.items()}
+    save_image(web3, fname, key, stored)
+    remove_stale_images(cache_dir, yaml_filename, key)
+    logger.info("Stored deployment image %s", fname)
+    return contracts
+
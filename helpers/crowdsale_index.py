@@ -0,0 +1,325 @@
+"""Local SQLite index of crowdsale investments.
+
+Reading ``investedAmountOf`` and ``tokenAmountOf`` for every investor takes a call per address.
+The ``Invested``, ``Refund`` and ``EndsAtChanged`` events carry the same data, so we
+index them to SQLite once and answer the analytics questions with local queries::
+
+    index = CrowdsaleIndex(web3, crowdsale, "crowdsale.sqlite", start_block=3900000)
+    index.sync(confirmations=12)
+    for investor, wei, tokens, count in index.leaderboard(10):
+        print(investor, from_wei(wei, "ether"))
+
+The sync is incremental. The last indexed block and its hash are checkpointed
+in the same SQLite transaction as the events. When the checkpointed block is
+not on the chain anymore, the index is rolled back to the last block whose hash
+still matches and indexed again from there.
+
+Amounts are uint256 and do not fit SQLite integers. They are stored as zero padded
+decimal text, which keeps ordering and comparisons right, and summed with the
+``uint_sum`` aggregate registered on the connection.
+"""
+import logging
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import click
+from eth_utils import from_wei
+from populus import Project
+from web3 import Web3
+from web3.contract import Contract
+
+from helpers.events import EventDecoder, fetch_logs
+from helpers.rpc import batch_request, to_int
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Events we index
+EVENTS = ("Invested", "Refund", "EndsAtChanged")
+
+#: uint256 has at most this many decimal digits
+UINT_DIGITS = 78
+
+#: How many stored blocks we compare against the chain when looking for the fork point
+REORG_WINDOW = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    contract TEXT PRIMARY KEY,
+    block_number INTEGER NOT NULL,
+    block_hash TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS blocks (
+    contract TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    PRIMARY KEY (contract, number)
+);
+
+CREATE TABLE IF NOT EXISTS invested (
+    contract TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    transaction_hash TEXT NOT NULL,
+    investor TEXT NOT NULL,
+    wei_amount TEXT NOT NULL,
+    token_amount TEXT NOT NULL,
+    customer_id TEXT NOT NULL,
+    PRIMARY KEY (contract, block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS invested_investor ON invested (contract, investor);
+CREATE INDEX IF NOT EXISTS invested_customer ON invested (contract, customer_id);
+
+CREATE TABLE IF NOT EXISTS refunds (
+    contract TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    transaction_hash TEXT NOT NULL,
+    investor TEXT NOT NULL,
+    wei_amount TEXT NOT NULL,
+    PRIMARY KEY (contract, block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS refunds_investor ON refunds (contract, investor);
+
+CREATE TABLE IF NOT EXISTS ends_at_changes (
+    contract TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    transaction_hash TEXT NOT NULL,
+    ends_at INTEGER NOT NULL,
+    PRIMARY KEY (contract, block_number, log_index)
+);
+"""
+
+#: Tables rolled back on a reorg, and their block number column
+ROLLBACK_TABLES = (("invested", "block_number"), ("refunds", "block_number"), ("ends_at_changes", "block_number"), ("blocks", "number"))
+
+
+def to_uint_text(value: int) -> str:
+    return "{:0{}d}".format(value, UINT_DIGITS)
+
+
+def from_uint_text(value: Optional[str]) -> int:
+    """Read uint text, aggregates over no rows give NULL."""
+    return int(value) if value else 0
+
+
+class UintSum:
+    """SQLite aggregate summing uint_text values."""
+
+    def __init__(self):
+        self.total = 0
+
+    def step(self, value):
+        self.total += int(value)
+
+    def finalize(self):
+        return to_uint_text(self.total)
+
+
+def open_index(fname: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(fname)
+    conn.executescript(SCHEMA)
+    conn.create_aggregate("uint_sum", 1, UintSum)
+    return conn
+
+
+def get_block_headers(web3: Web3, numbers: List[int]) -> Dict[int, dict]:
+    """Fetch block headers without transactions in one batch."""
+    blocks = batch_request(web3, [("eth_getBlockByNumber", [hex(number), False]) for number in numbers])
+    return dict(zip(numbers, blocks))
+
+
+class CrowdsaleIndex:
+    """Crowdsale events of one contract in a SQLite database."""
+
+    def __init__(self, web3: Web3, crowdsale: Contract, fname: str, start_block: int=0):
+        """
+        :param crowdsale: Contract with the Crowdsale ABI
+        :param fname: SQLite database, shared by any number of contracts
+        :param start_block: Where to start indexing, e.g. the crowdsale deployment block
+        """
+        self.web3 = web3
+        self.address = crowdsale.address.lower()
+        self.decoder = EventDecoder(crowdsale.abi, EVENTS)
+        self.start_block = start_block
+        self.conn = open_index(fname)
+
+    def get_checkpoint(self) -> Optional[Tuple[int, str]]:
+        """Last indexed block number and hash."""
+        return self.conn.execute("SELECT block_number, block_hash FROM checkpoints WHERE contract = ?", (self.address,)).fetchone()
+
+    def find_fork_point(self) -> Optional[int]:
+        """Check the checkpoint against the chain.
+
+        :return: Last indexed block that is still on the chain, None if there is no checkpoint
+        """
+        checkpoint = self.get_checkpoint()
+        if not checkpoint:
+            return None
+
+        stored = self.conn.execute("SELECT number, hash FROM blocks WHERE contract = ? AND number <= ? ORDER BY number DESC LIMIT ?", (self.address, checkpoint[0], REORG_WINDOW)).fetchall()
+        headers = get_block_headers(self.web3, [number for number, block_hash in stored])
+        for number, block_hash in stored:
+            header = headers[number]
+            if header and header["hash"] == block_hash:
+                return number
+
+        logger.warning("No indexed block of %s within %d blocks is on the chain anymore, indexing from the start", self.address, REORG_WINDOW)
+        return self.start_block - 1
+
+    def rollback(self, block_number: int):
+        """Forget everything after a block."""
+        with self.conn:
+            for table, column in ROLLBACK_TABLES:
+                self.conn.execute("DELETE FROM {} WHERE contract = ? AND {} > ?".format(table, column), (self.address, block_number))
+            row = self.conn.execute("SELECT hash FROM blocks WHERE contract = ? AND number = ?", (self.address, block_number)).fetchone()
+            if row:
+                self.conn.execute("UPDATE checkpoints SET block_number = ?, block_hash = ? WHERE contract = ?", (block_number, row[0], self.address))
+            else:
+                self.conn.execute("DELETE FROM checkpoints WHERE contract = ?", (self.address,))
+
+    def store_chunk(self, end: int, events: List[dict], headers: Dict[int, dict]):
+        """Write a chunk of events and move the checkpoint in one transaction."""
+        with self.conn:
+            for event in events:
+                args = event["args"]
+                position = (self.address, event["block_number"], event["log_index"], event["transaction_hash"])
+                if event["event"] == "Invested":
+                    self.conn.execute("INSERT OR REPLACE INTO invested VALUES (?, ?, ?, ?, ?, ?, ?, ?)", position + (args["investor"].lower(), to_uint_text(args["weiAmount"]), to_uint_text(args["tokenAmount"]), str(args["customerId"])))
+                elif event["event"] == "Refund":
+                    self.conn.execute("INSERT OR REPLACE INTO refunds VALUES (?, ?, ?, ?, ?, ?)", position + (args["investor"].lower(), to_uint_text(args["weiAmount"])))
+                else:
+                    self.conn.execute("INSERT OR REPLACE INTO ends_at_changes VALUES (?, ?, ?, ?, ?)", position + (args["endsAt"],))
+
+            for number, header in headers.items():
+                self.conn.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)", (self.address, number, header["hash"], to_int(header["timestamp"])))
+
+            self.conn.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?)", (self.address, end, headers[end]["hash"]))
+
+    def sync(self, to_block: Optional[int]=None, confirmations: int=0) -> int:
+        """Index new events.
+
+        :param to_block: Index up to this block, by default the latest block minus confirmations
+        :param confirmations: Leave this many latest blocks out, as they are the most likely to be reorganised
+        :return: Number of new events
+        """
+        if to_block is None:
+            to_block = self.web3.eth.blockNumber - confirmations
+
+        fork_point = self.find_fork_point()
+        if fork_point is None:
+            start = self.start_block
+        else:
+            if fork_point < self.get_checkpoint()[0]:
+                logger.warning("Chain reorganisation, rolling %s back to block %d", self.address, fork_point)
+                self.rollback(fork_point)
+            start = fork_point + 1
+
+        count = 0
+        for chunk_start, chunk_end, logs in fetch_logs(self.web3, self.address, self.decoder.topics, start, to_block):
+            events = self.decoder.decode_all(logs)
+
+            # Block times for the time series, and the chunk end hash for the checkpoint
+            numbers = sorted({event["block_number"] for event in events} | {chunk_end})
+            headers = get_block_headers(self.web3, numbers)
+
+            if any(headers[event["block_number"]]["hash"] != event["block_hash"] for event in events):
+                logger.warning("Chain reorganised while indexing %d-%d, stopping at the last consistent block", chunk_start, chunk_end)
+                break
+
+            self.store_chunk(chunk_end, events, headers)
+            count += len(events)
+            logger.info("Indexed %s blocks %d-%d, %d events", self.address, chunk_start, chunk_end, len(events))
+
+        return count
+
+    def get_totals(self) -> dict:
+        """Totals as the contract counts them."""
+        wei_raised, tokens_sold, investor_count = self.conn.execute("SELECT uint_sum(wei_amount), uint_sum(token_amount), COUNT(DISTINCT investor) FROM invested WHERE contract = ?", (self.address,)).fetchone()
+        wei_refunded, = self.conn.execute("SELECT uint_sum(wei_amount) FROM refunds WHERE contract = ?", (self.address,)).fetchone()
+        return {
+            "wei_raised": from_uint_text(wei_raised),
+            "tokens_sold": from_uint_text(tokens_sold),
+            "investor_count": investor_count,
+            "wei_refunded": from_uint_text(wei_refunded),
+        }
+
+    def get_investor(self, investor: str) -> Tuple[int, int]:
+        """investedAmountOf() and tokenAmountOf() of an investor. A refund zeroes the invested amount."""
+        wei, tokens = self.conn.execute("SELECT uint_sum(wei_amount), uint_sum(token_amount) FROM invested WHERE contract = ? AND investor = ?", (self.address, investor.lower())).fetchone()
+        refunded, = self.conn.execute("SELECT uint_sum(wei_amount) FROM refunds WHERE contract = ? AND investor = ?", (self.address, investor.lower())).fetchone()
+        return from_uint_text(wei) - from_uint_text(refunded), from_uint_text(tokens)
+
+    def leaderboard(self, limit: int=10) -> List[Tuple[str, int, int, int]]:
+        """Biggest investors.
+
+        :return: List of (investor, wei invested, tokens bought, investment count)
+        """
+        rows = self.conn.execute("""
+            SELECT investor, uint_sum(wei_amount) AS wei, uint_sum(token_amount), COUNT(*)
+            FROM invested WHERE contract = ?
+            GROUP BY investor ORDER BY wei DESC, investor LIMIT ?""", (self.address, limit))
+        return [(investor, int(wei), int(tokens), count) for investor, wei, tokens, count in rows]
+
+    def get_customer_totals(self) -> Dict[int, Tuple[int, int, int]]:
+        """Investments per customer id, 0 for investments without one.
+
+        :return: Map customer id -> (wei invested, tokens bought, investment count)
+        """
+        rows = self.conn.execute("""
+            SELECT customer_id, uint_sum(wei_amount), uint_sum(token_amount), COUNT(*)
+            FROM invested WHERE contract = ? GROUP BY customer_id""", (self.address,))
+        return {int(customer_id): (int(wei), int(tokens), count) for customer_id, wei, tokens, count in rows}
+
+    def get_wei_raised_series(self) -> List[Tuple[int, int, int]]:
+        """weiRaised after each block with investments.
+
+        :return: List of (block number, block timestamp, wei raised)
+        """
+        rows = self.conn.execute("""
+            SELECT invested.block_number, blocks.timestamp, uint_sum(invested.wei_amount)
+            FROM invested JOIN blocks ON blocks.contract = invested.contract AND blocks.number = invested.block_number
+            WHERE invested.contract = ?
+            GROUP BY invested.block_number ORDER BY invested.block_number""", (self.address,))
+
+        series = []
+        total = 0
+        for block_number, timestamp, wei in rows:
+            total += int(wei)
+            series.append((block_number, timestamp, total))
+        return series
+
+    def get_ends_at(self) -> Optional[int]:
+        """The last endsAt set with setEndsAt(), None if it has not been changed."""
+        row = self.conn.execute("SELECT ends_at FROM ends_at_changes WHERE contract = ? ORDER BY block_number DESC, log_index DESC LIMIT 1", (self.address,)).fetchone()
+        return row[0] if row else None
+
+
+@click.command()
+@click.option('--chain', nargs=1, default="mainnet", help='On which chain the crowdsale is - see populus.json')
+@click.option('--address', nargs=1, help='Crowdsale contract address', required=True)
+@click.option('--db', nargs=1, help='SQLite database file', default="crowdsale-index.sqlite")
+@click.option('--start-block', nargs=1, type=int, help='Block where the crowdsale was deployed', default=0)
+@click.option('--confirmations', nargs=1, type=int, help='Do not index the latest blocks', default=12)
+def main(chain, address, db, start_block, confirmations):
+    """Update the crowdsale index and print the summary."""
+
+    logging.basicConfig(level=logging.INFO)
+    project = Project()
+    with project.get_chain(chain) as c:
+        crowdsale = c.provider.get_base_contract_factory("MysteriumCrowdsale")(address=address)
+        index = CrowdsaleIndex(c.web3, crowdsale, db, start_block)
+        print("New events", index.sync(confirmations=confirmations))
+
+    totals = index.get_totals()
+    print("Raised {} ETH from {} investors, {} tokens sold".format(from_wei(totals["wei_raised"], "ether"), totals["investor_count"], totals["tokens_sold"]))
+    for investor, wei, tokens, count in index.leaderboard(20):
+        print("{} {} ETH in {} investments".format(investor, from_wei(wei, "ether"), count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Crowdsale status for monitoring, read once per block.
+
+Dashboards poll the same handful of crowdsale values every few seconds.
+:py:class:`CrowdsaleStateCache` reads all of them in one batch of ``eth_call``
+pinned to a block, and keeps the result for that block. Readers asking at the
+same time share the fetch in flight, so the node sees one batch per block
+however many readers there are::
+
+    cache = CrowdsaleStateCache(web3, crowdsale, pricing)
+    state = cache.get()
+    print(state.block_number, state.wei_raised, state.state)
+
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Optional
+
+from web3 import Web3
+from web3.contract import Contract
+
+from ico.state import CrowdsaleState
+
+from helpers.rpc import multi_call
+
+
+#: Crowdsale functions read, in the order of the CrowdsaleSnapshot fields
+CROWDSALE_FUNCTIONS = (
+    ("state", "getState"),
+    ("wei_raised", "weiRaised"),
+    ("tokens_sold", "tokensSold"),
+    ("ends_at", "endsAt"),
+    ("soft_cap_reached", "isSoftCapReached"),
+    ("soft_cap_triggered", "softCapTriggered"),
+    ("crowdsale_full", "isCrowdsaleFull"),
+    ("minimum_funding_goal", "getMinimumFundingGoal"),
+)
+
+#: Pricing functions read
+PRICING_FUNCTIONS = (
+    ("chf_rate", "chfRate"),
+)
+
+#: How many blocks are kept
+DEFAULT_CACHE_SIZE = 16
+
+#: Seconds the latest block number is trusted, so readers do not ask for it on every get()
+DEFAULT_BLOCK_TTL = 1.0
+
+
+class CrowdsaleSnapshot:
+    """Crowdsale values at one block."""
+
+    def __init__(self, block_number: int, values: dict):
+        self.block_number = block_number
+        self.state = CrowdsaleState(values["state"])
+        self.wei_raised = values["wei_raised"]
+        self.tokens_sold = values["tokens_sold"]
+        self.ends_at = values["ends_at"]
+        self.soft_cap_reached = values["soft_cap_reached"]
+        self.soft_cap_triggered = values["soft_cap_triggered"]
+        self.crowdsale_full = values["crowdsale_full"]
+        self.minimum_funding_goal = values["minimum_funding_goal"]
+        self.chf_rate = values["chf_rate"]
+
+    def as_dict(self) -> dict:
+        """JSON friendly values for dashboards."""
+        data = {name: getattr(self, name) for name, fn_name in CROWDSALE_FUNCTIONS + PRICING_FUNCTIONS}
+        data["state"] = self.state.name
+        data["block_number"] = self.block_number
+        return data
+
+    def __repr__(self):
+        return "<CrowdsaleSnapshot block:{} state:{} weiRaised:{}>".format(self.block_number, self.state.name, self.wei_raised)
+
+
+def read_crowdsale_state(web3: Web3, crowdsale: Contract, pricing: Contract, block_number: int) -> CrowdsaleSnapshot:
+    """Read all values in one batch pinned to a block."""
+    calls = [(crowdsale, fn_name, []) for name, fn_name in CROWDSALE_FUNCTIONS]
+    calls += [(pricing, fn_name, []) for name, fn_name in PRICING_FUNCTIONS]
+    names = [name for name, fn_name in CROWDSALE_FUNCTIONS + PRICING_FUNCTIONS]
+    values = multi_call(web3, calls, block_identifier=block_number)
+    return CrowdsaleSnapshot(block_number, dict(zip(names, values)))
+
+
+class CrowdsaleStateCache:
+    """Crowdsale snapshots cached per block, safe to share between threads."""
+
+    def __init__(self, web3: Web3, crowdsale: Contract, pricing: Contract, cache_size: int=DEFAULT_CACHE_SIZE, block_ttl: float=DEFAULT_BLOCK_TTL):
+        self.web3 = web3
+        self.crowdsale = crowdsale
+        self.pricing = pricing
+        self.cache_size = cache_size
+        self.block_ttl = block_ttl
+
+        self.lock = threading.Lock()
+
+        #: block number -> Future of CrowdsaleSnapshot, oldest first
+        self.snapshots = OrderedDict()
+
+        self.latest_block = None
+        self.latest_checked_at = 0
+
+        #: How many batches we have sent
+        self.fetches = 0
+
+    def get_latest_block(self) -> int:
+        """The latest block number, asked from the node at most once per block_ttl."""
+        with self.lock:
+            if self.latest_block is not None and time.time() - self.latest_checked_at < self.block_ttl:
+                return self.latest_block
+
+        block_number = self.web3.eth.blockNumber
+        with self.lock:
+            self.latest_block = block_number
+            self.latest_checked_at = time.time()
+        return block_number
+
+    def get(self, block_number: Optional[int]=None) -> CrowdsaleSnapshot:
+        """Crowdsale values at a block, by default the latest.
+
+        The first reader of a block fetches it. Readers arriving during the fetch wait for the same result.
+        """
+        if block_number is None:
+            block_number = self.get_latest_block()
+
+        with self.lock:
+            future = self.snapshots.get(block_number)
+            owner = future is None
+            if owner:
+                future = self.snapshots[block_number] = Future()
+                self.fetches += 1
+                while len(self.snapshots) > self.cache_size:
+                    self.snapshots.popitem(last=False)
+
+        if owner:
+            try:
+                future.set_result(read_crowdsale_state(self.web3, self.crowdsale, self.pricing, block_number))
+            except Exception as e:
+                # Do not cache failures, the next reader tries again
+                with self.lock:
+                    if self.snapshots.get(block_number) is future:
+                        del self.snapshots[block_number]
+                future.set_exception(e)
+
+        return future.result()
@@ -0,0 +1,702 @@
+"""Deploy a crowdsale YAML definition in dependency waves.
+
+The ico deployer sends one transaction at a time and waits for each to confirm.
+Here we build a dependency graph of the deployment instead
+
+- a contract depends on the contracts its arguments refer to with ``{{ contracts.X.address }}``
+
+- a ``confirm_tx()`` or ``confirm_multiple_txs()`` post action depends on the deployments of the contracts it mentions
+
+- post actions mentioning the same contract keep their order. From the same sender they can share a wave,
+  as the locally assigned nonces order them. Otherwise the later one waits for the next wave.
+
+- any other post action statement is a barrier that runs alone, after everything before it
+
+Every wave is sent at once with locally assigned nonces and confirmed together,
+so the rollout takes as many confirmations as the graph is deep. A transaction whose
+gas cannot be estimated before an earlier one of its wave is mined follows in a second round::
+
+    python -m helpers.deploy_dag --chain kovan --address 0x... --deployment-file crowdsales/mysterium-kovan.yml --deployment-name kovan
+
+With ``--incremental`` the deployment report of an earlier run is compared against
+the definition and the chain. Contracts whose compiled code, constructor arguments and
+on-chain code have not changed are reused, and only the post actions whose inputs changed are run again.
+
+"""
+import ast
+import datetime
+import hashlib
+import logging
+import os
+import re
+import textwrap
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import click
+import ruamel.yaml
+from eth_utils import to_wei, from_wei
+from populus import Project
+from populus.utils.accounts import is_account_locked
+from populus.utils.cli import request_account_unlock
+from toposort import toposort_flatten
+from web3 import Web3
+from web3.contract import Contract
+
+from ico.definition import load_crowdsale_definitions, get_jinja_context, interpolate_data, load_investor_data
+from ico.state import CrowdsaleState
+
+from helpers.bulksend import PipelinedSender, SendResult, STATUS_SUCCESS
+from helpers.receipts import ReceiptWaiter
+from helpers.rpc import batch_request, get_receipts, serialize_requests, to_int
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Finds contracts.X.address style references in the YAML arguments
+CONTRACT_REFERENCE = re.compile(r"contracts\.(\w+)\.")
+
+#: Finds unlinked library placeholders in solc bytecode
+LIBRARY_PLACEHOLDER = re.compile(r"__(?:[^_:]+:)?(\w+?)_{2,}")
+
+#: Extra gas given on top of the estimate
+GAS_MARGIN = 1.2
+
+#: Gas for a transaction whose estimation still fails when nothing it could depend on is in flight
+DEFAULT_GAS = 500000
+
+#: Post action functions that create transactions, and the position of their sender argument
+TX_GENERATORS = {"load_investor_data": 1}
+
+#: Top level definition sections that are not copied to the runtime data
+ACTION_SECTIONS = ("contracts", "post_actions", "verify_actions")
+
+
+class DeploymentFailed(Exception):
+    """Some transactions of a wave did not go through."""
+
+    def __init__(self, msg: str, results: List[SendResult]):
+        super(DeploymentFailed, self).__init__(msg)
+        self.results = results
+
+
+class Step:
+    """A deployment, a post action transaction group or a barrier statement in the graph."""
+
+    def __init__(self, key: str, kind: str, order: int, refs: set, sender: Optional[str]=None, name: Optional[str]=None, node: Optional[ast.AST]=None, source: Optional[str]=None):
+        self.key = key
+
+        #: "deploy", "tx" or "barrier"
+        self.kind = kind
+
+        #: Position in the YAML, also the nonce order inside a wave
+        self.order = order
+
+        #: Contract names the step mentions
+        self.refs = refs
+
+        #: Account sending the step transactions, None if not known before running
+        self.sender = sender
+
+        #: Contract name for deploy steps
+        self.name = name
+
+        #: Expression producing the transaction(s) for tx steps
+        self.node = node
+
+        #: Python source for barrier steps
+        self.source = source
+
+        #: Identifies the post action in deployment reports, see :py:func:`get_action_digest`
+        self.digest = None
+
+        #: Steps that must be confirmed before this one is sent
+        self.requires = set()
+
+        #: Steps that must be sent before this one, in the same wave or earlier
+        self.after = set()
+
+        self.wave = None
+
+    def __repr__(self):
+        return "<Step {} wave:{}>".format(self.key, self.wave)
+
+
+class Plan:
+    """Deployment steps grouped to waves."""
+
+    def __init__(self, steps: List[Step]):
+        self.steps = steps
+        by_key = {step.key: step for step in steps}
+
+        graph = {step.key: step.requires | step.after for step in steps}
+        for key in toposort_flatten(graph, sort=True):
+            step = by_key[key]
+            waves = [by_key[dep].wave + 1 for dep in step.requires] + [by_key[dep].wave for dep in step.after]
+            step.wave = max(waves, default=0)
+
+        count = max((step.wave for step in steps), default=-1) + 1
+        self.waves = [sorted([step for step in steps if step.wave == i], key=lambda s: s.order) for i in range(count)]
+
+    @property
+    def depth(self) -> int:
+        return len(self.waves)
+
+    def without(self, keys: set) -> "Plan":
+        """A new plan with the given steps left out.
+
+        Steps depending on a left out step inherit its dependencies, so the ordering stays.
+        """
+        inherited = {}
+        steps = []
+        for step in sorted(self.steps, key=lambda s: (s.wave, s.order)):
+            requires = set()
+            after = set()
+            for dep in step.requires:
+                requires |= inherited[dep][0] | inherited[dep][1] if dep in inherited else {dep}
+            for dep in step.after:
+                after |= inherited[dep][1] if dep in inherited else {dep}
+                requires |= inherited[dep][0] if dep in inherited else set()
+
+            if step.key in keys:
+                inherited[step.key] = (requires, after)
+            else:
+                step.requires = requires
+                step.after = after - requires
+                steps.append(step)
+
+        return Plan(sorted(steps, key=lambda s: s.order))
+
+
+def is_call_to(stmt: ast.stmt, fn_name: str) -> bool:
+    return isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call) and isinstance(stmt.value.func, ast.Name) and stmt.value.func.id == fn_name
+
+
+def evaluate(node: ast.AST, context: dict):
+    """Evaluate a post action expression. Starred expressions give a list."""
+    if isinstance(node, ast.Starred):
+        return list(evaluate(node.value, context))
+    expr = ast.fix_missing_locations(ast.Expression(body=node))
+    return eval(compile(expr, "<post_actions>", "eval"), context)
+
+
+def find_sender(node: ast.AST, context: dict) -> Optional[str]:
+    """Find the from address of the transactions an expression creates, without evaluating the transactions."""
+    for child in ast.walk(node):
+        if not isinstance(child, ast.Call):
+            continue
+        try:
+            if isinstance(child.func, ast.Attribute) and child.func.attr == "transact" and child.args:
+                return evaluate(child.args[0], context).get("from")
+            if isinstance(child.func, ast.Name) and child.func.id in TX_GENERATORS:
+                return evaluate(child.args[TX_GENERATORS[child.func.id]], context)
+        except Exception:
+            # Refers to something that exists only after the deployment
+            return None
+    return None
+
+
+def split_statements(source: str) -> List[Tuple[ast.stmt, str]]:
+    """Parse post actions to statements and their source lines."""
+    source = textwrap.dedent(source)
+    lines = source.splitlines()
+    tree = ast.parse(source)
+    result = []
+    for idx, stmt in enumerate(tree.body):
+        end = tree.body[idx + 1].lineno - 1 if idx + 1 < len(tree.body) else len(lines)
+        result.append((stmt, "\n".join(lines[stmt.lineno - 1:end])))
+    return result
+
+
+def get_action_digest(deploy_address: str, code: str) -> str:
+    """Identify a post action by its code and deploy address."""
+    return hashlib.sha256("{}\n{}".format(deploy_address.lower(), code).encode("utf-8")).hexdigest()
+
+
+def build_plan(chain_data: dict, deploy_address: str) -> Plan:
+    """Build the dependency graph of contract deployments and post actions.
+
+    Nothing is sent, so this can be used to inspect a deployment offline.
+    """
+    contract_defs = chain_data["contracts"]
+    names = set(contract_defs.keys())
+    pinned = {name for name, contract_def in contract_defs.items() if contract_def.get("address")}
+    scalar_context = get_static_context(chain_data, deploy_address)
+
+    steps = []
+    deploys = {}
+    for name, contract_def in contract_defs.items():
+        if name in pinned:
+            continue
+        refs = set(CONTRACT_REFERENCE.findall(str(dict(contract_def.get("arguments") or {}))))
+        unknown = refs - names
+        if unknown:
+            raise ValueError("Contract {} refers to unknown contracts {}".format(name, unknown))
+        step = Step("deploy:" + name, "deploy", len(steps), refs, sender=deploy_address, name=name)
+        deploys[name] = step
+        steps.append(step)
+
+    for step in deploys.values():
+        step.requires = {deploys[ref].key for ref in step.refs if ref in deploys}
+
+    barrier = None
+    actions = []
+    for stmt, source in split_statements(chain_data.get("post_actions") or ""):
+
+        if is_call_to(stmt, "confirm_tx") and len(stmt.value.args) == 1:
+            groups = stmt.value.args
+        elif is_call_to(stmt, "confirm_multiple_txs") and not stmt.value.keywords:
+            groups = stmt.value.args
+        else:
+            refs = {child.id for child in ast.walk(stmt) if isinstance(child, ast.Name) and child.id in names}
+            step = Step("barrier:{}".format(len(steps)), "barrier", len(steps), refs, source=source)
+            step.digest = get_action_digest(deploy_address, textwrap.dedent(source).strip())
+            step.requires = {s.key for s in steps}
+            steps.append(step)
+            barrier = step
+            continue
+
+        for node in groups:
+            refs = {child.id for child in ast.walk(node) if isinstance(child, ast.Name) and child.id in names}
+            step = Step("tx:{}".format(len(steps)), "tx", len(steps), refs, sender=find_sender(node, scalar_context), node=node)
+            step.digest = get_action_digest(deploy_address, ast.dump(node))
+            step.requires = {deploys[ref].key for ref in refs if ref in deploys}
+            if barrier:
+                step.requires.add(barrier.key)
+
+            for earlier in actions:
+                if earlier.refs & refs:
+                    if earlier.sender and earlier.sender == step.sender:
+                        step.after.add(earlier.key)
+                    else:
+                        step.requires.add(earlier.key)
+
+            actions.append(step)
+            steps.append(step)
+
+    return Plan(steps)
+
+
+class PlannedCall:
+    """A contract transaction recorded by a post action, sent later with our nonce."""
+
+    def __init__(self, contract: Contract, transaction: dict, fn_name: str, args: tuple, kwargs: dict):
+        self.contract = contract
+        self.transaction = transaction
+        self.fn_name = fn_name
+        self.args = args
+        self.kwargs = kwargs
+
+    def send(self, tx: dict) -> str:
+        transaction = dict(self.transaction)
+        transaction.update(tx)
+        return getattr(self.contract.transact(transaction), self.fn_name)(*self.args, **self.kwargs)
+
+    def estimate_gas(self) -> int:
+        return getattr(self.contract.estimateGas(self.transaction), self.fn_name)(*self.args, **self.kwargs)
+
+    def __repr__(self):
+        return "<PlannedCall {}.{}{}>".format(self.contract.address, self.fn_name, self.args)
+
+
+class _RecordingFunctions:
+
+    def __init__(self, contract: Contract, transaction: dict):
+        self.contract = contract
+        self.transaction = transaction
+
+    def __getattr__(self, fn_name: str):
+        return lambda *args, **kwargs: PlannedCall(self.contract, self.transaction, fn_name, args, kwargs)
+
+
+class RecordingContract:
+    """Contract stand-in for post actions. transact() records the call instead of sending it."""
+
+    def __init__(self, contract: Contract):
+        self.contract = contract
+
+    def transact(self, transaction: Optional[dict]=None):
+        return _RecordingFunctions(self.contract, dict(transaction or {}))
+
+    def __getattr__(self, name):
+        return getattr(self.contract, name)
+
+
+def get_static_context(chain_data: dict, deploy_address: str) -> dict:
+    """Post action variables that do not depend on the deployment."""
+    context = {key: value for key, value in chain_data.items() if key not in ACTION_SECTIONS}
+    context.update({
+        "deploy_address": deploy_address,
+        "datetime": datetime.datetime,
+        "time": time.time,
+        "to_wei": to_wei,
+        "from_wei": from_wei,
+        "CrowdsaleState": CrowdsaleState,
+        "load_investor_data": load_investor_data,
+    })
+    return context
+
+
+def get_action_context(web3: Web3, runtime_data: dict, contracts: Dict[str, Contract], recording: bool, waiter: ReceiptWaiter) -> dict:
+    """Post action and verify action variables.
+
+    :param recording: Give contracts that record transactions instead of sending them
+    :param waiter: Receipt poller shared by all statements of the deployment
+    """
+    context = get_static_context(runtime_data, runtime_data["deploy_address"])
+    context["web3"] = web3
+
+    # Like ico's check_succesful_tx, but all transactions of a statement are confirmed with one receipt batch per block
+    context["confirm_tx"] = lambda txid: waiter.wait([txid])[0]
+    context["confirm_multiple_txs"] = lambda *txids: waiter.wait(txids)
+    for name, contract in contracts.items():
+        context[name] = RecordingContract(contract) if recording else contract
+    return context
+
+
+def get_libraries(chain, contract_name: str) -> List[str]:
+    """Libraries a contract must be linked with."""
+    bytecode = chain.provider.get_base_contract_factory(contract_name).bytecode or ""
+    return sorted(set(LIBRARY_PLACEHOLDER.findall(bytecode)))
+
+
+def link_bytecode(bytecode: str, libraries: Dict[str, str]) -> str:
+    """Fill library placeholders with addresses.
+
+    :raise KeyError: If a library is not in ``libraries``
+    """
+    return LIBRARY_PLACEHOLDER.sub(lambda m: libraries[m.group(1)].lower().replace("0x", ""), bytecode)
+
+
+def get_constructor_args(factory, kwargs: dict) -> str:
+    """ABI encoded constructor arguments as recorded in deployment reports."""
+    data = factory._encode_constructor_data(kwargs=kwargs)
+    return "0x" + data[len(factory.bytecode):].replace("0x", "")
+
+
+def estimate_gas(web3: Web3, estimate) -> Optional[int]:
+    """Estimate with margin, or None if the estimation throws."""
+    limit = web3.eth.getBlock("latest")["gasLimit"]
+    try:
+        return min(limit, int(estimate() * GAS_MARGIN))
+    except Exception as e:
+        logger.debug("Gas estimation failed: %s", e)
+        return None
+
+
+def send_wave(web3: Web3, jobs: Dict[str, list]) -> List[SendResult]:
+    """Send the jobs of all senders at once and wait until each is mined.
+
+    A transaction of the wave may depend on an earlier one of the same wave,
+    e.g. two calls to the same contract in one post action statement.
+    Its gas cannot be estimated before the earlier one is mined, so the jobs are sent in rounds.
+    Each round sends the jobs of each sender up to the first one that does not estimate yet.
+    The rest wait for the next round, estimated against the state the round left behind.
+
+    :param jobs: Sender -> list of (key, send function, gas limit or None, gas estimate function)
+    :return: Results of the sent jobs. Jobs after a failed round are not sent.
+    """
+
+    def run(round_jobs, sender):
+        return PipelinedSender(web3, sender, window=len(round_jobs[sender])).run(round_jobs[sender])
+
+    results = []
+    pending = {sender: list(sender_jobs) for sender, sender_jobs in jobs.items() if sender_jobs}
+    while pending:
+        round_jobs = {}
+        deferred = {}
+        for sender, sender_jobs in pending.items():
+            for idx, (key, send, gas, estimate) in enumerate(sender_jobs):
+                gas = gas or estimate_gas(web3, estimate)
+                if gas is None:
+                    deferred[sender] = sender_jobs[idx:]
+                    break
+                round_jobs.setdefault(sender, []).append((key, send, gas))
+
+        if not round_jobs:
+            # Nothing of ours in flight can make these estimate, they are likely to throw.
+            # Send the first job of each sender as is, so that the chain tells the reason.
+            logger.info("Gas estimation failed for %s, using %d", ", ".join(sender_jobs[0][0] for sender_jobs in deferred.values()), DEFAULT_GAS)
+            round_jobs = {sender: [(sender_jobs[0][0], sender_jobs[0][1], DEFAULT_GAS)] for sender, sender_jobs in deferred.items()}
+            deferred = {sender: sender_jobs[1:] for sender, sender_jobs in deferred.items() if len(sender_jobs) > 1}
+
+        if len(round_jobs) == 1:
+            round_results = run(round_jobs, next(iter(round_jobs)))
+        else:
+            # One sender per thread, the tester chain takes them one request at a time
+            with serialize_requests(web3), ThreadPoolExecutor(max_workers=len(round_jobs)) as executor:
+                round_results = [result for sender_results in executor.map(lambda sender: run(round_jobs, sender), round_jobs.keys()) for result in sender_results]
+
+        results += round_results
+        if any(result.status != STATUS_SUCCESS for result in round_results):
+            break
+        pending = deferred
+
+    return results
+
+
+def deploy_dag(chain, chain_data: dict, deploy_address: str, plan: Optional[Plan]=None, executed_actions: List[str]=(), waiter: Optional[ReceiptWaiter]=None) -> Tuple[dict, dict, Dict[str, Contract]]:
+    """Deploy contracts and run post actions wave by wave.
+
+    :param plan: Plan to run, by default everything in the definition. See :py:func:`plan_incremental`.
+    :param executed_actions: Digests of post actions that have been run before, carried to the report
+    :param waiter: Receipt poller for the post actions that confirm transactions
+    :return: Tuple (runtime data, statistics, contracts) like ico's deployer
+    """
+    web3 = chain.web3
+    if plan is None:
+        plan = build_plan(chain_data, deploy_address)
+    waiter = waiter or ReceiptWaiter(web3)
+
+    runtime_data = {key: value for key, value in chain_data.items() if key not in ACTION_SECTIONS}
+    runtime_data["deploy_address"] = deploy_address
+    runtime_data["contracts"] = {}
+    runtime_data["executed_actions"] = list(executed_actions)
+    contracts = {}
+    statistics = {"waves": plan.depth, "deployed": 0, "transactions": 0, "barriers": 0}
+
+    # Contracts deployed earlier
+    for name, contract_def in chain_data["contracts"].items():
+        if contract_def.get("address"):
+            runtime_data["contracts"][name] = dict(contract_def)
+            contracts[name] = chain.provider.get_contract_factory(contract_def["contract_name"])(address=contract_def["address"])
+
+    # Libraries go first, most of the time they are already there
+    libraries = {}
+    for contract_def in chain_data["contracts"].values():
+        for library in get_libraries(chain, contract_def["contract_name"]):
+            if library not in libraries:
+                library_contract, txid = chain.provider.get_or_deploy_contract(library, deploy_transaction={"from": deploy_address})
+                libraries[library] = library_contract.address
+
+    for wave_number, wave in enumerate(plan.waves, start=1):
+        logger.info("Wave %d/%d: %s", wave_number, plan.depth, ", ".join(step.key for step in wave))
+
+        if wave[0].kind == "barrier":
+            # A barrier depends on everything before it, and everything after depends on it, so it is alone in its wave
+            exec(textwrap.dedent(wave[0].source), get_action_context(web3, runtime_data, contracts, recording=False, waiter=waiter))
+            runtime_data["executed_actions"].append(wave[0].digest)
+            statistics["barriers"] += 1
+            continue
+
+        jobs = {}
+        deployments = {}
+        context = get_action_context(web3, runtime_data, contracts, recording=True, waiter=waiter)
+
+        for step in wave:
+            if step.kind == "deploy":
+                contract_def = chain_data["contracts"][step.name]
+                expanded = interpolate_data(contract_def, get_jinja_context(runtime_data))
+                factory = chain.provider.get_contract_factory(expanded["contract_name"])
+                kwargs = dict(expanded.get("arguments") or {})
+                data = factory._encode_constructor_data(kwargs=kwargs)
+                estimate = lambda data=data: web3.eth.estimateGas({"from": deploy_address, "data": data})
+
+                expanded["constructor_args"] = get_constructor_args(factory, kwargs)
+                expanded["libraries"] = {library: libraries[library] for library in get_libraries(chain, expanded["contract_name"])}
+                deployments[step.key] = (step.name, expanded, factory)
+
+                send = lambda tx, factory=factory, kwargs=kwargs: factory.deploy(transaction=tx, kwargs=kwargs)
+                jobs.setdefault(deploy_address, []).append((step.key, send, None, estimate))
+            else:
+                calls = evaluate(step.node, context)
+                if isinstance(calls, PlannedCall):
+                    calls = [calls]
+
+                for idx, call in enumerate(calls):
+                    assert isinstance(call, PlannedCall), "Post action {} does not create a transaction: {}".format(step.key, call)
+                    sender = call.transaction.get("from", deploy_address)
+                    jobs.setdefault(sender, []).append(("{}:{}".format(step.key, idx), call.send, call.transaction.get("gas"), call.estimate_gas))
+
+        results = send_wave(web3, jobs)
+        failed = [result for result in results if result.status != STATUS_SUCCESS]
+        if failed:
+            raise DeploymentFailed("Wave {} failed: {}".format(wave_number, failed), results)
+
+        # Pick up the new contract addresses for the next waves
+        deploy_results = {result.key: result for result in results if result.key in deployments}
+        receipts = get_receipts(web3, [result.txid for result in deploy_results.values()])
+        for key, result in deploy_results.items():
+            name, expanded, factory = deployments[key]
+            expanded["address"] = receipts[result.txid]["contractAddress"]
+            runtime_data["contracts"][name] = expanded
+            contracts[name] = factory(address=expanded["address"])
+            logger.info("Deployed %s at %s, block %d", name, expanded["address"], to_int(receipts[result.txid]["blockNumber"]))
+
+        statistics["deployed"] += len(deploy_results)
+        statistics["transactions"] += len(results) - len(deploy_results)
+        runtime_data["executed_actions"] += [step.digest for step in wave if step.kind == "tx"]
+
+    return runtime_data, statistics, contracts
+
+
+def run_verify_actions(web3: Web3, chain_data: dict, runtime_data: dict, contracts: Dict[str, Contract], waiter: Optional[ReceiptWaiter]=None):
+    """Run the sanity checks of the definition one statement at a time."""
+    source = chain_data.get("verify_actions")
+    if source:
+        exec(textwrap.dedent(source), get_action_context(web3, runtime_data, contracts, recording=False, waiter=waiter or ReceiptWaiter(web3)))
+
+
+def get_report_filename(yaml_filename: str) -> str:
+    return yaml_filename.replace(".yml", ".deployment-report.yml")
+
+
+def write_deployment_report(yaml_filename: str, runtime_data: dict) -> str:
+    """Store the deployed addresses and constructor arguments next to the definition."""
+    report_filename = get_report_filename(yaml_filename)
+    with open(report_filename, "wt") as out:
+        out.write(ruamel.yaml.round_trip_dump(runtime_data))
+    return report_filename
+
+
+def load_deployment_report(yaml_filename: str) -> Optional[dict]:
+    """Read the report of an earlier deployment of the definition, None if there is none."""
+    report_filename = get_report_filename(yaml_filename)
+    if not os.path.exists(report_filename):
+        return None
+    with open(report_filename, "rt") as inp:
+        return ruamel.yaml.round_trip_load(inp)
+
+
+def check_reusable(chain, contract_def: dict, entry: Optional[dict], code: Optional[str], runtime_data: dict) -> Optional[str]:
+    """Compare a contract definition against its deployment report entry and the chain.
+
+    :param entry: The contract in the earlier deployment report
+    :param code: eth_getCode() at the reported address
+    :param runtime_data: Addresses of the contracts reused so far, for expanding the arguments
+    :return: Why the contract must be deployed again, None if the reported contract can be reused
+    """
+    if not entry or not entry.get("address"):
+        return "not deployed before"
+
+    if entry.get("contract_name") != contract_def["contract_name"]:
+        return "contract changed from {}".format(entry.get("contract_name"))
+
+    refs = set(CONTRACT_REFERENCE.findall(str(dict(contract_def.get("arguments") or {}))))
+    redeployed = refs - set(runtime_data["contracts"].keys())
+    if redeployed:
+        return "depends on redeployed {}".format(", ".join(sorted(redeployed)))
+
+    base = chain.provider.get_base_contract_factory(contract_def["contract_name"])
+    try:
+        libraries = dict(entry.get("libraries") or {})
+        factory = chain.web3.eth.contract(abi=base.abi, bytecode=link_bytecode(base.bytecode, libraries), bytecode_runtime=link_bytecode(base.bytecode_runtime, libraries))
+    except KeyError as e:
+        return "library {} not in the report".format(e)
+
+    expanded = interpolate_data(contract_def, get_jinja_context(runtime_data))
+    if get_constructor_args(factory, dict(expanded.get("arguments") or {})) != entry.get("constructor_args", "").lower():
+        return "constructor arguments changed"
+
+    if not code or code == "0x":
+        return "no code at {}".format(entry["address"])
+
+    if code.lower() != factory.bytecode_runtime.lower():
+        return "compiled code differs from the chain"
+
+    return None
+
+
+def plan_incremental(chain, chain_data: dict, deploy_address: str, report: dict) -> Tuple[dict, Plan, Dict[str, Optional[str]], List[str]]:
+    """Plan a deployment that reuses what an earlier deployment report says is on the chain.
+
+    Contracts are checked with :py:func:`check_reusable` in dependency order,
+    so a contract whose arguments refer to a redeployed contract is redeployed too.
+    A post action is skipped if the report lists it as run and none of the contracts it mentions is redeployed.
+    Reports written without the list of run post actions run all of them again.
+    Files read by post actions, like investor CSVs, are not compared.
+
+    :return: Tuple (definition with the reused contracts pinned, plan, why each contract is redeployed or None if reused, digests of the skipped post actions)
+    """
+    web3 = chain.web3
+    full_plan = build_plan(chain_data, deploy_address)
+    reported = report.get("contracts") or {}
+
+    # One round trip for the code of all reported contracts
+    addresses = {name: entry["address"] for name, entry in reported.items() if entry.get("address")}
+    codes = dict(zip(addresses.keys(), batch_request(web3, [("eth_getCode", [address, "latest"]) for address in addresses.values()])))
+
+    runtime_data = {key: value for key, value in chain_data.items() if key not in ACTION_SECTIONS}
+    runtime_data["deploy_address"] = deploy_address
+    runtime_data["contracts"] = {name: dict(contract_def) for name, contract_def in chain_data["contracts"].items() if contract_def.get("address")}
+
+    reasons = {}
+    contract_defs = dict(chain_data["contracts"])
+    for step in sorted(full_plan.steps, key=lambda s: (s.wave, s.order)):
+        if step.kind != "deploy":
+            continue
+        reasons[step.name] = check_reusable(chain, contract_defs[step.name], reported.get(step.name), codes.get(step.name), runtime_data)
+        if reasons[step.name] is None:
+            contract_defs[step.name] = dict(reported[step.name])
+            runtime_data["contracts"][step.name] = contract_defs[step.name]
+
+    incremental_data = dict(chain_data)
+    incremental_data["contracts"] = contract_defs
+    plan = build_plan(incremental_data, deploy_address)
+
+    if "executed_actions" not in report:
+        logger.warning("The report does not list the post actions that were run, running all of them")
+    executed = set(report.get("executed_actions") or [])
+    redeployed = {name for name, reason in reasons.items() if reason}
+    skipped = [step for step in plan.steps if step.kind != "deploy" and step.digest in executed and not step.refs & redeployed]
+
+    return incremental_data, plan.without({step.key for step in skipped}), reasons, [step.digest for step in skipped]
+
+
+def print_plan(plan: Plan):
+    for wave_number, wave in enumerate(plan.waves, start=1):
+        print("Wave {}: {}".format(wave_number, ", ".join(step.name or step.key for step in wave)))
+
+
+@click.command()
+@click.option('--chain', nargs=1, default="mainnet", help='On which chain to deploy - see populus.json')
+@click.option('--address', nargs=1, help='Account to deploy from. Must exist on geth.', required=True)
+@click.option('--deployment-file', nargs=1, help='YAML file definining the crowdsale', required=True)
+@click.option('--deployment-name', nargs=1, help='YAML section name we are deploying. Usual options include "mainnet" or "kovan"', required=True)
+@click.option('--plan-only', is_flag=True, default=False, help='Print the waves without sending anything')
+@click.option('--incremental', is_flag=True, default=False, help='Reuse the unchanged contracts and post actions of the earlier deployment report')
+def main(chain, address, deployment_file, deployment_name, plan_only, incremental):
+    """Deploy a crowdsale definition in dependency waves."""
+
+    logging.basicConfig(level=logging.INFO)
+    chain_data = load_crowdsale_definitions(deployment_file, deployment_name)
+    report = load_deployment_report(deployment_file) if incremental else None
+    if incremental and not report:
+        print("No deployment report for", deployment_file, "- deploying everything")
+
+    plan = None
+    executed_actions = []
+    if not report:
+        plan = build_plan(chain_data, address)
+        print_plan(plan)
+        if plan_only:
+            return
+
+    project = Project()
+    with project.get_chain(chain) as c:
+        web3 = c.web3
+
+        if report:
+            # Comparing against the report needs the chain
+            chain_data, plan, reasons, executed_actions = plan_incremental(c, chain_data, address, report)
+            for name, reason in sorted(reasons.items()):
+                print("{}: {}".format(name, reason or "unchanged at {}".format(chain_data["contracts"][name]["address"])))
+            print("Skipping {} post actions that have been run".format(len(executed_actions)))
+            print_plan(plan)
+            if plan_only:
+                return
+
+        if is_account_locked(web3, address):
+            request_account_unlock(c, address, None)
+
+        waiter = ReceiptWaiter(web3)
+        runtime_data, statistics, contracts = deploy_dag(c, chain_data, address, plan=plan, executed_actions=executed_actions, waiter=waiter)
+        run_verify_actions(web3, chain_data, runtime_data, contracts, waiter=waiter)
+        print("Deployment report written to", write_deployment_report(deployment_file, runtime_data))
+        print("Statistics", statistics)
+
+
+if __name__ == "__main__":
+    main()
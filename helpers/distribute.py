@@ -0,0 +1,127 @@
+"""Push MultiVault tokens to all investors with distributeRange().
+
+Page size is derived from the block gas limit and the measured gas cost of
+distributing to a single investor. Each page then gets its own gas estimate,
+as investors who have already claimed are cheaper to skip than to pay.
+Progress is read from the vault ``distributionCursor``, so an interrupted run
+continues where the last completed page ended::
+
+    results = distribute_vault(web3, founders_vault, deploy_address)
+
+"""
+import logging
+from typing import Callable, List, Optional, Tuple
+
+from web3 import Web3
+from web3.contract import Contract
+
+from helpers.bulksend import PipelinedSender, SendResult, STATUS_SUCCESS
+
+
+logger = logging.getLogger(__name__)
+
+
+#: How much of the block gas limit a single page may use
+BLOCK_FILL_RATIO = 0.5
+
+#: Extra gas given on top of the estimate
+GAS_MARGIN = 1.2
+
+
+def get_block_gas_limit(web3: Web3) -> int:
+    return web3.eth.getBlock("latest")["gasLimit"]
+
+
+def estimate_range_gas(vault: Contract, owner: str, start: int, count: int) -> int:
+    return vault.estimateGas({"from": owner}).distributeRange(start, count)
+
+
+def calculate_page_size(vault: Contract, owner: str, start: int, max_gas: int, sample: int=4) -> Tuple[int, int, int]:
+    """Find how many investors fit in one distributeRange() call.
+
+    Gas is estimated for one and ``sample`` investors to separate the fixed and per investor cost.
+
+    :return: (page size, base gas, per investor gas)
+    """
+    remaining = vault.call().investorCount() - start
+    one = estimate_range_gas(vault, owner, start, 1)
+    if remaining <= 1:
+        return 1, 0, one
+
+    sample = min(sample, remaining)
+    many = estimate_range_gas(vault, owner, start, sample)
+    per_investor = max(1, (many - one) // (sample - 1))
+    base = max(0, one - per_investor)
+
+    page_size = int((max_gas / GAS_MARGIN - base) // per_investor)
+    return max(1, page_size), base, per_investor
+
+
+def plan_pages(vault: Contract, owner: str, cursor: int, investor_count: int, page_size: int, max_gas: int) -> List[Tuple[int, int, int]]:
+    """Estimate gas for each page against the current vault state.
+
+    Investors who have already claimed cost less than the others,
+    so a page estimated from the first investors can run out of gas later on.
+    A page whose estimate does not fit in ``max_gas`` is halved until it does.
+
+    :return: List of (start, count, gas limit)
+    """
+    pages = []
+    start = cursor
+    while start < investor_count:
+        count = min(page_size, investor_count - start)
+        gas = int(estimate_range_gas(vault, owner, start, count) * GAS_MARGIN)
+        while gas > max_gas and count > 1:
+            count //= 2
+            gas = int(estimate_range_gas(vault, owner, start, count) * GAS_MARGIN)
+        pages.append((start, count, min(gas, max_gas)))
+        start += count
+    return pages
+
+
+def distribute_vault(web3: Web3,
+                     vault: Contract,
+                     owner: str,
+                     page_size: Optional[int]=None,
+                     window: int=4,
+                     on_result: Optional[Callable[[SendResult], None]]=None) -> List[SendResult]:
+    """Push remaining tokens to every investor of a vault.
+
+    The vault must be in Distributing state.
+
+    :param owner: Vault owner account that sends the transactions
+    :param page_size: Investors per transaction. Sized against the block gas limit if not given.
+    :param window: How many page transactions are kept in flight
+    :return: SendResult for each page, key is the page start index
+    """
+
+    investor_count = vault.call().investorCount()
+    cursor = vault.call().distributionCursor()
+
+    if cursor >= investor_count:
+        logger.info("Vault %s has already distributed to all %d investors", vault.address, investor_count)
+        return []
+
+    max_gas = int(get_block_gas_limit(web3) * BLOCK_FILL_RATIO)
+
+    if not page_size:
+        page_size, base, per_investor = calculate_page_size(vault, owner, cursor, max_gas)
+
+    pages = plan_pages(vault, owner, cursor, investor_count, page_size, max_gas)
+
+    logger.info("Distributing vault %s from investor %d/%d in %d pages of up to %d investors",
+                vault.address, cursor, investor_count, len(pages), page_size)
+
+    jobs = []
+    for start, count, gas in pages:
+        send = lambda tx, start=start, count=count: vault.transact(tx).distributeRange(start, count)
+        jobs.append((start, send, gas))
+
+    sender = PipelinedSender(web3, owner, window=window, on_result=on_result)
+    results = sender.run(jobs)
+
+    failed = [r for r in results if r.status != STATUS_SUCCESS]
+    if failed:
+        logger.warning("%d pages did not complete, first failed page starts at %d. Run again to resume.", len(failed), failed[0].key)
+
+    return results
@@ -0,0 +1,204 @@
+"""Token distribution model evaluated over arrays of scenarios.
+
+This is the spreadsheet model behind ``MysteriumTokenDistribution.distribute``:
+early bird, regular and seed coins, the future round percentage and
+the seed vault 1/vault 2 split as a function of the CHF amount raised
+and the ETH/CHF price.
+
+Inputs can be scalars or NumPy arrays of any matching shape, so a grid of
+scenarios is evaluated in one pass::
+
+    raised, price = np.meshgrid(np.linspace(1e6, 20e6, 1000), np.linspace(50, 400, 1000))
+    dist = calculate_distribution(raised, price)
+    dist["total_coins"].max()
+
+There are two modes
+
+- :py:func:`calculate_distribution` works in floats and whole tokens, like the original calculator
+
+- :py:func:`calculate_distribution_exact` works in integers and token base units (8 decimals),
+  with floor division like the contract, and can reproduce the minted constants
+
+"""
+import numpy as np
+
+
+# hardcode constants to smart contract
+SOFT_CAP_CHF = 6000000
+MIN_SOFT_CAP_CHF = 2000000
+SEED_RAISED_ETH = 6000
+FOUNDATION_PERCENTAGE = 9
+TEAM_PERCENTAGE = 10
+EARLYBIRD_PRICE_MULTIPLIER = 1.2
+REGULAR_PRICE_MULTIPLIER = 1
+
+#: Token decimals
+DECIMALS = 8
+
+#: One token in base units
+DECIMAL_SCALE = 10 ** DECIMALS
+
+#: distribute() constants are rounded to this many base units
+CONTRACT_ROUNDING = 1000
+
+#: Percentages and multipliers are kept as integer numerators over this denominator in the exact mode.
+#: The sloped part of the future round percentage, 67.5 - 8.75 * raised / 1M, needs the factor 4.
+SCALE = 4 * 1000000
+
+
+def calculate_distribution(amount_raised_chf, eth_chf_price) -> dict:
+    """Evaluate the model in floats.
+
+    :param amount_raised_chf: CHF raised in the crowdsale, scalar or array
+    :param eth_chf_price: ETH/CHF price, scalar or array
+    :return: Dict of arrays in whole tokens (and percents for the percentage fields)
+    """
+    raised = np.asarray(amount_raised_chf, dtype=np.float64)
+    price = np.asarray(eth_chf_price, dtype=np.float64)
+
+    # step 1, E6: Calculate "EarlyBird" coins (1chf = 1.2 myst), based on C10
+    earlybird_coins = np.minimum(raised, SOFT_CAP_CHF) * EARLYBIRD_PRICE_MULTIPLIER
+
+    # step 2, F6: Calculate Regular investor coins (1chf = 1myst), based on C11
+    regular_coins = np.maximum(raised - SOFT_CAP_CHF, 0) * REGULAR_PRICE_MULTIPLIER
+
+    # step 3, G5: Define Seed MULTIPLIER, based on C8 - raised amount during ICO
+    # 2M - 1x
+    # 6M - 5x
+    seed_multiplier = np.where(raised <= MIN_SOFT_CAP_CHF, 1.0, np.where(raised < SOFT_CAP_CHF, raised / 1000000.0 - 1, 5.0))
+
+    # step 4, G6: Calculate Seed Round Tokens using G5
+    seed_coins = SEED_RAISED_ETH * price * seed_multiplier
+
+    # step 5, H3: Calculate PERCENTAGE of "tokens reserved for II'nd round", using C8
+    # 2M - 50%
+    # 6M - 15%
+    future_round_percentage = np.where(raised <= MIN_SOFT_CAP_CHF, 50.0, np.where(raised < SOFT_CAP_CHF, 67.5 - 8.75 * (raised / 1000000.0), 15.0))
+
+    # step 6, E2: Calculate PERENTAGE of  (Early bird + Regular + Seed) = 100% - Team(10%) - Foundation (9%) - II'nd round(H3)
+    percentage_of_three = 100 - FOUNDATION_PERCENTAGE - TEAM_PERCENTAGE - future_round_percentage
+
+    # step 7, E3,knowing total percentage E2 and total coins for (EarlyBird, Regular and Seed) = sum(E3:G3)
+    earlybird_percentage = earlybird_coins * percentage_of_three / (earlybird_coins + regular_coins + seed_coins)
+
+    # step 8, K6: Calculate TOTAL coins knowing E3 & E6
+    total_coins = earlybird_coins * 100 / earlybird_percentage
+
+    # step 9, 10, 11: II'nd round, foundation and team coins
+    future_round_coins = future_round_percentage * total_coins / 100
+    foundation_coins = FOUNDATION_PERCENTAGE * total_coins / 100
+    team_coins = TEAM_PERCENTAGE * total_coins / 100
+
+    # seed coins to vault1 (no-lock) 1x, the rest to vault2 (with-lock)
+    seed_coins_vault1 = seed_coins / seed_multiplier
+    seed_coins_vault2 = seed_coins - seed_coins_vault1
+
+    return {
+        "earlybird_coins": earlybird_coins,
+        "regular_coins": regular_coins,
+        "seed_multiplier": seed_multiplier,
+        "seed_coins": seed_coins,
+        "future_round_percentage": future_round_percentage,
+        "percentage_of_three": percentage_of_three,
+        "earlybird_percentage": earlybird_percentage,
+        "total_coins": total_coins,
+        "future_round_coins": future_round_coins,
+        "foundation_coins": foundation_coins,
+        "team_coins": team_coins,
+        "seed_coins_vault1": seed_coins_vault1,
+        "seed_coins_vault2": seed_coins_vault2,
+    }
+
+
+def _to_int_array(value) -> np.ndarray:
+    """Python int object array, so that the intermediate products cannot overflow.
+
+    Scalars become one element arrays, as NumPy turns 0-d array results to fixed width scalars.
+    """
+    arr = np.atleast_1d(np.asarray(value))
+    if arr.dtype.kind == "f":
+        if not np.all(np.mod(arr, 1) == 0):
+            raise ValueError("Exact mode takes whole numbers")
+        arr = arr.astype(np.int64)
+    return arr.astype(object)
+
+
+def _round(value, to: int):
+    """Round half up to a multiple of ``to``."""
+    if to == 1:
+        return value
+    return (value + to // 2) // to * to
+
+
+def calculate_distribution_exact(amount_raised_chf, eth_chf_price, earlybird_coins=None, regular_coins=None, round_to: int=1) -> dict:
+    """Evaluate the model in integers and token base units.
+
+    All divisions floor like uint256 division in the contract.
+
+    :param amount_raised_chf: Whole CHF raised, scalar or array
+    :param eth_chf_price: Whole ETH/CHF price as given by MysteriumPricing.getEthChfPrice(), scalar or array
+    :param earlybird_coins: Actually sold early bird tokens in base units. Derived from the amount raised if not given.
+    :param regular_coins: Actually sold regular tokens in base units. Derived from the amount raised if not given.
+    :param round_to: Round the future round, foundation and team coins to a multiple of this. Use CONTRACT_ROUNDING to match distribute().
+    :return: Dict of object arrays of Python ints, or of ints for scalar inputs. Percentage and multiplier fields are numerators over SCALE.
+    """
+    scalar = np.ndim(amount_raised_chf) == 0 and np.ndim(eth_chf_price) == 0
+    raised = _to_int_array(amount_raised_chf)
+    price = _to_int_array(eth_chf_price)
+
+    if earlybird_coins is None:
+        earlybird_coins = np.minimum(raised, SOFT_CAP_CHF) * (12 * DECIMAL_SCALE // 10)
+    else:
+        earlybird_coins = _to_int_array(earlybird_coins)
+
+    if regular_coins is None:
+        regular_coins = np.maximum(raised - SOFT_CAP_CHF, 0) * (REGULAR_PRICE_MULTIPLIER * DECIMAL_SCALE)
+    else:
+        regular_coins = _to_int_array(regular_coins)
+
+    # Multiplier over SCALE: 1x, raised / 1M - 1, 5x
+    seed_multiplier = np.where(raised <= MIN_SOFT_CAP_CHF, SCALE, np.where(raised < SOFT_CAP_CHF, (raised - 1000000) * 4, 5 * SCALE))
+    seed_coins = SEED_RAISED_ETH * price * seed_multiplier * DECIMAL_SCALE // SCALE
+
+    # Future round percentage over SCALE: 50%, 67.5% - 8.75% * raised / 1M, 15%
+    future_round_percentage = np.where(raised <= MIN_SOFT_CAP_CHF, 50 * SCALE, np.where(raised < SOFT_CAP_CHF, 270000000 - 35 * raised, 15 * SCALE))
+    percentage_of_three = (100 - FOUNDATION_PERCENTAGE - TEAM_PERCENTAGE) * SCALE - future_round_percentage
+
+    # earlybird * 100 / (earlybird * pct3 / sum) simplifies to sum * 100 / pct3
+    total_coins = (earlybird_coins + regular_coins + seed_coins) * 100 * SCALE // percentage_of_three
+
+    future_round_coins = _round(total_coins * future_round_percentage // (100 * SCALE), round_to)
+    foundation_coins = _round(total_coins * FOUNDATION_PERCENTAGE // 100, round_to)
+    team_coins = _round(total_coins * TEAM_PERCENTAGE // 100, round_to)
+
+    seed_coins_vault1 = seed_coins * SCALE // seed_multiplier
+    seed_coins_vault2 = seed_coins - seed_coins_vault1
+
+    result = {
+        "earlybird_coins": earlybird_coins,
+        "regular_coins": regular_coins,
+        "seed_multiplier": seed_multiplier,
+        "seed_coins": seed_coins,
+        "future_round_percentage": future_round_percentage,
+        "percentage_of_three": percentage_of_three,
+        "total_coins": total_coins,
+        "future_round_coins": future_round_coins,
+        "foundation_coins": foundation_coins,
+        "team_coins": team_coins,
+        "seed_coins_vault1": seed_coins_vault1,
+        "seed_coins_vault2": seed_coins_vault2,
+    }
+
+    if scalar:
+        return {name: int(value[0]) for name, value in result.items()}
+    return result
+
+
+def get_distribute_constants(amount_raised_chf: int, eth_chf_price: int, earlybird_coins: int, regular_coins: int) -> dict:
+    """Calculate the five amounts MysteriumTokenDistribution.distribute() mints for a single scenario.
+
+    :return: Dict of ints named as the contract public variables
+    """
+    dist = calculate_distribution_exact(amount_raised_chf, eth_chf_price, earlybird_coins, regular_coins, round_to=CONTRACT_ROUNDING)
+    names = ("future_round_coins", "foundation_coins", "team_coins", "seed_coins_vault1", "seed_coins_vault2")
+    return {name: dist[name] for name in names}
@@ -0,0 +1,78 @@
+"""Export MultiVault claim entitlements with MultiVault.getClaimRange().
+
+All pages are read in batched calls pinned to one block, so the table
+is consistent even if investors claim while we read::
+
+    table = read_entitlements(web3, founders_vault)
+    write_entitlements_csv(table, "founders-entitlements.csv")
+
+"""
+import csv
+from typing import Iterable, List, NamedTuple, Optional
+
+from web3 import Web3
+from web3.contract import Contract
+
+from helpers.rpc import batch_call
+
+
+#: How many investors one getClaimRange() call returns
+DEFAULT_PAGE_SIZE = 200
+
+
+#: Claim status of a single investor
+Entitlement = NamedTuple("Entitlement", [
+    ("index", int),
+    ("address", str),
+    ("amount", int),
+    ("claimed", int),
+    ("left", int),
+])
+
+
+#: All investors of a vault at one block
+EntitlementTable = NamedTuple("EntitlementTable", [
+    ("vault", str),
+    ("block_number", int),
+    ("entitlements", List[Entitlement]),
+])
+
+
+def read_entitlements(web3: Web3, vault: Contract, block_identifier: Optional[int]=None, page_size: int=DEFAULT_PAGE_SIZE) -> EntitlementTable:
+    """Read claim amounts of every investor in a vault.
+
+    The vault must have fetched its token balance.
+
+    :param block_identifier: Block number to read at, defaults to the current block
+    :param page_size: Investors per getClaimRange() call
+    """
+
+    if block_identifier is None:
+        block_identifier = web3.eth.blockNumber
+
+    investor_count = batch_call(web3, vault, "investorCount", [[]], block_identifier=block_identifier)[0]
+    pages = [[start, page_size] for start in range(0, investor_count, page_size)]
+
+    entitlements = []
+    for start_count, page in zip(pages, batch_call(web3, vault, "getClaimRange", pages, block_identifier=block_identifier)):
+        start = start_count[0]
+        addresses, amounts, claimed, left = page
+        for i, address in enumerate(addresses):
+            entitlements.append(Entitlement(start + i, address, amounts[i], claimed[i], left[i]))
+
+    return EntitlementTable(vault.address, block_identifier, entitlements)
+
+
+def write_entitlements_csv(table: EntitlementTable, fname: str):
+    """Write the table with a header row."""
+    with open(fname, "wt") as out:
+        writer = csv.writer(out)
+        writer.writerow(["index", "address", "amount", "claimed", "left", "vault", "block"])
+        for e in table.entitlements:
+            writer.writerow([e.index, e.address, e.amount, e.claimed, e.left, table.vault, table.block_number])
+
+
+def read_many_vaults(web3: Web3, vaults: Iterable[Contract], page_size: int=DEFAULT_PAGE_SIZE) -> List[EntitlementTable]:
+    """Read several vaults at the same block."""
+    block_number = web3.eth.blockNumber
+    return [read_entitlements(web3, vault, block_identifier=block_number, page_size=page_size) for vault in vaults]
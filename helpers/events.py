@@ -0,0 +1,177 @@
+"""Fetch and decode contract events over long block ranges.
+
+A single ``eth_getLogs`` over the whole crowdsale period times out or hits the
+node result limit, and a fixed small range wastes round trips on empty blocks.
+:py:func:`fetch_logs` adapts the range: it is halved when the node refuses the
+query and doubled while the chunks come back small.
+
+:py:class:`EventDecoder` decodes the logs of several events by their topic::
+
+    decoder = EventDecoder(crowdsale.abi, ["Invested", "Refund"])
+    for start, end, logs in fetch_logs(web3, crowdsale.address, decoder.topics, 3900000, 4000000):
+        for event in decoder.decode_all(logs):
+            print(event["event"], event["args"])
+
+"""
+import logging
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import requests
+from eth_abi import decode_abi
+from eth_utils import decode_hex, encode_hex, keccak
+from web3 import Web3
+
+from helpers.rpc import RPCError, batch_request, to_int
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Blocks in the first eth_getLogs query
+DEFAULT_RANGE = 2000
+
+#: Upper limit for the range when chunks come back small
+MAX_RANGE = 200000
+
+#: Grow the range while a chunk has fewer logs than this
+TARGET_LOGS = 1000
+
+
+def get_event_abi(abi: list, name: str) -> dict:
+    """Find an event ABI entry by name."""
+    for entry in abi:
+        if entry.get("type") == "event" and entry["name"] == name:
+            return entry
+    raise ValueError("ABI does not have event {}".format(name))
+
+
+def get_event_topic(event_abi: dict) -> str:
+    """Topic 0 of the event, keccak of its signature."""
+    signature = "{}({})".format(event_abi["name"], ",".join(arg["type"] for arg in event_abi["inputs"]))
+    return encode_hex(keccak(signature.encode("utf-8")))
+
+
+class EventDecoder:
+    """Decode logs of several events of a contract."""
+
+    def __init__(self, abi: list, names: Iterable[str]):
+        #: topic -> event ABI
+        self.events = {}
+        for name in names:
+            event_abi = get_event_abi(abi, name)
+            self.events[get_event_topic(event_abi)] = event_abi
+
+    @property
+    def topics(self) -> List[str]:
+        return list(self.events.keys())
+
+    def decode(self, log: dict) -> Optional[dict]:
+        """Decode a raw JSON-RPC log.
+
+        :return: Dict with event name, args by name, args in ABI order as values and the log position. None if the log is not one of our events.
+        """
+        topics = log.get("topics") or []
+        event_abi = self.events.get(topics[0]) if topics else None
+        if event_abi is None:
+            return None
+
+        indexed = [arg for arg in event_abi["inputs"] if arg.get("indexed")]
+        not_indexed = [arg for arg in event_abi["inputs"] if not arg.get("indexed")]
+
+        args = {}
+        for arg, topic in zip(indexed, topics[1:]):
+            args[arg["name"]] = decode_abi([arg["type"]], decode_hex(topic))[0]
+        values = decode_abi([arg["type"] for arg in not_indexed], decode_hex(log["data"]))
+        for arg, value in zip(not_indexed, values):
+            args[arg["name"]] = value
+
+        return {
+            "event": event_abi["name"],
+            "args": args,
+            "values": [args[arg["name"]] for arg in event_abi["inputs"]],
+            "address": log["address"].lower(),
+            "block_number": to_int(log["blockNumber"]),
+            "block_hash": log["blockHash"],
+            "log_index": to_int(log["logIndex"]),
+            "transaction_hash": log["transactionHash"],
+        }
+
+    def decode_all(self, logs: Iterable[dict]) -> List[dict]:
+        """Decode logs in chain order, skipping the ones that are not our events."""
+        events = [self.decode(log) for log in logs if not log.get("removed")]
+        events = [event for event in events if event]
+        events.sort(key=lambda e: (e["block_number"], e["log_index"]))
+        return events
+
+
+def is_method_missing(e: Exception) -> bool:
+    """Did the call fail because the node does not have the method at all.
+
+    In-process eth-testrpc raises AttributeError or NotImplementedError, HTTP nodes answer with JSON-RPC error -32601.
+    """
+    if isinstance(e, (AttributeError, NotImplementedError)):
+        return True
+    return isinstance(e, RPCError) and isinstance(e.error, dict) and e.error.get("code") == -32601
+
+
+def get_filter_logs(web3: Web3, log_filter: dict) -> list:
+    """Logs through a temporary log filter, for nodes without eth_getLogs."""
+    filter_id = batch_request(web3, [("eth_newFilter", [log_filter])])[0]
+    try:
+        return batch_request(web3, [("eth_getFilterLogs", [filter_id])])[0]
+    finally:
+        batch_request(web3, [("eth_uninstallFilter", [filter_id])], raise_on_error=False)
+
+
+def get_logs(web3: Web3, address, topics: List[str], start: int, end: int) -> list:
+    """One eth_getLogs query, any of the topics as topic 0.
+
+    Falls back to log filters on nodes that do not have eth_getLogs, like eth-testrpc.
+    """
+    log_filter = {
+        "fromBlock": hex(start),
+        "toBlock": hex(end),
+        "address": address,
+        "topics": [topics],
+    }
+    try:
+        return batch_request(web3, [("eth_getLogs", [log_filter])])[0]
+    except (RPCError, AttributeError, NotImplementedError) as e:
+        if not is_method_missing(e):
+            raise
+
+    # eth-testrpc reads nested topics as alternative topic lists, not as alternatives for topic 0,
+    # so ask one topic per filter, which means the same on every node
+    logs = []
+    for topic in topics:
+        logs += get_filter_logs(web3, dict(log_filter, topics=[topic]))
+    return logs
+
+
+def fetch_logs(web3: Web3, address, topics: List[str], start: int, end: int, initial_range: int=DEFAULT_RANGE) -> Iterator[Tuple[int, int, list]]:
+    """Fetch logs in adaptively sized block ranges.
+
+    :param address: Contract address or a list of addresses
+    :param end: Last block, inclusive
+    :return: Iterator of (first block, last block, raw logs) chunks covering the range in order
+    :raise RPCError: If the node refuses even a single block query, or has no way to query logs
+    """
+    size = initial_range
+    while start <= end:
+        chunk_end = min(start + size - 1, end)
+        try:
+            logs = get_logs(web3, address, topics, start, chunk_end)
+        except (RPCError, requests.exceptions.Timeout) as e:
+            if size == 1 or is_method_missing(e):
+                raise
+            size = max(1, size // 2)
+            logger.info("eth_getLogs %d-%d failed, trying %d blocks: %s", start, chunk_end, size, e)
+            continue
+
+        yield start, chunk_end, logs
+
+        if len(logs) < TARGET_LOGS:
+            size = min(size * 2, MAX_RANGE)
+        elif len(logs) > TARGET_LOGS * 2:
+            size = max(1, size // 2)
+        start = chunk_end + 1
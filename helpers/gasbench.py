@@ -0,0 +1,213 @@
+"""Gas used by contract entry points, checked against a recorded baseline.
+
+``tests/test_gas.py`` runs each entry point our users pay for on the tester chain
+and records the gas of the transaction with the ``gas_meter`` fixture::
+
+    txid = crowdsale.transact({"from": customer, "value": value}).buy()
+    gas_meter.record("Crowdsale.buy/new_investor", txid)
+
+A recording fails the test when the gas grows over the baseline by more than the
+tolerance. The baseline is a JSON file of entry point -> gas kept in the repository.
+Refresh it after an intended change with ``--update-gas-baseline``.
+``--strict-gas-baseline``, on by default in ``pytest.ini``, fails the recordings that
+have no baseline. With ``--no-strict-gas-baseline`` they pass, and a missing baseline
+file is reported at the end of the run.
+
+Shard workers of :py:mod:`helpers.run_parallel` write their measurements next to
+the baseline file and the runner merges them, like the test durations.
+
+Two contracts with the same entry points are compared from the recorded baseline with::
+
+    python -m helpers.gasbench --compare MultiVault PackedMultiVault
+
+This module is a pytest plugin. The hooks are called from ``tests/conftest.py``.
+"""
+import json
+import os
+from typing import Dict, List, Optional
+
+import click
+import pytest
+from populus.chain import TestRPCChain
+
+
+#: Where the gas baseline is kept
+DEFAULT_BASELINE_FILE = os.path.join(os.path.dirname(__file__), "..", "tests", "gas-baseline.json")
+
+#: Allowed growth over the baseline, as a fraction
+DEFAULT_TOLERANCE = 0.02
+
+
+def load_baseline(fname: str) -> Dict[str, int]:
+    if not os.path.exists(fname):
+        return {}
+    with open(fname, "rt") as inp:
+        return json.load(inp)
+
+
+def save_baseline(fname: str, baseline: Dict[str, int]):
+    tmp = fname + ".tmp.{}".format(os.getpid())
+    with open(tmp, "wt") as out:
+        json.dump(baseline, out, indent=2, sort_keys=True)
+        out.write("\n")
+    os.replace(tmp, fname)
+
+
+def merge_shard_baselines(fname: str, shard_count: int):
+    """Fold gas measured by shard workers to the baseline file."""
+    baseline = load_baseline(fname)
+    merged = False
+    for shard_id in range(shard_count):
+        shard_file = "{}.shard{}".format(fname, shard_id)
+        if os.path.exists(shard_file):
+            baseline.update(load_baseline(shard_file))
+            os.unlink(shard_file)
+            merged = True
+    if merged:
+        save_baseline(fname, baseline)
+
+
+def format_comparison(baseline: Dict[str, int], contract_name: str, other_name: str) -> List[str]:
+    """Markdown table of the entry points both contracts have in the baseline."""
+    prefix, other_prefix = contract_name + ".", other_name + "."
+    entry_points = sorted(name[len(prefix):] for name in baseline if name.startswith(prefix) and other_prefix + name[len(prefix):] in baseline)
+    lines = [
+        "| Entry point | {} | {} | Change |".format(contract_name, other_name),
+        "|---|---|---|---|",
+    ]
+    for entry_point in entry_points:
+        gas, other_gas = baseline[prefix + entry_point], baseline[other_prefix + entry_point]
+        lines.append("| `{}` | {} | {} | {:+d} |".format(entry_point, gas, other_gas, other_gas - gas))
+    return lines
+
+
+def check_gas(name: str, gas_used: int, baseline: Dict[str, int], tolerance: float=DEFAULT_TOLERANCE, strict: bool=False) -> Optional[str]:
+    """Compare measured gas with the baseline.
+
+    Entry points not in the baseline yet pass, so that new benchmarks can be added before recording them.
+
+    :param strict: Fail entry points that are not in the baseline
+    :return: Error message if the gas grew over the tolerance, otherwise None
+    """
+    expected = baseline.get(name)
+    if expected is None:
+        if strict:
+            return "{} used {} gas and has no baseline. Run with --update-gas-baseline to record it.".format(name, gas_used)
+        return None
+
+    limit = int(expected * (1 + tolerance))
+    if gas_used > limit:
+        return "{} used {} gas, baseline {} (+{:.1f}%), tolerance {:.1f}%. Run with --update-gas-baseline if the change is intended.".format(
+            name, gas_used, expected, (gas_used - expected) * 100 / expected, tolerance * 100)
+    return None
+
+
+class GasMeter:
+    """Records gas used by benchmarked transactions."""
+
+    def __init__(self, chain: TestRPCChain, baseline: Dict[str, int], tolerance: float, update: bool, strict: bool=False):
+        self.chain = chain
+        self.baseline = baseline
+        self.tolerance = tolerance
+        self.update = update
+        self.strict = strict
+
+    def record(self, name: str, txid: str) -> int:
+        """Record the gas used by a mined transaction.
+
+        :return: Gas used
+        """
+        gas_used = self.chain.wait.for_receipt(txid)["gasUsed"]
+        _measured_gas[name] = gas_used
+        _baseline_gas[name] = self.baseline.get(name)
+
+        if not self.update:
+            error = check_gas(name, gas_used, self.baseline, self.tolerance, self.strict)
+            if error:
+                pytest.fail(error)
+        return gas_used
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("gas", "Gas baseline")
+    group.addoption("--gas-baseline", default=None, help="JSON file of gas used per entry point")
+    group.addoption("--gas-tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed gas growth over the baseline, as a fraction")
+    group.addoption("--update-gas-baseline", action="store_true", default=False, help="Write the measured gas to the baseline file")
+    group.addoption("--strict-gas-baseline", action="store_true", dest="strict_gas_baseline", default=False, help="Fail entry points that have no baseline, e.g. when the baseline file is missing")
+    group.addoption("--no-strict-gas-baseline", action="store_false", dest="strict_gas_baseline", default=False, help="Let entry points without a baseline pass, only warn about a missing baseline file")
+
+
+def get_baseline_file(config) -> str:
+    return config.getoption("--gas-baseline") or DEFAULT_BASELINE_FILE
+
+
+@pytest.fixture
+def gas_meter(request, chain) -> GasMeter:
+    """Record and check gas of benchmarked transactions."""
+    config = request.config
+    fname = get_baseline_file(config)
+    if not os.path.exists(fname) and not config.getoption("--update-gas-baseline"):
+        _missing_baseline.add(os.path.abspath(fname))
+    return GasMeter(
+        chain,
+        load_baseline(fname),
+        config.getoption("--gas-tolerance"),
+        config.getoption("--update-gas-baseline"),
+        config.getoption("--strict-gas-baseline"))
+
+
+#: Gas measured in this process
+_measured_gas = {}
+
+#: Baseline the measurements were compared to, None for new entry points
+_baseline_gas = {}
+
+#: Baseline files that did not exist, so the gas was not checked
+_missing_baseline = set()
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _measured_gas:
+        return
+
+    terminalreporter.section("gas used")
+    for fname in sorted(_missing_baseline):
+        terminalreporter.write_line("WARNING: gas baseline {} does not exist, gas use was NOT checked. Record it with --update-gas-baseline.".format(fname), red=True, bold=True)
+    for name in sorted(_measured_gas):
+        gas_used = _measured_gas[name]
+        expected = _baseline_gas[name]
+        change = "new" if expected is None else "{:+d}".format(gas_used - expected)
+        terminalreporter.write_line("{:<50} {:>9} {:>9}".format(name, gas_used, change))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """Fold the measured gas to the baseline file when asked to."""
+    config = session.config
+    if not _measured_gas or not config.getoption("--update-gas-baseline"):
+        return
+
+    fname = get_baseline_file(config)
+    shard_id = config.getoption("--shard-id")
+
+    if shard_id is None:
+        baseline = load_baseline(fname)
+        baseline.update(_measured_gas)
+        save_baseline(fname, baseline)
+    else:
+        # Workers would overwrite each other's entry points, the runner merges these
+        save_baseline("{}.shard{}".format(fname, shard_id), _measured_gas)
+
+
+@click.command()
+@click.option('--baseline', nargs=1, default=DEFAULT_BASELINE_FILE, help='Gas baseline JSON')
+@click.option('--compare', nargs=2, help='Two contract names whose entry points to compare', required=True)
+def main(baseline, compare):
+    """Print the recorded gas of two contracts side by side."""
+    if not os.path.exists(baseline):
+        raise click.ClickException("No gas baseline at {}, record it with py.test tests/test_gas.py --update-gas-baseline".format(baseline))
+    for line in format_comparison(load_baseline(baseline), *compare):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
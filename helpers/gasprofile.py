@@ -0,0 +1,586 @@
+"""Gas per Solidity function from opcode level traces.
+
+Every executed opcode is charged to the Solidity function it belongs to.
+Program counters are mapped to source ranges with the solc runtime source maps,
+and source ranges to functions with the solc AST. Jumps into and out of internal
+functions, and calls to other contracts and libraries, build a call tree, so that
+``buy()`` splits to ``SafeMathLib``, ``MintableToken.mint`` and the pricing calls.
+
+Gas is collected per call path, per function and per storage slot.
+The call paths are written in the folded format of ``flamegraph.pl``::
+
+    flamegraph.pl gas-profile/gas.folded > gas.svg
+
+Traces come from
+
+- the pyethereum ``tester`` chain of the tests, whose VM logs every opcode when its trace logging is on,
+  see :py:func:`record_tester_traces`
+
+- ``debug_traceTransaction`` of a geth node, see :py:func:`trace_transaction`
+
+Run the tests with ``--gas-profile=gas-profile`` to profile every transaction the tests send.
+Shard workers of :py:mod:`helpers.run_parallel` write ``gas.shard<N>.folded`` and
+``gas-profile.shard<N>.json`` instead, feed all the folded files to ``flamegraph.pl``.
+This module is a pytest plugin. The hooks are called from ``tests/conftest.py``.
+"""
+import glob
+import json
+import logging
+import os
+import re
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import click
+import pytest
+from ethereum import opcodes
+from ethereum import slogging
+from populus import Project
+from solc.wrapper import solc_wrapper
+from web3 import Web3
+
+from helpers.rpc import batch_request, to_int
+from helpers.verify import normalize_code, split_metadata
+
+
+#: One executed opcode. depth starts from 1, stack has the two topmost items for the ops in STACK_OPS.
+Step = namedtuple("Step", ["depth", "pc", "op", "gas", "gas_cost", "stack"])
+
+#: Ops that run code of another account
+CALL_OPS = {"CALL", "CALLCODE", "DELEGATECALL", "STATICCALL"}
+
+#: Ops that run init code
+CREATE_OPS = {"CREATE"}
+
+#: Ops that access storage of the running contract
+STORAGE_OPS = {"SLOAD", "SSTORE"}
+
+#: Ops whose stack arguments we need: the called address or the storage slot
+STACK_OPS = CALL_OPS | STORAGE_OPS
+
+#: Gas of an op not counting memory expansion, used for the last op of a frame
+STATIC_FEES = {name: fee for name, ins, outs, fee in opcodes.opcodes.values()}
+
+#: Library placeholder in unlinked solc output
+LINK_PLACEHOLDER = re.compile(r"__.{36}__")
+
+#: Label of gas paid before any code runs
+INTRINSIC = "[intrinsic]"
+
+
+def parse_source_map(srcmap: str) -> List[Tuple[int, int, int, str]]:
+    """Decompress a solc source map.
+
+    :return: (start, length, file index, jump type) of each instruction
+    """
+    entries = []
+    last = [-1, -1, -1, "-"]
+    for item in srcmap.split(";"):
+        if item:
+            for i, field in enumerate(item.split(":")[:4]):
+                if field:
+                    last[i] = field if i == 3 else int(field)
+        entries.append(tuple(last))
+    return entries
+
+
+def get_instruction_indexes(code: bytes) -> List[int]:
+    """Instruction index at each byte of the code, PUSH data bytes included."""
+    indexes = []
+    instruction = 0
+    pc = 0
+    while pc < len(code):
+        op = code[pc]
+        size = op - 0x5e if 0x60 <= op <= 0x7f else 1
+        indexes.extend([instruction] * min(size, len(code) - pc))
+        instruction += 1
+        pc += size
+    return indexes
+
+
+def collect_functions(node: dict, contract: Optional[str]=None, found: Optional[list]=None) -> list:
+    """Source ranges of contracts, functions and modifiers in a legacy solc AST.
+
+    :return: List of (file index, start, end, label)
+    """
+    if found is None:
+        found = []
+
+    name = node.get("name")
+    attributes = node.get("attributes") or {}
+    label = None
+    if name == "ContractDefinition":
+        contract = label = attributes.get("name")
+    elif name in ("FunctionDefinition", "ModifierDefinition"):
+        label = "{}.{}".format(contract, attributes.get("name") or "()")
+
+    if label and node.get("src"):
+        start, length, file_index = (int(x) for x in node["src"].split(":"))
+        found.append((file_index, start, start + length, label))
+
+    for child in node.get("children") or []:
+        collect_functions(child, contract, found)
+    return found
+
+
+def find_label(functions: Dict[int, list], start: int, length: int, file_index: int) -> Optional[str]:
+    """The innermost function, modifier or contract around a source range."""
+    best = None
+    for range_start, range_end, label in functions.get(file_index, []):
+        if range_start <= start and start + length <= range_end:
+            if best is None or range_end - range_start < best[1] - best[0]:
+                best = (range_start, range_end, label)
+    return best[2] if best else None
+
+
+class CompiledContract:
+    """Runtime code of a contract with a function label for each instruction."""
+
+    def __init__(self, name: str, runtime: str, srcmap: str, functions: Dict[int, list]):
+        self.name = name
+        self.code = split_metadata(runtime)[0]
+        self.placeholders = [(m.start(), m.end()) for m in LINK_PLACEHOLDER.finditer(self.code)]
+        self.instructions = get_instruction_indexes(bytes.fromhex(LINK_PLACEHOLDER.sub("0" * 40, self.code)))
+
+        self.labels = []
+        self.jumps = []
+        for start, length, file_index, jump in parse_source_map(srcmap):
+            self.labels.append(find_label(functions, start, length, file_index) or name)
+            self.jumps.append(jump)
+
+    def matches(self, deployed: str) -> bool:
+        """Is this the code deployed at an address, with any library addresses linked in."""
+        if len(deployed) != len(self.code):
+            return False
+        for start, end in self.placeholders:
+            deployed = deployed[:start] + self.code[start:end] + deployed[end:]
+        compiled, deployed = normalize_code(self.code, deployed)
+        return compiled == deployed
+
+    def get_location(self, pc: int) -> Tuple[str, str]:
+        """Function label and jump type of the instruction at a program counter."""
+        if pc < len(self.instructions):
+            index = self.instructions[pc]
+            if index < len(self.labels):
+                return self.labels[index], self.jumps[index]
+        return self.name, "-"
+
+
+def get_source_files(project: Project) -> List[str]:
+    return sorted(glob.glob(os.path.join(project.contracts_source_dir, "**", "*.sol"), recursive=True))
+
+
+def compile_source_maps(project: Project) -> List[CompiledContract]:
+    """Compile the project contracts with source maps, using the project solc settings."""
+    settings = project.config.get("compilation.settings", {})
+    stdoutdata, stderrdata, command, proc = solc_wrapper(
+        source_files=get_source_files(project),
+        combined_json="bin-runtime,srcmap-runtime,ast",
+        optimize=settings.get("optimize"),
+        import_remappings=settings.get("import_remappings"),
+        allow_paths=project.project_dir)
+    output = json.loads(stdoutdata)
+
+    functions = {}
+    for source in output["sources"].values():
+        for file_index, start, end, label in collect_functions(source["AST"]):
+            functions.setdefault(file_index, []).append((start, end, label))
+
+    contracts = []
+    for key, data in sorted(output["contracts"].items()):
+        if data.get("bin-runtime"):
+            name = key.rpartition(":")[2]
+            contracts.append(CompiledContract(name, data["bin-runtime"], data["srcmap-runtime"], functions))
+    return contracts
+
+
+class ContractResolver:
+    """Find the compiled contract of an address by its code."""
+
+    def __init__(self, web3: Web3, contracts: List[CompiledContract]):
+        self.web3 = web3
+        self.by_size = {}
+        for contract in contracts:
+            self.by_size.setdefault(len(contract.code), []).append(contract)
+
+        #: address -> CompiledContract or None
+        self.cache = {}
+
+    def resolve(self, address: str) -> Optional[CompiledContract]:
+        address = address.lower()
+        if address not in self.cache:
+            deployed = split_metadata(self.web3.eth.getCode(address))[0]
+            candidates = self.by_size.get(len(deployed), [])
+            self.cache[address] = next((c for c in candidates if c.matches(deployed)), None)
+        return self.cache[address]
+
+
+def to_address(value: int) -> str:
+    return "0x{:040x}".format(value & (2 ** 160 - 1))
+
+
+class Frame:
+    """A running call, with the internal function calls inside it."""
+
+    def __init__(self, contract: Optional[CompiledContract], name: str, storage_name: str, prefix: str):
+        self.contract = contract
+        self.name = name
+
+        #: Whose storage SLOAD and SSTORE touch, the caller for DELEGATECALL
+        self.storage_name = storage_name
+
+        #: Call path of the caller
+        self.prefix = prefix
+
+        self.functions = [name]
+        self.jump = "-"
+
+        #: The previous step, charged when we see the gas left at the next one
+        self.step = None
+        self.path = None
+        self.function = None
+
+        #: Gas of the frames called since the previous step
+        self.children_gas = 0
+
+        #: Gas of this frame, called frames included
+        self.total = 0
+
+    def enter(self, step: Step):
+        """Move to the next step, following the jumps to and from internal functions."""
+        if self.contract:
+            label, jump = self.contract.get_location(step.pc)
+        else:
+            label, jump = self.name, "-"
+
+        if self.jump == "i":
+            self.functions.append(label)
+        elif self.jump == "o" and len(self.functions) > 1:
+            self.functions.pop()
+            self.functions[-1] = label
+        else:
+            self.functions[-1] = label
+
+        self.jump = jump
+        self.step = step
+        self.function = label
+        self.path = ";".join(([self.prefix] if self.prefix else []) + self.functions)
+
+
+class GasProfile:
+    """Gas of many transactions per call path, function and storage slot."""
+
+    def __init__(self, resolver: ContractResolver):
+        self.resolver = resolver
+
+        #: Folded call path -> gas
+        self.stacks = Counter()
+
+        #: Function -> gas spent in the function itself
+        self.functions = Counter()
+
+        #: (contract, slot) -> gas of SLOAD and SSTORE
+        self.storage = Counter()
+
+        self.transactions = 0
+
+        #: Gas of the profiled transactions as the chain charged it
+        self.gas_used = 0
+
+    def charge(self, frame: Frame, gas: int):
+        step = frame.step
+        self.stacks[frame.path] += gas
+        self.functions[frame.function] += gas
+        if step.op in STORAGE_OPS:
+            self.storage[(frame.storage_name, "0x{:x}".format(step.stack[-1]))] += gas
+        frame.total += gas
+
+    def start_frame(self, parent: Optional[Frame], to: Optional[str], root: Optional[str]) -> Frame:
+        if parent is None:
+            address = to
+            call = "CREATE" if not to else "CALL"
+            prefix = root
+        else:
+            call = parent.step.op
+            address = to_address(parent.step.stack[-2]) if call in CALL_OPS else None
+            prefix = parent.path
+
+        contract = self.resolver.resolve(address) if address else None
+        if address is None:
+            name = "[create]"
+        else:
+            name = contract.name if contract else address
+
+        if parent and call in ("DELEGATECALL", "CALLCODE"):
+            storage_name = parent.storage_name
+        else:
+            storage_name = name
+        return Frame(contract, name, storage_name, prefix)
+
+    def end_frame(self, frames: List[Frame]):
+        frame = frames.pop()
+        if frame.step:
+            step = frame.step
+            self.charge(frame, step.gas_cost if step.gas_cost is not None else STATIC_FEES.get(step.op, 0))
+        if frames:
+            frames[-1].children_gas += frame.total
+            frames[-1].total += frame.total
+
+    def add_transaction(self, steps: Iterable[Step], to: Optional[str], gas_used: int, intrinsic_gas: int, root: Optional[str]=None):
+        """Charge the steps of one transaction.
+
+        :param to: Called contract, None for contract creation
+        :param gas_used: Gas used as in the receipt
+        :param root: Label for the bottom of the call paths, e.g. the test name
+        """
+        frames = []
+        for step in steps:
+            while len(frames) > step.depth:
+                self.end_frame(frames)
+
+            if len(frames) < step.depth:
+                frames.append(self.start_frame(frames[-1] if frames else None, to, root))
+            else:
+                frame = frames[-1]
+                self.charge(frame, frame.step.gas - step.gas - frame.children_gas)
+                frame.children_gas = 0
+            frames[-1].enter(step)
+
+        while frames:
+            self.end_frame(frames)
+
+        self.stacks[";".join(filter(None, [root, INTRINSIC]))] += intrinsic_gas
+        self.transactions += 1
+        self.gas_used += gas_used
+
+    def write_folded(self, out):
+        """Call paths in the folded format of flamegraph.pl."""
+        for path, gas in sorted(self.stacks.items()):
+            if gas > 0:
+                out.write("{} {}\n".format(path, gas))
+
+    def as_dict(self) -> dict:
+        return {
+            "transactions": self.transactions,
+            "gas_used": self.gas_used,
+            "functions": dict(self.functions.most_common()),
+            "storage": ["{} {} {}".format(contract, slot, gas) for (contract, slot), gas in self.storage.most_common()],
+        }
+
+
+def get_intrinsic_gas(data: bytes, create: bool) -> int:
+    """Gas charged for a transaction before its code runs."""
+    zero_bytes = data.count(0)
+    gas = opcodes.GTXCOST + zero_bytes * opcodes.GTXDATAZERO + (len(data) - zero_bytes) * opcodes.GTXDATANONZERO
+    if create:
+        gas += opcodes.CREATE[3]
+    return gas
+
+
+def steps_from_struct_logs(struct_logs: Iterable[dict]) -> Iterator[Step]:
+    """Steps of a geth debug_traceTransaction result."""
+    for log in struct_logs:
+        op = log["op"]
+        stack = [int(value, 16) for value in log["stack"][-2:]] if op in STACK_OPS else None
+        yield Step(log["depth"], log["pc"], op, log["gas"], log.get("gasCost"), stack)
+
+
+def trace_transaction(web3: Web3, txid: str) -> List[Step]:
+    """Opcode trace of a mined transaction from a geth node."""
+    result = batch_request(web3, [("debug_traceTransaction", [txid, {"disableStorage": True, "disableMemory": True}])])[0]
+    return list(steps_from_struct_logs(result["structLogs"]))
+
+
+def steps_from_tester_records(records: Iterable[dict]) -> Iterator[Step]:
+    """Steps of pyethereum VM trace records.
+
+    The VM tells the call depth only at the first step of a frame, so we follow
+    the frames by their step counters and exit records.
+    """
+    frames = []
+    expect_child = False
+    for record in records:
+        if record["event"] != "vm":
+            # An exit right after a call is a callee that failed before its first op or has no code
+            if expect_child:
+                expect_child = False
+            elif frames:
+                frames.pop()
+            continue
+
+        steps = record["steps"]
+        if steps == 0:
+            frames.append(0)
+        else:
+            # A frame can end without an exit record, e.g. on SUICIDE
+            while len(frames) > 1 and frames[-1] + 1 != steps:
+                frames.pop()
+            frames[-1] = steps
+
+        op = record["op"]
+        expect_child = op in CALL_OPS or op in CREATE_OPS
+        stack = [int(value) for value in record["stack"][-2:]] if op in STACK_OPS else None
+        yield Step(len(frames), int(record["pc"]), op, int(record["gas"]), None, stack)
+
+
+def decode_tester_hex(value) -> str:
+    if isinstance(value, bytes):
+        value = value.decode("ascii")
+    return "0x" + value.replace("0x", "", 1)
+
+
+class TesterTraceRecorder(logging.Handler):
+    """Collects pyethereum VM trace records of each transaction."""
+
+    def __init__(self):
+        super(TesterTraceRecorder, self).__init__(level=slogging.TRACE)
+
+        #: List of dicts with tx, records, and gas_used when applied
+        self.transactions = []
+
+    def emit(self, record):
+        event = getattr(record, "original_msg", None)
+        kwargs = dict(getattr(record, "kwargs", None) or {})
+        if event == "TX NEW":
+            self.transactions.append({"tx": kwargs["tx_dict"], "records": []})
+        elif not self.transactions:
+            return
+        elif event in ("vm", "EXIT", "EXCEPTION"):
+            kwargs["event"] = event
+            self.transactions[-1]["records"].append(kwargs)
+        elif event == "TX APPLIED":
+            trace = self.transactions[-1]
+            trace["gas_used"] = trace["tx"]["startgas"] - kwargs["gas_remained"] if kwargs["result"] else trace["tx"]["startgas"]
+        elif event == "Refunding":
+            self.transactions[-1]["gas_used"] -= kwargs["gas_refunded"]
+
+
+#: pyethereum loggers and the levels that make the VM trace opcodes
+TESTER_TRACE_LOGGERS = (
+    ("eth.vm.op", slogging.TRACE),
+    ("eth.vm.exit", slogging.TRACE),
+    ("eth.pb.tx", logging.DEBUG),
+)
+
+
+@contextmanager
+def record_tester_traces() -> Iterator[TesterTraceRecorder]:
+    """Trace all transactions and calls the tester chain runs inside the block.
+
+    Tracing makes the VM several times slower.
+    """
+    recorder = TesterTraceRecorder()
+    saved = []
+    for name, level in TESTER_TRACE_LOGGERS:
+        logger = slogging.get_logger(name)
+        saved.append((logger, logger.level, logger.propagate))
+        logger.setLevel(level)
+        logger.propagate = False
+        logger.addHandler(recorder)
+    try:
+        yield recorder
+    finally:
+        for logger, level, propagate in saved:
+            logger.removeHandler(recorder)
+            logger.setLevel(level)
+            logger.propagate = propagate
+
+
+def add_tester_transactions(web3: Web3, profile: GasProfile, recorder: TesterTraceRecorder, root: Optional[str]=None):
+    """Charge the recorded transactions that were mined. eth_call runs are skipped."""
+    for trace in recorder.transactions:
+        if "gas_used" not in trace:
+            continue
+        tx = trace["tx"]
+        txid = decode_tester_hex(tx["hash"])
+        try:
+            receipt = web3.eth.getTransactionReceipt(txid)
+        except ValueError:
+            receipt = None
+        if not receipt:
+            continue
+
+        to = decode_tester_hex(tx["to"]) if tx["to"] else None
+        data = bytes.fromhex(decode_tester_hex(tx["data"])[2:])
+        steps = steps_from_tester_records(trace["records"])
+        profile.add_transaction(steps, to, trace["gas_used"], get_intrinsic_gas(data, to is None), root)
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("gasprofile", "Gas profile")
+    group.addoption("--gas-profile", default=None, help="Profile the gas of all transactions and write the results to this folder")
+
+
+#: Profile of this test run, created on the first profiled test
+_session_profile = None
+
+
+@pytest.fixture(autouse=True)
+def gas_profile(request):
+    """Profile the transactions of each test when --gas-profile is given."""
+    global _session_profile
+
+    # Tests that do not touch the chain are not worth starting one for
+    if not request.config.getoption("--gas-profile") or not {"web3", "chain"} & set(request.fixturenames):
+        yield None
+        return
+
+    # Ask for the chain here, so that we read the receipts before the test snapshot is reverted
+    web3 = request.getfixturevalue("web3")
+    if _session_profile is None:
+        _session_profile = GasProfile(ContractResolver(web3, compile_source_maps(request.getfixturevalue("project"))))
+
+    with record_tester_traces() as recorder:
+        yield _session_profile
+
+    # Tests deploy different contracts to the same addresses, as each test starts from the same snapshot
+    _session_profile.resolver.cache.clear()
+    add_tester_transactions(web3, _session_profile, recorder, root=request.node.name)
+
+
+def write_profile(profile: GasProfile, folder: str, suffix: str=""):
+    """Write gas.folded for flamegraph.pl and gas-profile.json with functions and storage slots.
+
+    :param suffix: Added to the file names, so that parallel workers do not overwrite each other
+    """
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "gas{}.folded".format(suffix)), "wt") as out:
+        profile.write_folded(out)
+    with open(os.path.join(folder, "gas-profile{}.json".format(suffix)), "wt") as out:
+        json.dump(profile.as_dict(), out, indent=2)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    folder = config.getoption("--gas-profile")
+    if folder and _session_profile:
+        shard_id = config.getoption("--shard-id")
+        write_profile(_session_profile, folder, "" if shard_id is None else ".shard{}".format(shard_id))
+
+
+@click.command()
+@click.option('--chain', nargs=1, default="mainnet", help='Chain of a geth node with the debug API - see populus.json')
+@click.option('--tx', 'txids', multiple=True, help='Transaction hash, can be given many times', required=True)
+@click.option('--output', nargs=1, help='Folder for gas.folded and gas-profile.json', required=True)
+def main(chain, txids, output):
+    """Profile mined transactions with debug_traceTransaction."""
+
+    project = Project()
+    contracts = compile_source_maps(project)
+    with project.get_chain(chain) as c:
+        web3 = c.web3
+        profile = GasProfile(ContractResolver(web3, contracts))
+        for txid in txids:
+            tx = web3.eth.getTransaction(txid)
+            receipt = web3.eth.getTransactionReceipt(txid)
+            data = bytes.fromhex(tx["input"].replace("0x", "", 1))
+            profile.add_transaction(trace_transaction(web3, txid), tx["to"], to_int(receipt["gasUsed"]), get_intrinsic_gas(data, not tx["to"]), root=txid)
+
+    write_profile(profile, output)
+    for function, gas in profile.functions.most_common(20):
+        print("{:<60} {:>10}".format(function, gas))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Investor data files used to load MultiVault contracts."""
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from web3 import Web3
+from web3.contract import Contract
+
+from helpers.rpc import batch_call
+
+
+#: Vault amounts are loaded with this precision from the CSV decimal numbers
+AMOUNT_PRECISION = 1000000000
+
+
+#: One parsed line of investor CSV data
+InvestorRow = NamedTuple("InvestorRow", [("line", int), ("address", str), ("amount", int)])
+
+
+def read_investor_data(fname: str) -> Iterator[InvestorRow]:
+    """Stream address, amount rows from an investor CSV file.
+
+    The file has no header. Each line is ``address,amount`` where
+    amount is a decimal number in the investor's unit (ETH, percent).
+
+    :param fname: Path to CSV file
+    :return: Iterator of parsed rows, line numbers start from 1
+    """
+
+    assert fname.endswith(".csv")
+
+    with open(fname, "rt") as inp:
+        for lineno, line in enumerate(inp, start=1):
+            if not line.strip():
+                continue
+            address, amount = line.split(",")
+            address = address.strip()
+            amount = amount.strip()
+            assert address.startswith("0x"), "Bad address on line {}: {}".format(lineno, address)
+            amount = int(float(amount) * AMOUNT_PRECISION)  # Use this precision. CHANGED
+            yield InvestorRow(lineno, address, amount)
+
+
+#: Gas estimate for the fixed part of MultiVault.addInvestors()
+ADD_INVESTORS_BASE_GAS = 60000
+
+#: Gas estimate for each new investor in MultiVault.addInvestors(), including calldata
+ADD_INVESTORS_PER_INVESTOR_GAS = 75000
+
+
+def estimate_page_gas(count: int, base_gas: int=ADD_INVESTORS_BASE_GAS, per_investor_gas: int=ADD_INVESTORS_PER_INVESTOR_GAS) -> int:
+    """Gas limit to give for an addInvestors() call with count investors."""
+    return base_gas + count * per_investor_gas
+
+
+def paginate_investor_rows(rows: Iterable[InvestorRow], max_gas: int=4000000, base_gas: int=ADD_INVESTORS_BASE_GAS, per_investor_gas: int=ADD_INVESTORS_PER_INVESTOR_GAS) -> Iterator[List[InvestorRow]]:
+    """Split investor rows to pages that each fit in one addInvestors() transaction.
+
+    :param max_gas: Gas limit for a single page transaction. Keep it well below the block gas limit so that the transaction gets mined.
+    :return: Iterator of row lists
+    """
+    page_size = (max_gas - base_gas) // per_investor_gas
+    if page_size < 1:
+        raise ValueError("max_gas {} does not fit even a single investor".format(max_gas))
+
+    page = []
+    for row in rows:
+        page.append(row)
+        if len(page) == page_size:
+            yield page
+            page = []
+
+    if page:
+        yield page
+
+
+#: Investor data compared against a vault state
+Reconciliation = NamedTuple("Reconciliation", [
+    ("block_number", int),
+    ("missing", List[InvestorRow]),
+    ("matching", List[InvestorRow]),
+    ("mismatched", List[Tuple[InvestorRow, int]]),
+])
+
+
+def reconcile_vault(web3: Web3, contract: Contract, rows: Iterable[InvestorRow], block_identifier: Optional[int]=None) -> Reconciliation:
+    """Compare investor data against MultiVault balances before sending anything.
+
+    All balances are read in batched JSON-RPC calls pinned to a single block.
+
+    - missing: rows that have no balance in the vault and must be sent
+
+    - matching: rows already loaded with the same amount
+
+    - mismatched: rows loaded with a different amount, with the on-chain amount.
+      These cannot be fixed by re-running the import, as the vault rejects loading an investor twice.
+
+    :param block_identifier: Block number to read balances at, defaults to the current block
+    """
+
+    if block_identifier is None:
+        block_identifier = web3.eth.blockNumber
+
+    rows = list(rows)
+    balances = batch_call(web3, contract, "balances", [[row.address] for row in rows], block_identifier=block_identifier)
+
+    missing = []
+    matching = []
+    mismatched = []
+    for row, balance in zip(rows, balances):
+        if balance == 0:
+            missing.append(row)
+        elif balance == row.amount:
+            matching.append(row)
+        else:
+            mismatched.append((row, balance))
+
+    return Reconciliation(block_identifier, missing, matching, mismatched)
+
+
+def format_reconciliation(reconciliation: Reconciliation) -> str:
+    """Human readable report of the reconciliation diff."""
+    lines = [
+        "At block {}: {} missing, {} matching, {} mismatched".format(
+            reconciliation.block_number,
+            len(reconciliation.missing),
+            len(reconciliation.matching),
+            len(reconciliation.mismatched))
+    ]
+    for row in reconciliation.missing:
+        lines.append("+ line {} {} {}".format(row.line, row.address, row.amount))
+    for row, balance in reconciliation.mismatched:
+        lines.append("! line {} {} csv:{} vault:{}".format(row.line, row.address, row.amount, balance))
+    return "\n".join(lines)
@@ -0,0 +1,375 @@
+"""Crowdsale load simulator, rehearse the sale opening spike on a local chain.
+
+``test_deploy_all`` has a handful of buyers. Here a generated population of
+thousands of buyers is replayed against a fresh deployment
+
+- whitelisted early participants buy before the sale starts
+
+- ``PreICOProxyBuyer`` investors pool their money before the start, and the pool buys with ``buyForEverybody()`` at the start
+
+- retail buyers call ``buy()`` and ``buyWithCustomerId()`` from many threads at once
+
+Purchase sizes are scaled so that the traffic goes through the soft cap trigger,
+and the ``endsAt`` shortening, and by default over the hard cap. Each buyer is a
+private key imported to the node, so every purchase comes from its own account::
+
+    PYTHONPATH=.:ico python -m helpers.loadsim --chain tester --buyers 2000 --workers 16 --output loadsim.json
+
+The report has transactions per second and latency percentiles per phase, failed
+purchases and how many of them hit the hard cap, and the final ``tokensSold``
+compared with the offline pricing model replayed over the mined purchase order.
+
+The chain must support ``testing_timeTravel`` and the ``personal`` API, like the populus tester and testrpc chains.
+"""
+import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Callable, Dict, List, NamedTuple
+
+import click
+import numpy as np
+from eth_utils import decode_hex, encode_hex, keccak, to_wei
+from ethereum.tester import TransactionFailed
+from ethereum.utils import privtoaddr
+from populus import Project
+from web3 import Web3
+from web3.contract import Contract
+from web3.testing import Testing
+
+from ico.definition import load_crowdsale_definitions
+
+from helpers.bulksend import STATUS_ERROR, STATUS_FAILED, STATUS_SUCCESS, STATUS_TIMEOUT
+from helpers.deploy_dag import deploy_dag
+from helpers.pricing_model import MysteriumPricingModel
+from helpers.receipts import ReceiptWaiter, TransactionThrew, confirm_transactions
+from helpers.rpc import serialize_requests, to_int
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Buyer kinds
+KIND_EARLY = "early"
+KIND_PROXY = "proxy"
+KIND_CUSTOMER_ID = "customer_id"
+KIND_RETAIL = "retail"
+
+#: Gas limit of each purchase, high enough for the soft cap trigger
+PURCHASE_GAS = 400000
+
+#: Passphrase of the imported buyer accounts
+BUYER_PASSPHRASE = "loadsim"
+
+#: Seconds the buyer accounts stay unlocked
+UNLOCK_DURATION = 24 * 3600
+
+#: The deployment the buyers are replayed against
+DEFAULT_DEPLOYMENT_FILE = "crowdsales/mysterium-testrpc.yml"
+DEFAULT_DEPLOYMENT_NAME = "kovan"
+
+#: Latency percentiles reported
+PERCENTILES = (50, 90, 99)
+
+
+Buyer = NamedTuple("Buyer", [
+    ("kind", str),
+    ("private_key", str),
+    ("address", str),
+    ("value", int),
+    ("customer_id", int),
+])
+
+
+class Purchase:
+    """One purchase transaction and what happened to it."""
+
+    def __init__(self, kind: str, address: str, value: int):
+        self.kind = kind
+        self.address = address
+
+        #: Wei invested
+        self.value = value
+
+        self.txid = None
+
+        #: One of bulksend STATUS_ constants
+        self.status = None
+
+        #: Error message of a failed or refused purchase
+        self.error = None
+
+        #: Seconds from sending to the receipt
+        self.latency = None
+
+        self.gas_used = None
+        self.block_number = None
+        self.transaction_index = None
+
+    def __repr__(self):
+        return "<Purchase {} {} value:{} status:{}>".format(self.kind, self.address, self.value, self.status)
+
+
+def get_buyer_key(seed: int, index: int) -> str:
+    """Deterministic private key, so that reruns against the same node reuse the accounts."""
+    return encode_hex(keccak("loadsim:{}:{}".format(seed, index).encode("utf-8")))[2:]
+
+
+def generate_population(count: int, total_value: int, seed: int=1, early_share: float=0.02, proxy_share: float=0.05, customer_id_share: float=0.2, sigma: float=1.5, min_value: int=to_wei(0.1, "ether")) -> List[Buyer]:
+    """Buyers with log-normally distributed purchase sizes.
+
+    :param total_value: Wei all the buyers invest together, e.g. the hard cap times the oversubscription
+    :param sigma: Spread of the purchase sizes, a few whales and a long tail of small buyers
+    :return: Buyers in a random order
+    """
+    rand = random.Random(seed)
+    weights = [rand.lognormvariate(0, sigma) for i in range(count)]
+    scale = total_value / sum(weights)
+
+    early = int(count * early_share)
+    proxy = int(count * proxy_share)
+    customer_id = int(count * customer_id_share)
+    kinds = [KIND_EARLY] * early + [KIND_PROXY] * proxy + [KIND_CUSTOMER_ID] * customer_id
+    kinds += [KIND_RETAIL] * (count - len(kinds))
+    rand.shuffle(kinds)
+
+    buyers = []
+    for index, (kind, weight) in enumerate(zip(kinds, weights)):
+        key = get_buyer_key(seed, index)
+        address = encode_hex(privtoaddr(decode_hex(key)))
+        # buyWithCustomerId() throws on zero
+        customer_id = rand.getrandbits(128) | 1 if kind == KIND_CUSTOMER_ID else 0
+        buyers.append(Buyer(kind, key, address, max(min_value, int(weight * scale)), customer_id))
+    return buyers
+
+
+def prepare_buyers(web3: Web3, funder: str, buyers: List[Buyer], timeout: float=600):
+    """Import and unlock the buyer accounts and send them their purchase money and gas."""
+    for buyer in buyers:
+        try:
+            web3.personal.importRawKey(buyer.private_key, BUYER_PASSPHRASE)
+        except ValueError:
+            # Known from an earlier run
+            pass
+        web3.personal.unlockAccount(buyer.address, BUYER_PASSPHRASE, UNLOCK_DURATION)
+
+    gas_price = web3.eth.gasPrice
+    txids = [web3.eth.sendTransaction({"from": funder, "to": buyer.address, "value": buyer.value + PURCHASE_GAS * gas_price}) for buyer in buyers]
+    confirm_transactions(web3, txids, timeout=timeout)
+    logger.info("Funded %d buyers", len(buyers))
+
+
+def drive(purchases: List[Purchase], send: Callable[[Purchase], str], waiter: ReceiptWaiter, workers: int, timeout: float) -> float:
+    """Send purchases from a pool of threads, each waiting for its receipt before taking the next one.
+
+    :param send: Broadcasts a purchase, returns txid
+    :return: Seconds the phase took
+    """
+
+    def run(purchase: Purchase):
+        started = time.time()
+        try:
+            purchase.txid = send(purchase)
+            future = waiter.watch(purchase.txid)
+            try:
+                receipt = future.result(timeout)
+            except TimeoutError:
+                waiter.forget([purchase.txid])
+                purchase.status = STATUS_TIMEOUT
+                return
+            purchase.status = STATUS_SUCCESS
+        except TransactionThrew as e:
+            receipt = e.receipt
+            purchase.status = STATUS_FAILED
+            purchase.error = str(e)
+        except TransactionFailed as e:
+            # The tester chain refuses a throwing transaction when it is sent
+            purchase.status = STATUS_FAILED
+            purchase.error = str(e) or "Transaction failed"
+            return
+        except Exception as e:
+            # Anything else the node or provider throws at us, a lost purchase must still be counted
+            logger.warning("Purchase %s failed: %r", purchase, e)
+            purchase.status = STATUS_ERROR
+            purchase.error = str(e) or e.__class__.__name__
+            return
+        finally:
+            purchase.latency = time.time() - started
+
+        purchase.gas_used = to_int(receipt["gasUsed"])
+        purchase.block_number = to_int(receipt["blockNumber"])
+        purchase.transaction_index = to_int(receipt["transactionIndex"])
+
+    started = time.time()
+    # The tester chain takes the buyer threads one request at a time
+    with serialize_requests(waiter.web3), ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(run, purchases))
+    return time.time() - started
+
+
+def get_phase_stats(purchases: List[Purchase], duration: float) -> dict:
+    """Throughput, latency and outcomes of one phase."""
+    processed = [p for p in purchases if p.status in (STATUS_SUCCESS, STATUS_FAILED)]
+    latencies = [p.latency for p in processed]
+    stats = {
+        "transactions": len(purchases),
+        "succeeded": sum(1 for p in purchases if p.status == STATUS_SUCCESS),
+        "failed": sum(1 for p in purchases if p.status == STATUS_FAILED),
+        "errors": sum(1 for p in purchases if p.status in (STATUS_ERROR, STATUS_TIMEOUT)),
+        "duration": duration,
+        "tps": len(processed) / duration if duration else 0,
+        "latency": {},
+    }
+    if latencies:
+        for percentile, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+            stats["latency"]["p{}".format(percentile)] = float(value)
+        stats["latency"]["max"] = max(latencies)
+    return stats
+
+
+def replay_pricing(model: MysteriumPricingModel, purchases: List[Purchase]) -> dict:
+    """What the sale should look like after the successful purchases in their mined order.
+
+    :return: Expected weiRaised, tokensSold and the purchase that triggers the soft cap
+    """
+    soft_cap = model.get_soft_cap_in_weis()
+    wei_raised = tokens_sold = 0
+    trigger = None
+    mined = sorted((p for p in purchases if p.status == STATUS_SUCCESS), key=lambda p: (p.block_number, p.transaction_index))
+    for purchase in mined:
+        tokens_sold += model.calculate_price(purchase.value, wei_raised)
+        wei_raised += purchase.value
+        if trigger is None and wei_raised > soft_cap:
+            trigger = purchase
+    return {"wei_raised": wei_raised, "tokens_sold": tokens_sold, "soft_cap_trigger": trigger}
+
+
+def simulate(web3: Web3, chain, contracts: Dict[str, Contract], owner: str, funder: str, buyers: List[Buyer], workers: int=16, timeout: float=600, poll_interval: float=0.05) -> dict:
+    """Replay the buyers against a deployed crowdsale that has not started yet.
+
+    :param chain: Populus chain for deploying the proxy buyer
+    :param owner: Owner of the crowdsale
+    :param funder: Account paying the buyers
+    :return: Report dict
+    """
+    crowdsale = contracts["crowdsale"]
+    pricing = contracts["pricing_strategy"]
+    waiter = ReceiptWaiter(web3, poll_interval=poll_interval)
+    by_kind = {kind: [b for b in buyers if b.kind == kind] for kind in (KIND_EARLY, KIND_PROXY, KIND_CUSTOMER_ID, KIND_RETAIL)}
+
+    prepare_buyers(web3, funder, buyers, timeout)
+    txids = [crowdsale.transact({"from": owner}).setEarlyParicipantWhitelist(b.address, True) for b in by_kind[KIND_EARLY]]
+    confirm_transactions(web3, txids, timeout=timeout)
+
+    proxy_buyer = None
+    if by_kind[KIND_PROXY]:
+        proxy_buyer, txid = chain.provider.deploy_contract("PreICOProxyBuyer", deploy_args=[owner, crowdsale.call().endsAt(), 1], deploy_transaction={"from": owner})
+        confirm_transactions(web3, [proxy_buyer.transact({"from": owner}).setCrowdsale(crowdsale.address)], timeout=timeout)
+
+    buyers_by_address = {b.address: b for b in buyers}
+
+    def send(purchase: Purchase) -> str:
+        buyer = buyers_by_address[purchase.address]
+        tx = {"from": buyer.address, "value": buyer.value, "gas": PURCHASE_GAS}
+        if buyer.kind == KIND_PROXY:
+            return proxy_buyer.transact(tx).invest()
+        elif buyer.kind == KIND_CUSTOMER_ID:
+            return crowdsale.transact(tx).buyWithCustomerId(buyer.customer_id)
+        return crowdsale.transact(tx).buy()
+
+    presale = [Purchase(b.kind, b.address, b.value) for b in buyers if b.kind in (KIND_EARLY, KIND_PROXY)]
+    presale_duration = drive(presale, send, waiter, workers, timeout)
+
+    Testing(web3).timeTravel(crowdsale.call().startsAt() + 1)
+    model = MysteriumPricingModel.from_contract(pricing)
+    ends_at_before = crowdsale.call().endsAt()
+
+    purchases = [p for p in presale if p.kind == KIND_EARLY]
+    if proxy_buyer:
+        pool = Purchase(KIND_PROXY, proxy_buyer.address, 0)
+        drive([pool], lambda p: proxy_buyer.transact({"from": owner, "gas": PURCHASE_GAS}).buyForEverybody(), waiter, 1, timeout)
+        pool.value = crowdsale.call().investedAmountOf(proxy_buyer.address)
+        purchases.append(pool)
+
+    spike = [Purchase(b.kind, b.address, b.value) for b in buyers if b.kind in (KIND_CUSTOMER_ID, KIND_RETAIL)]
+    spike_duration = drive(spike, send, waiter, workers, timeout)
+    purchases += spike
+
+    expected = replay_pricing(model, purchases)
+    wei_raised = crowdsale.call().weiRaised()
+    hard_cap = crowdsale.call().getHardCap()
+    failed = [p for p in purchases if p.status == STATUS_FAILED]
+
+    trigger = expected["soft_cap_trigger"]
+    expected_ends_at = web3.eth.getBlock(trigger.block_number)["timestamp"] + 3 * 24 * 3600 if trigger else ends_at_before
+
+    return {
+        "buyers": {kind: len(kind_buyers) for kind, kind_buyers in by_kind.items()},
+        "phases": {
+            "presale": get_phase_stats(presale, presale_duration),
+            "spike": get_phase_stats(spike, spike_duration),
+        },
+        "failed": len(failed),
+        # weiRaised only grows, so a purchase that broke the cap breaks it against the final total too
+        "cap_rejections": sum(1 for p in failed if wei_raised + p.value > hard_cap),
+        "soft_cap_triggered": crowdsale.call().softCapTriggered(),
+        "expected_soft_cap_triggered": trigger is not None,
+        "ends_at_before": ends_at_before,
+        "ends_at": crowdsale.call().endsAt(),
+        "expected_ends_at": expected_ends_at,
+        "hard_cap": hard_cap,
+        "wei_raised": wei_raised,
+        "expected_wei_raised": expected["wei_raised"],
+        "tokens_sold": crowdsale.call().tokensSold(),
+        "expected_tokens_sold": expected["tokens_sold"],
+        "investor_count": crowdsale.call().investorCount(),
+    }
+
+
+def print_report(report: dict, out=None):
+    print("Buyers: {}".format(", ".join("{} {}".format(count, kind) for kind, count in sorted(report["buyers"].items()))), file=out)
+    for name, stats in sorted(report["phases"].items()):
+        latency = " ".join("{} {:.3f}s".format(key, value) for key, value in sorted(stats["latency"].items()))
+        print("{:<8} {} tx, {} ok, {} failed, {} errors, {:.1f} tx/s, latency {}".format(
+            name, stats["transactions"], stats["succeeded"], stats["failed"], stats["errors"], stats["tps"], latency), file=out)
+    print("Failed purchases {}, of which over the hard cap {}".format(report["failed"], report["cap_rejections"]), file=out)
+    print("Soft cap triggered {}, endsAt {} -> {}, expected {}".format(report["soft_cap_triggered"], report["ends_at_before"], report["ends_at"], report["expected_ends_at"]), file=out)
+    print("weiRaised {}, expected {}".format(report["wei_raised"], report["expected_wei_raised"]), file=out)
+    print("tokensSold {}, expected {}".format(report["tokens_sold"], report["expected_tokens_sold"]), file=out)
+
+
+@click.command()
+@click.option('--chain', nargs=1, default="tester", help='On which chain to simulate - see populus.json')
+@click.option('--address', nargs=1, help='Account to deploy from and fund the buyers, the coinbase by default', default=None)
+@click.option('--deployment-file', nargs=1, default=DEFAULT_DEPLOYMENT_FILE, help='YAML file definining the crowdsale')
+@click.option('--deployment-name', nargs=1, default=DEFAULT_DEPLOYMENT_NAME, help='YAML section name we are deploying')
+@click.option('--buyers', nargs=1, type=int, default=2000, help='How many buyers')
+@click.option('--workers', nargs=1, type=int, default=16, help='How many buyers send at the same time')
+@click.option('--oversubscription', nargs=1, type=float, default=1.2, help='Total demand as a multiple of the hard cap')
+@click.option('--seed', nargs=1, type=int, default=1, help='Random seed of the population')
+@click.option('--output', nargs=1, help='Write the report as JSON here', default=None)
+def main(chain, address, deployment_file, deployment_name, buyers, workers, oversubscription, seed, output):
+    """Replay a buyer population against a fresh crowdsale deployment."""
+
+    logging.basicConfig(level=logging.INFO)
+    project = Project()
+    chain_data = load_crowdsale_definitions(deployment_file, deployment_name)
+
+    with project.get_chain(chain) as c:
+        web3 = c.web3
+        address = address or web3.eth.coinbase
+        runtime_data, statistics, contracts = deploy_dag(c, chain_data, address)
+
+        hard_cap = contracts["crowdsale"].call().getHardCap()
+        population = generate_population(buyers, int(hard_cap * oversubscription), seed=seed)
+        report = simulate(web3, c, contracts, address, address, population, workers=workers)
+
+    print_report(report)
+    if output:
+        with open(output, "wt") as out:
+            json.dump(report, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
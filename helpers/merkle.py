@@ -0,0 +1,186 @@
+"""Offline Merkle tree builder for MerkleMultiVault.
+
+The tree leaves are ``sha3(investor, balance)`` packed as Solidity does
+(20 bytes address + 32 bytes uint). Pairs are hashed in sorted order, so a proof
+is a flat list of sibling hashes. A node without a sibling is moved up a level as is.
+
+Build the tree from an investor CSV, cache it on disk and export per address proofs::
+
+    proofs = build_from_csv("seed_investor_data.csv", cache_dir="build/merkle")
+    print(proofs.root_hex, proofs.total)
+    proofs.export_json("seed-proofs.json")
+
+"""
+import hashlib
+import json
+import os
+from typing import Iterable, List, Optional
+
+from eth_utils import decode_hex, encode_hex, keccak
+
+from helpers.investors import InvestorRow, read_investor_data
+
+
+def leaf_hash(address: str, balance: int) -> bytes:
+    """Hash investor data the same way as MerkleMultiVault.isValidProof()."""
+    address_bytes = decode_hex(address)
+    assert len(address_bytes) == 20, "Bad address {}".format(address)
+    return keccak(address_bytes + balance.to_bytes(32, "big"))
+
+
+def hash_pair(a: bytes, b: bytes) -> bytes:
+    """Hash two nodes in sorted order."""
+    if a < b:
+        return keccak(a + b)
+    return keccak(b + a)
+
+
+class MerkleTree:
+    """Merkle tree of (address, balance) leaves with proof lookup."""
+
+    def __init__(self, rows: Iterable[InvestorRow]):
+        """Build the tree.
+
+        :param rows: Investor rows, an address may appear only once
+        """
+
+        #: address (lowercase) -> (leaf index, balance)
+        self.index = {}
+        leaves = []
+        self.total = 0
+
+        for row in rows:
+            address = row.address.lower()
+            if address in self.index:
+                raise ValueError("Investor {} appears twice, line {}".format(row.address, row.line))
+            if row.amount <= 0:
+                raise ValueError("Investor {} has no balance, line {}".format(row.address, row.line))
+            self.index[address] = (len(leaves), row.amount)
+            leaves.append(leaf_hash(address, row.amount))
+            self.total += row.amount
+
+        if not leaves:
+            raise ValueError("Cannot build a tree without investors")
+
+        #: Tree levels, leaves first, root last
+        self.levels = [leaves]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            parent = [hash_pair(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                parent.append(level[-1])
+            self.levels.append(parent)
+
+    @property
+    def root(self) -> bytes:
+        return self.levels[-1][0]
+
+    @property
+    def root_hex(self) -> str:
+        return encode_hex(self.root)
+
+    def get_balance(self, address: str) -> int:
+        return self.index[address.lower()][1]
+
+    def get_proof(self, address: str) -> List[bytes]:
+        """Sibling hashes from the leaf to the root."""
+        idx, balance = self.index[address.lower()]
+        proof = []
+        for level in self.levels[:-1]:
+            sibling = idx ^ 1
+            if sibling < len(level):
+                proof.append(level[sibling])
+            idx //= 2
+        return proof
+
+    def get_proof_hex(self, address: str) -> List[str]:
+        return [encode_hex(node) for node in self.get_proof(address)]
+
+    def verify(self, address: str, balance: int, proof: List[bytes]) -> bool:
+        """Python version of MerkleMultiVault.isValidProof()."""
+        node = leaf_hash(address, balance)
+        for sibling in proof:
+            node = hash_pair(node, sibling)
+        return node == self.root
+
+    def to_dict(self) -> dict:
+        """Serialize root, total and all proofs."""
+        return {
+            "root": self.root_hex,
+            "total": self.total,
+            "investors": {
+                address: {"balance": balance, "proof": self.get_proof_hex(address)}
+                for address, (idx, balance) in self.index.items()
+            }
+        }
+
+    def export_json(self, fname: str):
+        """Write the proofs for a claim web page or a script."""
+        with open(fname, "wt") as out:
+            json.dump(self.to_dict(), out, indent=2, sort_keys=True)
+
+
+class CachedProofs:
+    """Root, total and proofs of a built tree in the exported JSON form, loads back without rebuilding the tree."""
+
+    def __init__(self, data: dict):
+        self.root_hex = data["root"]
+        self.total = data["total"]
+        self.investors = data["investors"]
+
+    @classmethod
+    def load(cls, fname: str) -> "CachedProofs":
+        with open(fname, "rt") as inp:
+            return cls(json.load(inp))
+
+    @property
+    def root(self) -> bytes:
+        return decode_hex(self.root_hex)
+
+    def get_balance(self, address: str) -> int:
+        return self.investors[address.lower()]["balance"]
+
+    def get_proof(self, address: str) -> List[bytes]:
+        return [decode_hex(node) for node in self.get_proof_hex(address)]
+
+    def get_proof_hex(self, address: str) -> List[str]:
+        return self.investors[address.lower()]["proof"]
+
+    def export_json(self, fname: str):
+        with open(fname, "wt") as out:
+            json.dump({"root": self.root_hex, "total": self.total, "investors": self.investors}, out, indent=2, sort_keys=True)
+
+
+def hash_file(fname: str) -> str:
+    """Content hash used as the cache key."""
+    digest = hashlib.sha256()
+    with open(fname, "rb") as inp:
+        for chunk in iter(lambda: inp.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_from_csv(fname: str, cache_dir: Optional[str]=None) -> CachedProofs:
+    """Build the tree from an investor CSV.
+
+    If ``cache_dir`` is given, the proofs are stored there keyed by the CSV content hash
+    and a later call with unchanged data loads them from the disk.
+
+    :return: Root, total and proofs, the same whether built now or loaded from the cache
+    """
+
+    cache_file = None
+    if cache_dir:
+        cache_file = os.path.join(cache_dir, "{}.json".format(hash_file(fname)))
+        if os.path.exists(cache_file):
+            return CachedProofs.load(cache_file)
+
+    proofs = CachedProofs(MerkleTree(read_investor_data(fname)).to_dict())
+
+    if cache_file:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = "{}.{}.tmp".format(cache_file, os.getpid())
+        proofs.export_json(tmp)
+        os.replace(tmp, cache_file)
+
+    return proofs
@@ -0,0 +1,273 @@
+"""Compare solc optimizer settings by deploy cost, runtime gas and bytecode size.
+
+``populus.json`` compiles with the optimizer on and the default runs. Here the
+contracts are compiled once per setting of a matrix, and for each setting
+
+- the full ``mysterium-testrpc.yml`` world is deployed on a fresh tester chain
+
+- a fixed crowdsale scenario is replayed, the same timeline as ``test_deploy_all``
+
+and the gas and code sizes are collected to one report::
+
+    PYTHONPATH=.:ico python -m helpers.optimizer_matrix --runs 1,200,1000,10000 --output optimizer-matrix.json
+
+More runs make the code larger and more expensive to deploy, but cheaper to call.
+"""
+import json
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import click
+from eth_utils import to_wei
+from populus import Project
+from solc.wrapper import solc_wrapper
+from web3 import Web3
+from web3.contract import Contract
+from web3.testing import Testing
+
+from ico.definition import load_crowdsale_definitions
+
+from helpers.deploy_dag import deploy_dag
+from helpers.gasprofile import get_source_files
+from helpers.rpc import get_receipts, to_int
+from helpers.verify import split_metadata
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Default optimizer runs to compare, the optimizer off is always included
+DEFAULT_RUNS = (1, 200, 1000, 10000)
+
+#: The deployment compared
+DEFAULT_DEPLOYMENT_FILE = "crowdsales/mysterium-testrpc.yml"
+DEFAULT_DEPLOYMENT_NAME = "kovan"
+
+
+def get_matrix(runs: Iterable[int]) -> List[dict]:
+    """Optimizer settings to compare, the optimizer off first."""
+    return [{"optimize": False}] + [{"optimize": True, "optimize_runs": r} for r in runs]
+
+
+def get_setting_name(setting: dict) -> str:
+    if not setting["optimize"]:
+        return "no-optimizer"
+    return "runs-{}".format(setting["optimize_runs"])
+
+
+def compile_contracts(project: Project, setting: dict) -> Dict[str, dict]:
+    """Compile the project contracts with an optimizer setting.
+
+    :return: Compiled contract data by contract name, the same fields as populus gives
+    """
+    settings = project.config.get("compilation.settings", {})
+    kwargs = {}
+    if setting["optimize"]:
+        kwargs["optimize"] = True
+        kwargs["optimize_runs"] = setting["optimize_runs"]
+
+    stdoutdata, stderrdata, command, proc = solc_wrapper(
+        source_files=get_source_files(project),
+        combined_json="abi,bin,bin-runtime",
+        import_remappings=settings.get("import_remappings"),
+        allow_paths=project.project_dir,
+        **kwargs)
+    output = json.loads(stdoutdata)
+
+    compiled = {}
+    for key, data in output["contracts"].items():
+        name = key.rpartition(":")[2]
+        compiled[name] = {
+            "abi": json.loads(data["abi"]),
+            "bytecode": "0x" + data["bin"],
+            "bytecode_runtime": "0x" + data["bin-runtime"],
+        }
+    return compiled
+
+
+class CompiledProject(Project):
+    """Populus project that uses the given compiled contracts instead of compiling with the populus.json settings."""
+
+    def __init__(self, compiled: Dict[str, dict], *args, **kwargs):
+        super(CompiledProject, self).__init__(*args, **kwargs)
+        self._matrix_compiled = compiled
+
+    @property
+    def compiled_contract_data(self):
+        return self._matrix_compiled
+
+    @property
+    def compiled_contracts(self):
+        return self._matrix_compiled
+
+
+def get_code_sizes(compiled: Dict[str, dict], contract_names: Iterable[str]) -> Dict[str, dict]:
+    """Init and runtime code bytes, without the metadata hash."""
+    sizes = OrderedDict()
+    for name in sorted(set(contract_names)):
+        data = compiled[name]
+        sizes[name] = {
+            "init": len(split_metadata(data["bytecode"])[0]) // 2,
+            "runtime": len(split_metadata(data["bytecode_runtime"])[0]) // 2,
+        }
+    return sizes
+
+
+def get_deploy_gas(web3: Web3, start_block: int, end_block: int, runtime_data: dict) -> Dict[str, int]:
+    """Gas of the contract creations and post actions between two blocks."""
+    names = {data["address"].lower(): name for name, data in runtime_data["contracts"].items()}
+
+    txids = []
+    for block_number in range(start_block + 1, end_block + 1):
+        txids += web3.eth.getBlock(block_number)["transactions"]
+    receipts = get_receipts(web3, txids)
+
+    gas = OrderedDict()
+    gas["total"] = 0
+    gas["post_actions"] = 0
+    for txid in txids:
+        receipt = receipts[txid]
+        gas_used = to_int(receipt["gasUsed"])
+        gas["total"] += gas_used
+        address = receipt.get("contractAddress")
+        if address:
+            name = names.get(address.lower(), "library {}".format(address))
+            gas[name] = gas_used
+        else:
+            gas["post_actions"] += gas_used
+    return gas
+
+
+class ScenarioRecorder:
+    """Sends scenario transactions and keeps the gas of each entry point."""
+
+    def __init__(self, web3: Web3):
+        self.web3 = web3
+        self.gas = OrderedDict()
+
+    def record(self, name: str, txid: str):
+        self.gas[name] = self.web3.eth.getTransactionReceipt(txid)["gasUsed"]
+
+    def time_travel(self, timestamp: int):
+        Testing(self.web3).timeTravel(timestamp)
+
+
+def run_scenario(web3: Web3, contracts: Dict[str, Contract], deploy_address: str) -> Dict[str, int]:
+    """Crowdsale timeline of test_deploy_all, with the gas of each entry point.
+
+    :return: Entry point -> gas used
+    """
+    accounts = web3.eth.accounts
+    customer, customer_2, fake_seed_investor, bitcoin_suisse = accounts[1], accounts[2], accounts[7], accounts[8]
+
+    crowdsale = contracts["crowdsale"]
+    pricing_strategy = contracts["pricing_strategy"]
+    token = contracts["token"]
+    recorder = ScenarioRecorder(web3)
+    owner = {"from": deploy_address}
+
+    recorder.record("MysteriumPricing.setConversionRate", pricing_strategy.transact(owner).setConversionRate(170 * 10000))
+    crowdsale.transact(owner).setEarlyParicipantWhitelist(bitcoin_suisse, True)
+    recorder.record("Crowdsale.buy/early_participant", crowdsale.transact({"from": bitcoin_suisse, "value": to_wei(500000 / 170, "ether")}).buy())
+
+    recorder.time_travel(crowdsale.call().startsAt() + 1)
+    recorder.record("Crowdsale.buy/below_soft_cap", crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buy())
+    recorder.record("Crowdsale.buy/returning_investor", crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buy())
+
+    one_chf_in_eth = to_wei(1 / 170, "ether")
+    recorder.record("Crowdsale.buy/trigger_soft_cap", crowdsale.transact({"from": customer_2, "value": one_chf_in_eth * 6000000}).buy())
+    assert crowdsale.call().softCapTriggered()
+    recorder.record("Crowdsale.buy/above_soft_cap", crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buy())
+
+    recorder.time_travel(crowdsale.call().endsAt() + 1)
+    recorder.record("Crowdsale.finalize", crowdsale.transact(owner).finalize())
+
+    for name in ("seed_participant_vault", "seed_participant_vault_2", "future_funding_vault", "founders_vault"):
+        recorder.record("MultiVault.fetchTokenBalance/{}".format(name), contracts[name].transact(owner).fetchTokenBalance())
+
+    recorder.time_travel(crowdsale.call().endsAt() + 14 * 24 * 3600)
+    recorder.record("IntermediateVault.unlock", contracts["intermediate_vault"].transact(owner).unlock())
+    recorder.record("CrowdsaleToken.releaseTokenTransfer", token.transact(owner).releaseTokenTransfer())
+    recorder.record("StandardToken.transfer/existing_holder", token.transact({"from": customer_2}).transfer(customer, 1 * 10**8))
+    recorder.record("StandardToken.transfer/new_holder", token.transact({"from": customer_2}).transfer(accounts[3], 1 * 10**8))
+
+    recorder.time_travel(crowdsale.call().endsAt() + 365 * 24 * 3600)
+    recorder.record("MultiVault.claimAll", contracts["seed_participant_vault"].transact({"from": fake_seed_investor}).claimAll())
+    return recorder.gas
+
+
+def run_setting(compiled: Dict[str, dict], chain_data: dict) -> dict:
+    """Deploy and replay the scenario on a fresh tester chain."""
+    project = CompiledProject(compiled)
+    with project.get_chain("tester") as chain:
+        web3 = chain.web3
+        deploy_address = web3.eth.accounts[9]
+
+        start_block = web3.eth.blockNumber
+        runtime_data, statistics, contracts = deploy_dag(chain, chain_data, deploy_address)
+        deploy_gas = get_deploy_gas(web3, start_block, web3.eth.blockNumber, runtime_data)
+
+        runtime_gas = run_scenario(web3, contracts, deploy_address)
+
+    contract_names = [data["contract_name"] for data in chain_data["contracts"].values()]
+    return {
+        "deploy_gas": deploy_gas,
+        "runtime_gas": runtime_gas,
+        "code_size": get_code_sizes(compiled, contract_names),
+    }
+
+
+def run_matrix(project: Project, chain_data: dict, matrix: List[dict]) -> OrderedDict:
+    """Compile, deploy and replay for each optimizer setting.
+
+    :return: Setting name -> results
+    """
+    results = OrderedDict()
+    for setting in matrix:
+        name = get_setting_name(setting)
+        logger.info("Compiling and deploying with %s", name)
+        compiled = compile_contracts(project, setting)
+        results[name] = dict(setting, **run_setting(compiled, chain_data))
+    return results
+
+
+def print_matrix(results: OrderedDict, out=None):
+    """Table of settings as columns and deploy gas, runtime gas and runtime code size as rows."""
+    names = list(results.keys())
+    print("{:<50}".format("") + "".join("{:>14}".format(name) for name in names), file=out)
+
+    def rows(section: str, key: Optional[str]=None):
+        first = results[names[0]][section]
+        for row in first:
+            values = [results[name][section][row] for name in names]
+            if key:
+                values = [value[key] for value in values]
+            print("{:<50}".format("{} {}".format(section, row)) + "".join("{:>14}".format(value) for value in values), file=out)
+
+    rows("deploy_gas")
+    rows("runtime_gas")
+    rows("code_size", "runtime")
+
+
+@click.command()
+@click.option('--runs', nargs=1, default=",".join(str(r) for r in DEFAULT_RUNS), help='Comma separated optimizer runs to compare, the optimizer off is always included')
+@click.option('--deployment-file', nargs=1, default=DEFAULT_DEPLOYMENT_FILE, help='YAML file definining the crowdsale')
+@click.option('--deployment-name', nargs=1, default=DEFAULT_DEPLOYMENT_NAME, help='YAML section name we are deploying')
+@click.option('--output', nargs=1, help='Write the results as JSON here', default=None)
+def main(runs, deployment_file, deployment_name, output):
+    """Benchmark solc optimizer settings on the tester chain."""
+
+    logging.basicConfig(level=logging.INFO)
+    matrix = get_matrix(int(r) for r in runs.split(",") if r)
+    chain_data = load_crowdsale_definitions(deployment_file, deployment_name)
+    results = run_matrix(Project(), chain_data, matrix)
+
+    print_matrix(results)
+    if output:
+        with open(output, "wt") as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
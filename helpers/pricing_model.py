@@ -0,0 +1,240 @@
+"""Offline models of MysteriumPricing and TieredPricing calculatePrice().
+
+Quote token amounts without a node. All arithmetic is done on Python ints
+with the same operation order and floor division as the contracts, so the
+results match ``calculatePrice`` bit for bit::
+
+    model = MysteriumPricingModel.from_contract(mysterium_pricing)
+    tokens = model.calculate_prices(values, wei_raised)
+
+:py:func:`compare_with_contract` is the differential check against a deployed contract.
+"""
+from bisect import bisect_right
+from typing import Iterable, List, Tuple
+
+import numpy as np
+from web3.contract import Contract
+
+from helpers.rpc import batch_call
+
+
+#: Largest uint256
+UINT256_MAX = 2 ** 256 - 1
+
+#: TieredPricing stores tier fields as uint128
+UINT128_MAX = 2 ** 128 - 1
+
+#: MysteriumToken decimals
+DEFAULT_DECIMALS = 8
+
+
+class ContractThrow(Exception):
+    """The contract would throw with these inputs."""
+
+
+def _check_uint(value, name: str):
+    if np.any(value < 0) or np.any(value > UINT256_MAX):
+        raise ContractThrow("{} does not fit uint256".format(name))
+
+
+def _times(a, b):
+    """SafeMathLib.times()"""
+    c = a * b
+    if np.any(c > UINT256_MAX):
+        raise ContractThrow("SafeMathLib.times() overflow")
+    return c
+
+
+def _plus(a, b):
+    """SafeMathLib.plus()"""
+    c = a + b
+    if np.any(c > UINT256_MAX):
+        raise ContractThrow("SafeMathLib.plus() overflow")
+    return c
+
+
+def _div(a, b):
+    """uint division, throws on zero like Solidity 0.4."""
+    if np.any(b == 0):
+        raise ContractThrow("Division by zero")
+    return a // b
+
+
+def _to_uint_array(value) -> np.ndarray:
+    """Python int object array of uint256 values."""
+    arr = np.asarray(value)
+    if arr.dtype.kind not in "iuO":
+        raise ValueError("Integer wei amounts expected, got {}".format(arr.dtype))
+    return arr.astype(object)
+
+
+class MysteriumPricingModel:
+    """MysteriumPricing state and its price calculation."""
+
+    def __init__(self, chf_rate: int, chf_scale: int=10000, hard_cap_price: int=12000, soft_cap_price: int=10000, soft_cap_chf: int=6000000 * 10000):
+        """Set the pricing parameters, defaults are the contract defaults.
+
+        :param chf_rate: MysteriumPricing.chfRate()
+        """
+        self.chf_rate = chf_rate
+        self.chf_scale = chf_scale
+        self.hard_cap_price = hard_cap_price
+        self.soft_cap_price = soft_cap_price
+        self.soft_cap_chf = soft_cap_chf
+
+    @classmethod
+    def from_contract(cls, pricing: Contract, block_identifier="latest") -> "MysteriumPricingModel":
+        """Read the parameters from a deployed MysteriumPricing."""
+        names = ("chfRate", "chfScale", "hardCapPrice", "softCapPrice", "softCapCHF")
+        values = [batch_call(pricing.web3, pricing, name, [[]], block_identifier=block_identifier)[0] for name in names]
+        return cls(*values)
+
+    def get_eth_chf_price(self) -> int:
+        return self.chf_rate // self.chf_scale
+
+    def convert_to_wei(self, chf: int) -> int:
+        """MysteriumPricing.convertToWei()"""
+        return _div(_times(chf, 10 ** 18), self.chf_rate)
+
+    def get_soft_cap_in_weis(self) -> int:
+        return self.convert_to_wei(self.soft_cap_chf)
+
+    def calculate_price(self, value: int, wei_raised: int, decimals: int=DEFAULT_DECIMALS) -> int:
+        """Tokens in base units for a single purchase.
+
+        :raise ContractThrow: If calculatePrice() would throw
+        """
+        return int(self.calculate_prices(np.array([value], dtype=object), np.array([wei_raised], dtype=object), decimals)[0])
+
+    def calculate_prices(self, values, wei_raised, decimals: int=DEFAULT_DECIMALS) -> np.ndarray:
+        """Tokens in base units for many purchases.
+
+        The cap thresholds and token prices only depend on the pricing parameters,
+        so they are calculated once per call and the purchases are evaluated as arrays.
+
+        :param values: Purchase values in wei, array like
+        :param wei_raised: Wei raised before each purchase, array like, broadcast against values
+        :return: Object array of Python ints
+        :raise ContractThrow: If calculatePrice() would throw for any of the purchases
+        """
+        values = _to_uint_array(values)
+        wei_raised = _to_uint_array(wei_raised)
+        _check_uint(values, "value")
+        _check_uint(wei_raised, "weiRaised")
+
+        multiplier = 10 ** decimals
+        soft_cap_in_weis = self.get_soft_cap_in_weis()
+        hard_cap_token_price = self.convert_to_wei(self.hard_cap_price)
+        soft_cap_token_price = self.convert_to_wei(self.soft_cap_price)
+
+        # The soft cap is "reached" only when strictly exceeded, as in the contract
+        price = np.where(wei_raised > soft_cap_in_weis, hard_cap_token_price, soft_cap_token_price)
+        return _div(_times(values, multiplier), price)
+
+
+class TieredPricingModel:
+    """TieredPricing state and its price calculation."""
+
+    def __init__(self, chf_rate: int, tier_limits_chf: List[int], tier_prices_chf: List[int], chf_scale: int=10000):
+        """Set the pricing parameters.
+
+        :param tier_limits_chf: Total raised where each tier ends, CHF * chf_scale, ascending. The last one is not enforced.
+        :param tier_prices_chf: Token price in each tier, CHF * chf_scale
+        """
+        if not tier_limits_chf or len(tier_limits_chf) != len(tier_prices_chf):
+            raise ContractThrow("Tier limits and prices do not match")
+
+        if any(b <= a for a, b in zip(tier_limits_chf, tier_limits_chf[1:])):
+            raise ContractThrow("Tier limits must be ascending")
+
+        if 0 in tier_prices_chf:
+            raise ContractThrow("Tier price cannot be zero")
+
+        if any(value > UINT128_MAX for value in list(tier_limits_chf) + list(tier_prices_chf)):
+            raise ContractThrow("Tier does not fit uint128")
+
+        self.chf_rate = chf_rate
+        self.chf_scale = chf_scale
+        self.tier_limits_chf = list(tier_limits_chf)
+        self.tier_prices_chf = list(tier_prices_chf)
+        self.update_wei_prices()
+
+    @classmethod
+    def from_contract(cls, pricing: Contract, block_identifier="latest") -> "TieredPricingModel":
+        """Read the parameters from a deployed TieredPricing."""
+        web3 = pricing.web3
+        chf_rate, chf_scale, count = [batch_call(web3, pricing, name, [[]], block_identifier=block_identifier)[0] for name in ("chfRate", "chfScale", "getTierCount")]
+        tiers = batch_call(web3, pricing, "tiers", [[i] for i in range(count)], block_identifier=block_identifier)
+        return cls(chf_rate, [limit for limit, price in tiers], [price for limit, price in tiers], chf_scale)
+
+    def convert_to_wei(self, chf: int) -> int:
+        """TieredPricing.convertToWei()"""
+        return _div(_times(chf, 10 ** 18), self.chf_rate)
+
+    def update_wei_prices(self):
+        """TieredPricing.updateWeiPrices(), called when the rate changes."""
+        self.tier_limits_in_wei = [self.convert_to_wei(limit) for limit in self.tier_limits_chf]
+        self.tier_prices_in_wei = [self.convert_to_wei(price) for price in self.tier_prices_chf]
+        if any(value > UINT128_MAX for value in self.tier_limits_in_wei + self.tier_prices_in_wei):
+            raise ContractThrow("Tier in wei does not fit uint128")
+
+    def get_tier_index(self, wei_raised: int) -> int:
+        """TieredPricing.getTierIndex(), the first tier whose limit is above wei_raised, or the last tier."""
+        return min(bisect_right(self.tier_limits_in_wei, wei_raised), len(self.tier_limits_in_wei) - 1)
+
+    def calculate_price(self, value: int, wei_raised: int, decimals: int=DEFAULT_DECIMALS) -> int:
+        """Tokens in base units for a single purchase, split over the tiers it crosses.
+
+        :raise ContractThrow: If calculatePrice() would throw
+        """
+        _check_uint(value, "value")
+        _check_uint(wei_raised, "weiRaised")
+
+        multiplier = 10 ** decimals
+        limits = self.tier_limits_in_wei
+        prices = self.tier_prices_in_wei
+        last_tier = len(limits) - 1
+        tier = self.get_tier_index(wei_raised)
+        tokens = 0
+
+        while tier < last_tier and _plus(wei_raised, value) > limits[tier]:
+            part = limits[tier] - wei_raised
+            tokens += _div(_times(part, multiplier), prices[tier])
+            value -= part
+            wei_raised = limits[tier]
+            tier += 1
+
+        tokens += _div(_times(value, multiplier), prices[tier])
+        _check_uint(tokens, "tokens")
+        return tokens
+
+    def calculate_prices(self, values, wei_raised, decimals: int=DEFAULT_DECIMALS) -> np.ndarray:
+        """Tokens in base units for many purchases.
+
+        :param values: Purchase values in wei, array like
+        :param wei_raised: Wei raised before each purchase, array like, broadcast against values
+        :return: Object array of Python ints
+        """
+        values, wei_raised = np.broadcast_arrays(_to_uint_array(values), _to_uint_array(wei_raised))
+        result = np.empty(values.shape, dtype=object)
+        for idx in np.ndindex(values.shape):
+            result[idx] = self.calculate_price(int(values[idx]), int(wei_raised[idx]), decimals)
+        return result
+
+
+def compare_with_contract(model, pricing: Contract, cases: Iterable[Tuple[int, int]], decimals: int=DEFAULT_DECIMALS, block_identifier="latest") -> List[Tuple[int, int, int, int]]:
+    """Differential check of the model against a deployed contract.
+
+    The contract is queried with batched eth_calls pinned to one block.
+
+    :param model: MysteriumPricingModel or TieredPricingModel
+    :param cases: (value, weiRaised) pairs, must not make the contract throw
+    :return: Mismatches as (value, weiRaised, contract tokens, model tokens)
+    """
+    cases = list(cases)
+    args_list = [[value, wei_raised, 0, "0x" + "0" * 40, decimals] for value, wei_raised in cases]
+    expected = batch_call(pricing.web3, pricing, "calculatePrice", args_list, block_identifier=block_identifier)
+
+    got = model.calculate_prices([c[0] for c in cases], [c[1] for c in cases], decimals)
+
+    return [(value, wei_raised, e, int(g)) for (value, wei_raised), e, g in zip(cases, expected, got) if e != g]
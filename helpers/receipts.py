@@ -0,0 +1,254 @@
+"""Wait for many transactions with one receipt batch per block.
+
+``check_succesful_tx`` polls the receipt of one transaction until it is mined,
+so confirming N transactions costs N requests per poll. Here all waiting
+transactions share a single poller
+
+- a block filter tells when a new block arrives, one cheap request per poll
+
+- on a new block the receipts of all pending transactions are fetched in one JSON-RPC batch
+
+- every caller waiting for a mined transaction is resolved at once
+
+Callers can wait from several threads. While the poller runs, requests to an
+in-process tester chain are serialized, see :py:func:`helpers.rpc.serialize_requests`. Example::
+
+    waiter = ReceiptWaiter(web3)
+    receipts = waiter.wait([txid1, txid2, txid3], timeout=600)
+    print("Gas used", waiter.gas_used)
+
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future, wait as wait_futures
+from contextlib import ExitStack
+from typing import Iterable, List, Optional
+
+from web3 import Web3
+
+from helpers.rpc import RPCError, batch_request, get_receipts, get_transactions, serialize_requests, to_int
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Seconds between block filter polls
+DEFAULT_POLL_INTERVAL = 1.0
+
+#: Seconds to wait for a batch of transactions, same as check_succesful_tx
+DEFAULT_TIMEOUT = 180
+
+
+class TransactionThrew(Exception):
+    """A transaction was mined, but it threw."""
+
+    def __init__(self, txid: str, receipt: dict):
+        super(TransactionThrew, self).__init__("Transaction {} failed, gas used {}".format(txid, to_int(receipt["gasUsed"])))
+        self.txid = txid
+        self.receipt = receipt
+
+
+class ReceiptTimeout(Exception):
+    """Some transactions of a batch were not mined in time."""
+
+    def __init__(self, txids: List[str], timeout: float):
+        super(ReceiptTimeout, self).__init__("{} transactions not mined in {} seconds: {}".format(len(txids), timeout, ", ".join(txids)))
+        self.txids = txids
+
+
+class ReceiptWaiter:
+    """Resolves transaction receipts for any number of waiting callers."""
+
+    def __init__(self, web3: Web3, poll_interval: float=DEFAULT_POLL_INTERVAL):
+        self.web3 = web3
+        self.poll_interval = poll_interval
+
+        #: txid -> Future resolving to the receipt
+        self.pending = {}
+
+        #: Transactions watched since the last receipt batch, they may be in a block we have already seen
+        self.fresh = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+        #: Holds the provider serialized while the poller thread runs
+        self.serialized = None
+
+        #: Block filter id, None if the node does not support filters
+        self.filter_id = None
+        self.last_block = None
+
+        #: Gas used by all transactions confirmed through this waiter
+        self.gas_used = 0
+
+        #: How many receipt batches we have fetched
+        self.batches = 0
+
+    def watch(self, txid: str) -> Future:
+        """Future for the receipt of a transaction.
+
+        The future fails with :py:class:`TransactionThrew` if the transaction threw.
+        """
+        with self.lock:
+            future = self.pending.get(txid)
+            if future is None:
+                future = self.pending[txid] = Future()
+                self.fresh.add(txid)
+            if self.thread is None:
+                # The poller thread talks to the node at the same time as the callers
+                self.serialized = ExitStack()
+                self.serialized.enter_context(serialize_requests(self.web3))
+                self.thread = threading.Thread(target=self.run, name="ReceiptWaiter", daemon=True)
+                self.thread.start()
+            return future
+
+    def forget(self, txids: Iterable[str]):
+        """Stop waiting for transactions nobody waits anymore."""
+        with self.lock:
+            for txid in txids:
+                future = self.pending.pop(txid, None)
+                if future:
+                    future.cancel()
+
+    def wait(self, txids: Iterable[str], timeout: float=DEFAULT_TIMEOUT) -> List[dict]:
+        """Wait until all the transactions are mined.
+
+        :param timeout: Seconds for the whole batch
+        :return: Receipts in the order of txids
+        :raise ReceiptTimeout: If some transactions were not mined in time
+        :raise TransactionThrew: If a transaction failed
+        """
+        txids = list(txids)
+        futures = [self.watch(txid) for txid in txids]
+        done, not_done = wait_futures(futures, timeout=timeout)
+        if not_done:
+            late = [txid for txid, future in zip(txids, futures) if not future.done()]
+            self.forget(late)
+            raise ReceiptTimeout(late, timeout)
+
+        receipts = [future.result() for future in futures]
+        gas_used = sum(to_int(receipt["gasUsed"]) for receipt in receipts)
+        logger.info("Confirmed %d transactions, gas used %d", len(receipts), gas_used)
+        return receipts
+
+    def run(self):
+        """Poller thread, runs while there are transactions to wait for."""
+        try:
+            # The transactions may be mined already
+            self.resolve()
+            while True:
+                with self.lock:
+                    if not self.pending:
+                        self.stop()
+                        return
+                if self.wait_for_block():
+                    self.resolve()
+                else:
+                    # Watched after the last batch, so a block we have already seen may hold them
+                    with self.lock:
+                        fresh = list(self.fresh)
+                    if fresh:
+                        self.resolve(fresh)
+        except Exception as e:
+            logger.exception("Receipt poller failed")
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                self.stop()
+            for future in pending.values():
+                future.set_exception(e)
+
+    def stop(self):
+        """Let the next watch() start a new poller. Called with the lock held."""
+        filter_id, self.filter_id, self.last_block = self.filter_id, None, None
+        self.thread = None
+        if filter_id is not None:
+            try:
+                batch_request(self.web3, [("eth_uninstallFilter", [filter_id])], raise_on_error=False)
+            except Exception as e:
+                logger.info("Could not uninstall block filter %s: %s", filter_id, e)
+        serialized, self.serialized = self.serialized, None
+        if serialized is not None:
+            serialized.close()
+
+    def wait_for_block(self) -> bool:
+        """Poll once for a new block.
+
+        :return: True if there is a new block
+        """
+        if self.filter_id is None and self.last_block is None:
+            try:
+                self.filter_id = batch_request(self.web3, [("eth_newBlockFilter", [])])[0]
+            except Exception as e:
+                # Nodes refuse in different ways, e.g. testrpc raises NotImplementedError in-process
+                logger.info("No block filters, falling back to block number polling: %s", e)
+                self.last_block = self.web3.eth.blockNumber
+
+        if self.filter_id is not None:
+            try:
+                new_blocks = batch_request(self.web3, [("eth_getFilterChanges", [self.filter_id])])[0]
+            except RPCError:
+                # Node forgot the filter, e.g. after a restart
+                self.filter_id = None
+                return True
+        else:
+            block_number = self.web3.eth.blockNumber
+            new_blocks = block_number != self.last_block
+            self.last_block = block_number
+
+        if new_blocks:
+            return True
+
+        time.sleep(self.poll_interval)
+        return False
+
+    def resolve(self, txids: Optional[Iterable[str]]=None):
+        """Fetch the receipts of pending transactions and resolve the mined ones.
+
+        :param txids: Transactions to check, all pending by default
+        """
+        with self.lock:
+            if txids is None:
+                txids = list(self.pending.keys())
+            else:
+                txids = [txid for txid in txids if txid in self.pending]
+            self.fresh.difference_update(txids)
+        if not txids:
+            return
+
+        receipts = get_receipts(self.web3, txids)
+        mined = [txid for txid in txids if receipts.get(txid)]
+        self.batches += 1
+        if not mined:
+            return
+
+        # Byzantium nodes tell the status directly,
+        # before that a failed transaction uses all of its gas
+        without_status = [txid for txid in mined if receipts[txid].get("status") is None]
+        transactions = get_transactions(self.web3, without_status) if without_status else {}
+
+        for txid in mined:
+            with self.lock:
+                future = self.pending.pop(txid, None)
+            if future is None:
+                continue
+
+            receipt = receipts[txid]
+            self.gas_used += to_int(receipt["gasUsed"])
+            if receipt.get("status") is not None:
+                threw = to_int(receipt["status"]) != 1
+            else:
+                threw = to_int(receipt["gasUsed"]) == to_int(transactions[txid]["gas"])
+
+            if threw:
+                future.set_exception(TransactionThrew(txid, receipt))
+            else:
+                future.set_result(receipt)
+
+
+def confirm_transactions(web3: Web3, txids: Iterable[str], timeout: float=DEFAULT_TIMEOUT, waiter: Optional[ReceiptWaiter]=None) -> List[dict]:
+    """Batched ``check_succesful_tx`` for many transactions.
+
+    :return: Receipts in the order of txids
+    """
+    return (waiter or ReceiptWaiter(web3)).wait(txids, timeout)
@@ -0,0 +1,231 @@
+"""Raw JSON-RPC access for the operations scripts.
+
+web3 3.x sends one HTTP request per call. Scripts that touch thousands of
+addresses or transactions use :py:func:`batch_request` instead, which packs
+the calls into JSON-RPC batches when the node is reached over HTTP.
+"""
+import json
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Tuple
+
+import requests
+from eth_abi import decode_abi
+from eth_utils import decode_hex
+from web3 import Web3
+from web3.providers.rpc import HTTPProvider
+
+
+#: How many calls we pack into a single HTTP POST
+DEFAULT_BATCH_SIZE = 100
+
+
+class RPCError(Exception):
+    """A call inside a JSON-RPC batch returned an error."""
+
+    def __init__(self, method: str, params: list, error: dict):
+        self.method = method
+        self.params = params
+        self.error = error
+        super(RPCError, self).__init__("{} {} failed: {}".format(method, params, error))
+
+
+def _is_batchable(web3: Web3) -> bool:
+    """Can we talk to the node with raw HTTP batches."""
+    return isinstance(web3.currentProvider, HTTPProvider)
+
+
+def _post_batch(web3: Web3, calls: List[Tuple[str, list]], raise_on_error: bool) -> list:
+    """Send one JSON-RPC batch and return results in the request order."""
+    provider = web3.currentProvider
+    payload = [
+        {"jsonrpc": "2.0", "id": idx, "method": method, "params": params}
+        for idx, (method, params) in enumerate(calls)
+    ]
+
+    request_kwargs = dict(getattr(provider, "request_kwargs", None) or {})
+    request_kwargs.setdefault("timeout", 180)
+    headers = request_kwargs.pop("headers", {})
+    headers.setdefault("Content-Type", "application/json")
+
+    resp = requests.post(provider.endpoint_uri, data=json.dumps(payload), headers=headers, **request_kwargs)
+    resp.raise_for_status()
+    replies = resp.json()
+
+    # Some nodes answer a batch with a single error object
+    if isinstance(replies, dict):
+        raise RPCError("batch", [], replies.get("error", replies))
+
+    results = [None] * len(calls)
+    for reply in replies:
+        idx = reply["id"]
+        if "error" in reply and reply["error"]:
+            if raise_on_error:
+                method, params = calls[idx]
+                raise RPCError(method, params, reply["error"])
+            results[idx] = RPCError(calls[idx][0], calls[idx][1], reply["error"])
+        else:
+            results[idx] = reply.get("result")
+    return results
+
+
+def _request_sequential(web3: Web3, calls: List[Tuple[str, list]], raise_on_error: bool) -> list:
+    """Fallback for in-process test providers that do not speak HTTP."""
+    results = []
+    for method, params in calls:
+        try:
+            results.append(web3._requestManager.request_blocking(method, params))
+        except ValueError as e:
+            if raise_on_error:
+                raise RPCError(method, params, {"message": str(e)}) from e
+            results.append(RPCError(method, params, {"message": str(e)}))
+    return results
+
+
+def batch_request(web3: Web3, calls: Iterable[Tuple[str, list]], batch_size: int=DEFAULT_BATCH_SIZE, raise_on_error: bool=True) -> list:
+    """Execute many JSON-RPC calls with as few round trips as possible.
+
+    :param calls: Iterable of (method, params) tuples
+    :param batch_size: How many calls go to one HTTP request
+    :param raise_on_error: If False, failed calls return :py:class:`RPCError` instances in place of the result
+    :return: List of raw JSON-RPC results in the same order as ``calls``
+    """
+    calls = list(calls)
+    results = []
+    for start in range(0, len(calls), batch_size):
+        chunk = calls[start:start + batch_size]
+        if _is_batchable(web3):
+            results += _post_batch(web3, chunk, raise_on_error)
+        else:
+            results += _request_sequential(web3, chunk, raise_on_error)
+    return results
+
+
+def get_receipts(web3: Web3, txids: Iterable[str], batch_size: int=DEFAULT_BATCH_SIZE) -> dict:
+    """Fetch transaction receipts for many transactions.
+
+    :return: Map txid -> receipt dict, or None if the transaction is not mined yet
+    """
+    txids = list(txids)
+    receipts = batch_request(web3, [("eth_getTransactionReceipt", [txid]) for txid in txids], batch_size=batch_size)
+    return dict(zip(txids, receipts))
+
+
+def get_transactions(web3: Web3, txids: Iterable[str], batch_size: int=DEFAULT_BATCH_SIZE) -> dict:
+    """Fetch transaction bodies for many transactions.
+
+    :return: Map txid -> transaction dict, or None if the node does not know the transaction
+    """
+    txids = list(txids)
+    txs = batch_request(web3, [("eth_getTransactionByHash", [txid]) for txid in txids], batch_size=batch_size)
+    return dict(zip(txids, txs))
+
+
+def is_testrpc(web3: Web3) -> bool:
+    """Is the node eth-testrpc, in-process or over HTTP.
+
+    testrpc mines each transaction when it is sent and does not take a nonce in ``eth_sendTransaction``.
+    It answers ``eth_call`` at the latest block whatever block is asked, and has no ``eth_getLogs`` or block filters.
+    """
+    return web3.version.node.startswith("TestRPC/")
+
+
+#: id(provider) -> [provider, make_request set on the instance or None, how many serialize_requests() blocks are open]
+_serialized_providers = {}
+_serialized_providers_lock = threading.Lock()
+
+
+@contextmanager
+def serialize_requests(web3: Web3) -> Iterator[None]:
+    """Let one thread at a time into an in-process provider while the block runs.
+
+    The pyethereum tester behind the populus ``tester`` chain is not thread safe.
+    Inside the block every request to it, from any thread, goes through one lock.
+    Blocks may nest and overlap from several threads, the provider is restored when the last one exits.
+    Nodes over HTTP handle concurrent requests themselves and are left alone.
+    """
+    provider = web3.currentProvider
+    if provider is None or _is_batchable(web3):
+        yield
+        return
+
+    with _serialized_providers_lock:
+        entry = _serialized_providers.get(id(provider))
+        if entry is None:
+            lock = threading.RLock()
+            make_request = provider.make_request
+            own_make_request = vars(provider).get("make_request")
+
+            def locked_make_request(method, params):
+                with lock:
+                    return make_request(method, params)
+
+            provider.make_request = locked_make_request
+            entry = _serialized_providers[id(provider)] = [provider, own_make_request, 0]
+        entry[2] += 1
+
+    try:
+        yield
+    finally:
+        with _serialized_providers_lock:
+            entry[2] -= 1
+            if entry[2] == 0:
+                del _serialized_providers[id(provider)]
+                if entry[1] is None:
+                    # Back to the class method
+                    del provider.make_request
+                else:
+                    provider.make_request = entry[1]
+
+
+def to_int(value) -> int:
+    """Decode a JSON-RPC quantity that may come as a hex string or as an int."""
+    if isinstance(value, str):
+        return int(value, 16)
+    return int(value)
+
+
+def get_function_abi(contract, fn_name: str) -> dict:
+    """Find a function ABI entry by name."""
+    for entry in contract.abi:
+        if entry.get("type") == "function" and entry["name"] == fn_name:
+            return entry
+    raise ValueError("Contract does not have function {}".format(fn_name))
+
+
+def batch_call(web3: Web3, contract, fn_name: str, args_list: Iterable[list], block_identifier="latest", batch_size: int=DEFAULT_BATCH_SIZE) -> list:
+    """Call the same constant function with many argument sets.
+
+    All calls are executed against the same block, so the results form a consistent view.
+
+    :param contract: web3 Contract instance
+    :param args_list: Iterable of argument lists, one per call
+    :param block_identifier: Block number or tag to pin the calls to
+    :return: Decoded return values, a single value if the function has one output, otherwise a tuple
+    """
+    return multi_call(web3, [(contract, fn_name, args) for args in args_list], block_identifier=block_identifier, batch_size=batch_size)
+
+
+def multi_call(web3: Web3, calls: Iterable[Tuple[object, str, list]], block_identifier="latest", batch_size: int=DEFAULT_BATCH_SIZE) -> list:
+    """Call different constant functions, possibly of different contracts, in one batch.
+
+    :param calls: Iterable of (contract, function name, argument list)
+    :param block_identifier: Block number or tag to pin the calls to
+    :return: Decoded return values in the call order, as in :py:func:`batch_call`
+    """
+
+    if isinstance(block_identifier, int):
+        block_identifier = hex(block_identifier)
+
+    output_types = []
+    rpc_calls = []
+    for contract, fn_name, args in calls:
+        output_types.append([output["type"] for output in get_function_abi(contract, fn_name)["outputs"]])
+        data = contract.encodeABI(fn_name, args=args)
+        rpc_calls.append(("eth_call", [{"to": contract.address, "data": data}, block_identifier]))
+
+    results = []
+    for types, raw in zip(output_types, batch_request(web3, rpc_calls, batch_size=batch_size)):
+        decoded = decode_abi(types, decode_hex(raw))
+        results.append(decoded[0] if len(decoded) == 1 else tuple(decoded))
+    return results
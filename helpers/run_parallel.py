@@ -0,0 +1,63 @@
+"""Run the test suite in parallel worker processes.
+
+Each worker runs ``py.test`` on one shard of the suite with its own tester chain
+and temporary directory. Shards are balanced by the durations measured on the
+previous runs, so the wall clock time scales with the number of cores::
+
+    PYTHONPATH=.:ico python -m helpers.run_parallel -n 4 -- -x
+
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from helpers.gasbench import DEFAULT_BASELINE_FILE, merge_shard_baselines
+from helpers.sharding import DEFAULT_DURATIONS_FILE, merge_shard_durations
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--workers", type=int, default=multiprocessing.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--durations-file", default=DEFAULT_DURATIONS_FILE, help="Measured test durations")
+    parser.add_argument("--gas-baseline", default=DEFAULT_BASELINE_FILE, help="Gas baseline the workers check and, with --update-gas-baseline, write")
+    parser.add_argument("pytest_args", nargs="*", help="Extra arguments passed to each py.test worker")
+    args = parser.parse_args(argv)
+
+    workers = max(1, args.workers)
+    durations_file = os.path.abspath(args.durations_file)
+    baseline_file = os.path.abspath(args.gas_baseline)
+    basetemp = tempfile.mkdtemp(prefix="pytest-shards-")
+
+    started = time.time()
+    procs = []
+    for shard_id in range(workers):
+        cmd = [
+            sys.executable, "-m", "pytest",
+            "--shard-id", str(shard_id),
+            "--shard-count", str(workers),
+            "--durations-file", durations_file,
+            "--gas-baseline", baseline_file,
+            "--basetemp", os.path.join(basetemp, "shard{}".format(shard_id)),
+            "-q",
+        ] + args.pytest_args
+        procs.append(subprocess.Popen(cmd))
+
+    exit_codes = [proc.wait() for proc in procs]
+    merge_shard_durations(durations_file, workers)
+    merge_shard_baselines(baseline_file, workers)
+
+    # 5 = no tests collected, which is fine for a shard of a small suite
+    failed = [(shard_id, code) for shard_id, code in enumerate(exit_codes) if code not in (0, 5)]
+    print("Ran {} shards in {:.1f} seconds".format(workers, time.time() - started))
+    for shard_id, code in failed:
+        print("Shard {} failed with exit code {}".format(shard_id, code))
+
+    return failed[0][1] if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
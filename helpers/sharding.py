@@ -0,0 +1,119 @@
+"""Spread the test suite across worker processes by measured test duration.
+
+Each worker is a separate ``py.test`` process with its own in-process tester
+chain, accounts and compiled contracts, so workers do not share any chain state.
+Every worker collects the full suite and keeps only the tests of its shard.
+The shards are balanced with the durations recorded by earlier runs.
+
+This module is a pytest plugin. The hooks are imported in ``tests/conftest.py``.
+Use :py:mod:`helpers.run_parallel` to launch the workers.
+"""
+import json
+import os
+from typing import Dict, List
+
+
+#: Where the measured test durations are kept between runs
+DEFAULT_DURATIONS_FILE = os.path.join(os.path.dirname(__file__), "..", ".test-durations.json")
+
+
+def load_durations(fname: str) -> Dict[str, float]:
+    if not os.path.exists(fname):
+        return {}
+    with open(fname, "rt") as inp:
+        return json.load(inp)
+
+
+def save_durations(fname: str, durations: Dict[str, float]):
+    tmp = fname + ".tmp.{}".format(os.getpid())
+    with open(tmp, "wt") as out:
+        json.dump(durations, out, indent=2, sort_keys=True)
+    os.replace(tmp, fname)
+
+
+def assign_shards(test_ids: List[str], durations: Dict[str, float], shard_count: int) -> Dict[str, int]:
+    """Assign tests to shards, longest first to the least loaded shard.
+
+    Tests we have never measured get the average duration.
+    The result only depends on the arguments, so all workers agree on it.
+    """
+    known = [durations[t] for t in test_ids if t in durations]
+    default = sum(known) / len(known) if known else 1.0
+
+    # Sort by duration, then by id to break ties the same way in all workers
+    ordered = sorted(test_ids, key=lambda t: (-durations.get(t, default), t))
+
+    loads = [0.0] * shard_count
+    assignment = {}
+    for test_id in ordered:
+        shard = min(range(shard_count), key=lambda s: (loads[s], s))
+        assignment[test_id] = shard
+        loads[shard] += durations.get(test_id, default)
+    return assignment
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("sharding", "Parallel test shards")
+    group.addoption("--shard-id", type=int, default=None, help="Run only the tests of this shard, starting from 0")
+    group.addoption("--shard-count", type=int, default=1, help="How many shards the suite is split to")
+    group.addoption("--durations-file", default=None, help="Measured test durations used to balance the shards")
+
+
+def get_durations_file(config) -> str:
+    return config.getoption("--durations-file") or DEFAULT_DURATIONS_FILE
+
+
+def pytest_collection_modifyitems(session, config, items):
+    shard_id = config.getoption("--shard-id")
+    if shard_id is None:
+        return
+
+    shard_count = config.getoption("--shard-count")
+    assert 0 <= shard_id < shard_count, "Bad shard {}/{}".format(shard_id, shard_count)
+
+    durations = load_durations(get_durations_file(config))
+    assignment = assign_shards([item.nodeid for item in items], durations, shard_count)
+
+    selected = [item for item in items if assignment[item.nodeid] == shard_id]
+    deselected = [item for item in items if assignment[item.nodeid] != shard_id]
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+    items[:] = selected
+
+
+#: Durations measured in this process
+_current_measurements = {}
+
+
+def pytest_runtest_logreport(report):
+    # Fixture setup is included, as session fixtures make the first test of a module slow
+    if report.when in ("setup", "call", "teardown"):
+        _current_measurements[report.nodeid] = _current_measurements.get(report.nodeid, 0.0) + report.duration
+
+
+def pytest_sessionfinish(session, exitstatus):
+    """Write what we measured next to the durations file. The runner merges the worker files."""
+    if not _current_measurements:
+        return
+
+    config = session.config
+    fname = get_durations_file(config)
+    shard_id = config.getoption("--shard-id")
+
+    if shard_id is None:
+        durations = load_durations(fname)
+        durations.update(_current_measurements)
+        save_durations(fname, durations)
+    else:
+        save_durations("{}.shard{}".format(fname, shard_id), _current_measurements)
+
+
+def merge_shard_durations(fname: str, shard_count: int):
+    """Fold per worker measurements to the main durations file."""
+    durations = load_durations(fname)
+    for shard_id in range(shard_count):
+        shard_file = "{}.shard{}".format(fname, shard_id)
+        if os.path.exists(shard_file):
+            durations.update(load_durations(shard_file))
+            os.unlink(shard_file)
+    save_durations(fname, durations)
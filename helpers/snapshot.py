@@ -0,0 +1,227 @@
+"""Token holder balances at a block, rebuilt from token events.
+
+The token keeps no list of holders. We replay the events that change balances
+
+- ``Transfer(from, to, value)``, also emitted when a MultiVault pays out a claim
+
+- ``Minted(receiver, amount)`` from ``MintableToken.mint``
+
+- ``Upgrade(from, agent, value)``, which burns the upgraded tokens
+
+up to the snapshot block. The initial supply the constructor gives to the
+deployer has no event, so it is passed in as a starting balance.
+
+Logs are processed chunk by chunk, so memory depends on the number of holders
+and not on the number of transfers::
+
+    snapshot = take_snapshot(web3, token, 4500000, start_block=3900000)
+    with open("holders.csv", "wt") as out:
+        snapshot.write_csv(out)
+    assert not check_snapshot(web3, token, snapshot, sample_size=500)
+
+"""
+import csv
+import logging
+import random
+from array import array
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+
+import click
+from eth_utils import decode_hex, encode_hex
+from populus import Project
+from web3 import Web3
+from web3.contract import Contract
+
+from helpers.events import EventDecoder, fetch_logs
+from helpers.rpc import batch_call
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Token events that change balances
+EVENTS = ("Transfer", "Minted", "Upgrade")
+
+#: Balances up to this are kept in the array, larger ones in a dict
+WORD_MAX = 2 ** 64 - 1
+
+
+class SnapshotError(Exception):
+    """The events do not add up, e.g. a balance would go negative."""
+
+
+class BalanceTable:
+    """Address -> balance map backed by arrays.
+
+    Addresses are packed to one bytearray, 20 bytes each, and balances to
+    an array of 64 bit words. Balances that do not fit a word live in a small dict.
+    """
+
+    def __init__(self):
+        #: Address bytes -> position
+        self.index = {}
+        self.addresses = bytearray()
+        self.balances = array("Q")
+        self.big = {}
+
+    def __len__(self):
+        return len(self.balances)
+
+    def get_position(self, address: bytes) -> int:
+        position = self.index.get(address)
+        if position is None:
+            position = self.index[address] = len(self.balances)
+            self.addresses += address
+            self.balances.append(0)
+        return position
+
+    def get(self, position: int) -> int:
+        return self.big.get(position, self.balances[position])
+
+    def set(self, position: int, value: int):
+        if value > WORD_MAX:
+            self.big[position] = value
+            self.balances[position] = 0
+        else:
+            self.big.pop(position, None)
+            self.balances[position] = value
+
+    def credit(self, address: bytes, amount: int):
+        position = self.get_position(address)
+        self.set(position, self.get(position) + amount)
+
+    def debit(self, address: bytes, amount: int):
+        position = self.get_position(address)
+        balance = self.get(position) - amount
+        if balance < 0:
+            raise SnapshotError("Balance of {} would go negative".format(encode_hex(address)))
+        self.set(position, balance)
+
+    def balance_of(self, address: str) -> int:
+        position = self.index.get(decode_hex(address))
+        return 0 if position is None else self.get(position)
+
+    def get_address(self, position: int) -> str:
+        return encode_hex(bytes(self.addresses[position * 20:position * 20 + 20]))
+
+    def iter_holders(self) -> Iterator[Tuple[str, int]]:
+        """Addresses with a balance, in the order they were first seen."""
+        for position in range(len(self.balances)):
+            balance = self.get(position)
+            if balance:
+                yield self.get_address(position), balance
+
+    def total(self) -> int:
+        return sum(self.balances) + sum(self.big.values())
+
+
+class Snapshot:
+    """Token balances at a block."""
+
+    def __init__(self, block_number: int, table: BalanceTable, events: int):
+        self.block_number = block_number
+        self.table = table
+
+        #: How many events were replayed
+        self.events = events
+
+    def write_csv(self, out: IO):
+        """Stream the holders as CSV rows of address and balance in token base units."""
+        writer = csv.writer(out)
+        writer.writerow(["address", "balance"])
+        for address, balance in self.table.iter_holders():
+            writer.writerow([address, balance])
+
+
+def take_snapshot(web3: Web3, token: Contract, block_number: int, start_block: int=0, initial_balances: Optional[Dict[str, int]]=None) -> Snapshot:
+    """Replay token events up to a block.
+
+    :param start_block: The token deployment block, there are no events before it
+    :param initial_balances: Balances the token constructor gave without an event
+    """
+    decoder = EventDecoder(token.abi, EVENTS)
+    table = BalanceTable()
+    for address, balance in (initial_balances or {}).items():
+        table.credit(decode_hex(address), balance)
+
+    count = 0
+    for chunk_start, chunk_end, logs in fetch_logs(web3, token.address, decoder.topics, start_block, block_number):
+        events = decoder.decode_all(logs)
+        for event in events:
+            name = event["event"]
+            values = event["values"]
+            if name == "Transfer":
+                sender, receiver, value = values
+                table.debit(decode_hex(sender), value)
+                table.credit(decode_hex(receiver), value)
+            elif name == "Minted":
+                receiver, amount = values
+                table.credit(decode_hex(receiver), amount)
+            else:
+                sender, agent, value = values
+                table.debit(decode_hex(sender), value)
+        count += len(events)
+        logger.info("Replayed blocks %d-%d, %d events, %d addresses", chunk_start, chunk_end, count, len(table))
+
+    return Snapshot(block_number, table, count)
+
+
+def check_snapshot(web3: Web3, token: Contract, snapshot: Snapshot, sample_size: int=100, seed: Optional[int]=None) -> List[Tuple[str, int, int]]:
+    """Compare the snapshot with the token at the snapshot block.
+
+    The total against ``totalSupply`` and a random sample of holders against ``balanceOf``.
+    The node must answer calls at past blocks, eth-testrpc reads the latest state whatever the block.
+
+    :return: Mismatches as (address or "totalSupply", token value, snapshot value)
+    """
+    mismatches = []
+
+    total_supply = batch_call(web3, token, "totalSupply", [[]], block_identifier=snapshot.block_number)[0]
+    if total_supply != snapshot.table.total():
+        mismatches.append(("totalSupply", total_supply, snapshot.table.total()))
+
+    table = snapshot.table
+    positions = random.Random(seed).sample(range(len(table)), min(sample_size, len(table)))
+    addresses = [table.get_address(position) for position in positions]
+    balances = batch_call(web3, token, "balanceOf", [[address] for address in addresses], block_identifier=snapshot.block_number)
+    for address, position, balance in zip(addresses, positions, balances):
+        if balance != table.get(position):
+            mismatches.append((address, balance, table.get(position)))
+
+    return mismatches
+
+
+@click.command()
+@click.option('--chain', nargs=1, default="mainnet", help='On which chain the token is - see populus.json')
+@click.option('--address', nargs=1, help='Token contract address', required=True)
+@click.option('--block', nargs=1, type=int, help='Snapshot block', required=True)
+@click.option('--start-block', nargs=1, type=int, help='Block where the token was deployed', default=0)
+@click.option('--initial-holder', nargs=1, help='Address that got the initial supply in the token constructor', default=None)
+@click.option('--initial-supply', nargs=1, type=int, help='Initial supply in token base units', default=0)
+@click.option('--sample-size', nargs=1, type=int, help='How many holders to check against balanceOf()', default=100)
+@click.option('--csv-file', nargs=1, help='Where to write the holders', required=True)
+def main(chain, address, block, start_block, initial_holder, initial_supply, sample_size, csv_file):
+    """Write token holders at a block to CSV."""
+
+    logging.basicConfig(level=logging.INFO)
+    project = Project()
+    with project.get_chain(chain) as c:
+        web3 = c.web3
+        token = c.provider.get_base_contract_factory("MysteriumToken")(address=address)
+        initial_balances = {initial_holder: initial_supply} if initial_holder else {}
+        snapshot = take_snapshot(web3, token, block, start_block, initial_balances)
+
+        with open(csv_file, "wt") as out:
+            snapshot.write_csv(out)
+        print("Replayed {} events, {} addresses, written to {}".format(snapshot.events, len(snapshot.table), csv_file))
+
+        mismatches = check_snapshot(web3, token, snapshot, sample_size)
+        for mismatch in mismatches:
+            print("Mismatch {}: token {} snapshot {}".format(*mismatch))
+        if mismatches:
+            raise click.ClickException("Snapshot does not match the token")
+        print("Snapshot matches totalSupply and {} sampled balances".format(min(sample_size, len(snapshot.table))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Verify deployed contracts against a local compilation.
+
+Etherscan verification drives a browser through a web form for each contract.
+Here we compare the runtime code we compile with the project solc settings
+against ``eth_getCode`` of every contract in a deployment report,
+with all the code fetched in one JSON-RPC batch::
+
+    python -m helpers.verify --chain kovan --report crowdsales/mysterium-kovan.deployment-report.yml --output verification.json
+
+Before comparing
+
+- the solc metadata hash at the end of the runtime code is cut off, as it changes
+  with source file paths and comments without changing the code
+
+- library placeholders are linked with the library addresses of the report
+
+- the address a library pushes at the start of its code is masked, as it is filled in on deployment
+
+Constructor arguments are not part of the runtime code, so they need no stripping.
+
+Another solc version compiles different code, so we refuse to compare with
+anything else than the pinned compiler the contracts were deployed with.
+"""
+import json
+import re
+import sys
+from typing import Dict, Optional, Tuple
+
+import click
+import ruamel.yaml
+from populus import Project
+from solc import get_solc_version_string
+from web3 import Web3
+
+from helpers.chaincache import get_compiled_contracts
+from helpers.deploy_dag import link_bytecode
+from helpers.rpc import batch_request, to_int
+
+
+#: The compiler the contracts are deployed with, same as in .travis.yml
+REQUIRED_SOLC_VERSION = "0.4.8"
+
+#: Swarm hash of the contract metadata, appended by solc >= 0.4.7
+METADATA_SUFFIX = re.compile(r"a165627a7a72305820([0-9a-f]{64})0029$")
+
+#: Library runtime code starts with PUSH20 of its own address, zero in the compiled code
+LIBRARY_PREFIX = "73" + "0" * 40
+
+#: Verification results
+STATUS_VERIFIED = "verified"
+STATUS_MISMATCH = "mismatch"
+STATUS_NO_CODE = "no_code"
+STATUS_NOT_COMPILED = "not_compiled"
+STATUS_UNLINKED = "unlinked"
+
+
+class CompilerMismatch(Exception):
+    """Local solc is not the version the contracts were deployed with."""
+
+
+def check_solc_version(version_string: str, required: str=REQUIRED_SOLC_VERSION):
+    """Check solc --version output against the pinned compiler.
+
+    :raise CompilerMismatch: If the version is another one, as then every contract would look like a mismatch
+    """
+    match = re.search(r"(\d+\.\d+\.\d+)", version_string)
+    version = match.group(1) if match else None
+    if version != required:
+        raise CompilerMismatch("Contracts are compiled with solc {}, but the local solc is {}. Set SOLC_BINARY to solc {}.".format(
+            required, version or version_string.strip(), required))
+
+
+def split_metadata(code: str) -> Tuple[str, Optional[str]]:
+    """Separate the metadata hash from runtime code.
+
+    :return: Tuple (code without 0x and metadata, metadata hash or None)
+    """
+    code = code.lower().replace("0x", "", 1)
+    match = METADATA_SUFFIX.search(code)
+    if not match:
+        return code, None
+    return code[:match.start()], match.group(1)
+
+
+def normalize_code(compiled: str, deployed: str) -> Tuple[str, str]:
+    """Mask the parts of the code that are only known on deployment."""
+    if compiled.startswith(LIBRARY_PREFIX) and deployed.startswith("73"):
+        deployed = LIBRARY_PREFIX + deployed[len(LIBRARY_PREFIX):]
+    return compiled, deployed
+
+
+def verify_code(compiled_runtime: str, deployed_code: str, libraries: Dict[str, str]) -> dict:
+    """Compare compiled runtime code with code on the chain.
+
+    :return: Result with status, and whether the metadata hash matched too
+    """
+    if not deployed_code or deployed_code == "0x":
+        return {"status": STATUS_NO_CODE}
+
+    try:
+        compiled_runtime = link_bytecode(compiled_runtime, libraries)
+    except KeyError as e:
+        return {"status": STATUS_UNLINKED, "reason": "library {} not in the report".format(e)}
+
+    compiled, compiled_metadata = split_metadata(compiled_runtime)
+    deployed, deployed_metadata = split_metadata(deployed_code)
+    compiled, deployed = normalize_code(compiled, deployed)
+
+    return {
+        "status": STATUS_VERIFIED if compiled == deployed else STATUS_MISMATCH,
+        "metadata_match": compiled_metadata == deployed_metadata,
+        "compiled_size": len(compiled) // 2,
+        "deployed_size": len(deployed) // 2,
+    }
+
+
+def verify_deployment(web3: Web3, compiled_contracts: dict, report: dict, block_identifier="latest") -> dict:
+    """Verify all contracts and libraries of a deployment report.
+
+    :param compiled_contracts: Populus compiled contract data, contract name -> data with ``bytecode_runtime``
+    :param report: Loaded ``*.deployment-report.yml``
+    :return: Machine readable verification report
+    """
+    if block_identifier == "latest":
+        block_identifier = web3.eth.blockNumber
+    block = hex(block_identifier)
+
+    targets = {}
+    for name, entry in (report.get("contracts") or {}).items():
+        if entry.get("address"):
+            libraries = dict(entry.get("libraries") or {})
+            targets[name] = (entry["contract_name"], entry["address"], libraries)
+            for library, address in libraries.items():
+                targets.setdefault(library, (library, address, {}))
+
+    codes = batch_request(web3, [("eth_getCode", [address, block]) for contract_name, address, libraries in targets.values()])
+
+    results = {}
+    for (name, (contract_name, address, libraries)), code in zip(targets.items(), codes):
+        if contract_name not in compiled_contracts:
+            result = {"status": STATUS_NOT_COMPILED}
+        else:
+            result = verify_code(compiled_contracts[contract_name]["bytecode_runtime"], code, libraries)
+        result.update({"contract_name": contract_name, "address": address})
+        results[name] = result
+
+    return {
+        "chain": report.get("chain"),
+        "block_number": to_int(block_identifier),
+        "verified": all(result["status"] == STATUS_VERIFIED for result in results.values()),
+        "contracts": results,
+    }
+
+
+def get_solc_settings(project: Project) -> dict:
+    """The compiler the code was checked with, for the report."""
+    return {
+        "version": get_solc_version_string().strip(),
+        "settings": dict(project.config.get("compilation.settings", {})),
+    }
+
+
+@click.command()
+@click.option('--chain', nargs=1, default="mainnet", help='On which chain the contracts are - see populus.json')
+@click.option('--report', nargs=1, help='Deployment report YAML written by the deployment', required=True)
+@click.option('--output', nargs=1, help='Write the verification report JSON here, by default to stdout', default=None)
+def main(chain, report, output):
+    """Check that the deployed contracts run the code we compile."""
+
+    try:
+        check_solc_version(get_solc_version_string())
+    except CompilerMismatch as e:
+        raise click.ClickException(str(e))
+
+    with open(report, "rt") as inp:
+        report_data = ruamel.yaml.round_trip_load(inp)
+
+    project = Project()
+    compiled = get_compiled_contracts(project)
+
+    with project.get_chain(chain) as c:
+        result = verify_deployment(c.web3, compiled, report_data)
+
+    result["compiler"] = get_solc_settings(project)
+
+    if output:
+        with open(output, "wt") as out:
+            json.dump(result, out, indent=2, sort_keys=True)
+    else:
+        json.dump(result, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    for name, contract in sorted(result["contracts"].items()):
+        print("{}: {} at {}".format(name, contract["status"], contract["address"]), file=sys.stderr)
+
+    sys.exit(0 if result["verified"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
-"""Test fixtures."""
+"""Test fixtures.
+
+The tests share one session wide test chain. Contracts that most tests need are
+deployed on it once per session. Each test runs inside an EVM snapshot taken
+before the test and reverted after it, so tests cannot see each other's changes.
+"""
 import datetime
+from contextlib import contextmanager
 
 import pytest
+from populus import Project
 from web3.contract import Contract
+from web3.testing import Testing
 
 
 from ico.tests.utils import time_travel
@@ -12,97 +20,213 @@ from ico.tests.fixtures.flatprice import *  # noqa
 from ico.tests.fixtures.releasable import *  # noqa
 from ico.tests.fixtures.finalize import *  # noqa
 from ico.tests.fixtures.presale import *  # noqa
+from fixtures.multivault import *  # noqa
+from helpers import gasbench, gasprofile, sharding
+from helpers.gasbench import gas_meter, pytest_terminal_summary  # noqa
+from helpers.gasprofile import gas_profile  # noqa
+from helpers.sharding import pytest_collection_modifyitems, pytest_runtest_logreport  # noqa
+
+
+#: When Mysterium crowdsale opens in tests
+STARTS_AT = int(datetime.datetime(2017, 1, 1).timestamp())
+
+#: When Mysterium crowdsale closes in tests
+ENDS_AT = int(datetime.datetime(2017, 2, 3).timestamp())
+
+
+def pytest_addoption(parser):
+    sharding.pytest_addoption(parser)
+    gasbench.pytest_addoption(parser)
+    gasprofile.pytest_addoption(parser)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    sharding.pytest_sessionfinish(session, exitstatus)
+    gasbench.pytest_sessionfinish(session, exitstatus)
+    gasprofile.pytest_sessionfinish(session, exitstatus)
+
+
+@contextmanager
+def chain_snapshot(chain):
+    """Revert all chain changes made inside the block.
+
+    The pending block timestamp is restored too, so that time_travel() inside
+    the block does not leak to the next test.
+    """
+    web3 = chain.web3
+    testing = Testing(web3)
+    timestamp = web3.eth.getBlock("pending")["timestamp"]
+    snapshot_idx = testing.snapshot()
+    try:
+        yield chain
+    finally:
+        testing.revert(snapshot_idx)
+        time_travel(chain, timestamp)
+
+
+@pytest.fixture(scope="session")
+def session_project() -> Project:
+    """Populus project shared by all tests, so contracts are compiled only once."""
+    return Project()
+
+
+@pytest.fixture(scope="session")
+def session_chain(session_project):
+    """Test chain shared by all tests."""
+    with session_project.get_chain("tester") as chain:
+        yield chain
 
 
 @pytest.fixture
-def starts_at() -> int:
-    """When pre-ico opens"""
-    return int(datetime.datetime(2017, 1, 1).timestamp())
+def project(session_project) -> Project:
+    return session_project
 
 
 @pytest.fixture
-def ends_at() -> int:
-    """When pre-ico closes"""
-    return int(datetime.datetime(2017, 2, 3).timestamp())
+def chain(request, session_chain):
+    """Session chain wrapped in a snapshot for the duration of a test."""
+
+    # Session wide contracts must go in before the snapshot, or reverting it would remove them
+    if "mysterium_world" in request.fixturenames:
+        request.getfixturevalue("mysterium_world")
+
+    with chain_snapshot(session_chain):
+        yield session_chain
+
+
+@pytest.fixture
+def web3(chain):
+    return chain.web3
+
+
+@pytest.fixture
+def accounts(web3) -> list:
+    return web3.eth.accounts
+
+
+@pytest.fixture(scope="session")
+def session_team_multisig(session_chain) -> str:
+    """The team multisig address, for contracts deployed once per session."""
+    return session_chain.web3.eth.accounts[4]
 
 
 @pytest.fixture
-def mysterium_token(chain, team_multisig, token_name, token_symbol, initial_supply) -> Contract:
-    """Create the token contract."""
+def team_multisig(session_team_multisig) -> str:
+    """The team multisig address."""
+    return session_team_multisig
+
 
-    args = ["Mysterium", "MYST", 0, 8]  # Owner set
+def deploy_mysterium_world(chain, team_multisig: str, accounts: list, pricing_contract: str="MysteriumPricing", crowdsale_contract: str="MysteriumCrowdsale") -> dict:
+    """Deploy token, pricing, crowdsale and token distribution.
+
+    Same setup as the crowdsale and mysterium_finalize_agent fixtures used to do for each test.
+
+    :param pricing_contract: Contract name, to deploy an ABI compatible pricing
+    :param crowdsale_contract: Contract name, to deploy an ABI compatible crowdsale
+    """
 
     tx = {
         "from": team_multisig
     }
 
-    contract, hash = chain.provider.deploy_contract('MysteriumToken', deploy_args=args, deploy_transaction=tx)
-    return contract
+    token, hash = chain.provider.deploy_contract('MysteriumToken', deploy_args=["Mysterium", "MYST", 0, 8], deploy_transaction=tx)
 
+    # 120 CHF = 1 ETH at the scale of 10000
+    pricing, hash = chain.provider.deploy_contract(pricing_contract, deploy_args=[120000], deploy_transaction=tx)
+
+    args = [
+        token.address,
+        pricing.address,
+        team_multisig,
+        STARTS_AT,
+        ENDS_AT,
+    ]
+    crowdsale, hash = chain.provider.deploy_contract(crowdsale_contract, deploy_args=args, deploy_transaction=tx)
+
+    pricing.transact({"from": team_multisig}).setCrowdsale(crowdsale.address)
+    pricing.transact({"from": team_multisig}).setConversionRate(120*10000)
+
+    assert crowdsale.call().owner() == team_multisig
+    assert not token.call().released()
+
+    # Allow pre-ico contract to do mint()
+    token.transact({"from": team_multisig}).setMintAgent(crowdsale.address, True)
+    token.transact({"from": team_multisig}).setTransferAgent(crowdsale.address, True)
+    assert token.call().mintAgents(crowdsale.address) == True
 
-@pytest.fixture
-def mysterium_finalize_agent(team_multisig, chain, mysterium_token, crowdsale, mysterium_pricing, accounts) -> Contract:
     # Create finalizer contract
     args = [
-        mysterium_token.address,
+        token.address,
         crowdsale.address,
-        mysterium_pricing.address
+        pricing.address
     ]
-    tx = {
-        "from": team_multisig
-    }
-    contract, hash = chain.provider.deploy_contract('MysteriumTokenDistribution', deploy_args=args, deploy_transaction=tx)
+    finalize_agent, hash = chain.provider.deploy_contract('MysteriumTokenDistribution', deploy_args=args, deploy_transaction=tx)
 
-    contract.transact({"from": team_multisig}).setVaults(
+    finalize_agent.transact({"from": team_multisig}).setVaults(
         _futureRoundVault=accounts[0],
         _foundationWallet=accounts[0],
         _teamVault=accounts[0],
         _seedVault1=accounts[0],
         _seedVault2=accounts[0])  # TODO: Use actual contracts here
-    return contract
+
+    return {
+        "token": token,
+        "pricing": pricing,
+        "crowdsale": crowdsale,
+        "finalize_agent": finalize_agent,
+    }
+
+
+@pytest.fixture(scope="session")
+def mysterium_world(session_chain, session_team_multisig) -> dict:
+    """Mysterium crowdsale contracts deployed once per session.
+
+    Deployed by the chain fixture before it takes the test snapshot,
+    so only sessions that run crowdsale tests pay for the deployment.
+    """
+    return deploy_mysterium_world(session_chain, session_team_multisig, session_chain.web3.eth.accounts)
 
 
 @pytest.fixture
-def mysterium_pricing(chain, preico_token_price, team_multisig) -> Contract:
-    """Flat pricing contact."""
-    args = [
-        120000  # 120 CHF = 1 ETH at the scale of 10000
-    ]
-    tx = {
-        "from": team_multisig,
-    }
-    pricing_strategy, hash = chain.provider.deploy_contract('MysteriumPricing', deploy_args=args,  deploy_transaction=tx)
-    return pricing_strategy
+def converting_mysterium_world(chain, team_multisig, accounts) -> dict:
+    """Crowdsale contracts as they were before caching the caps and prices in wei, deployed for one test."""
+    return deploy_mysterium_world(chain, team_multisig, accounts, pricing_contract="ConvertingMysteriumPricing", crowdsale_contract="ConvertingMysteriumCrowdsale")
 
 
 @pytest.fixture
-def crowdsale(chain, mysterium_token, mysterium_pricing, starts_at, ends_at, preico_funding_goal, team_multisig) -> Contract:
-    token = mysterium_token
+def starts_at() -> int:
+    """When pre-ico opens"""
+    return STARTS_AT
 
-    args = [
-        token.address,
-        mysterium_pricing.address,
-        team_multisig,
-        starts_at,
-        ends_at,
-    ]
-    tx = {
-        "from": team_multisig,
-    }
-    contract, hash = chain.provider.deploy_contract('MysteriumCrowdsale', deploy_args=args, deploy_transaction=tx)
 
-    mysterium_pricing.transact({"from": team_multisig}).setCrowdsale(contract.address)
-    mysterium_pricing.transact({"from": team_multisig}).setConversionRate(120*10000)
+@pytest.fixture
+def ends_at() -> int:
+    """When pre-ico closes"""
+    return ENDS_AT
 
-    assert contract.call().owner() == team_multisig
-    assert not token.call().released()
 
-    # Allow pre-ico contract to do mint()
-    token.transact({"from": team_multisig}).setMintAgent(contract.address, True)
-    token.transact({"from": team_multisig}).setTransferAgent(contract.address, True)
-    assert token.call().mintAgents(contract.address) == True
+@pytest.fixture
+def mysterium_token(chain, mysterium_world) -> Contract:
+    """The token contract."""
+    return mysterium_world["token"]
+
+
+@pytest.fixture
+def mysterium_finalize_agent(chain, mysterium_world) -> Contract:
+    """Token distribution with all vaults set to accounts[0]."""
+    return mysterium_world["finalize_agent"]
+
 
-    return contract
+@pytest.fixture
+def mysterium_pricing(chain, mysterium_world) -> Contract:
+    """Pricing with 120 CHF = 1 ETH."""
+    return mysterium_world["pricing"]
+
+
+@pytest.fixture
+def crowdsale(chain, mysterium_world) -> Contract:
+    """Crowdsale that can mint tokens, not yet given a finalize agent."""
+    return mysterium_world["crowdsale"]
 
 
 @pytest.fixture()
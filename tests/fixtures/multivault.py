@@ -0,0 +1,28 @@
+import time
+
+import pytest
+from web3.contract import Contract
+
+
+@pytest.fixture
+def mysterium_mv_token(chain, team_multisig) -> Contract:
+    """Create the token contract."""
+
+    args = ["Mysterium", "MYST", 200, 8]  # Owner set
+
+    tx = {
+        "from": team_multisig
+    }
+
+    contract, hash = chain.provider.deploy_contract('MysteriumToken', deploy_args=args, deploy_transaction=tx)
+
+    contract.transact({"from": team_multisig}).setReleaseAgent(team_multisig)
+    contract.transact({"from": team_multisig}).releaseTokenTransfer()
+
+    return contract
+
+
+@pytest.fixture
+def freeze_ends_at() -> int:
+    """Timestamp when the vault unlocks."""
+    return int(time.time() + 1000)
@@ -0,0 +1,189 @@
+"""Pipelined investor data loading."""
+import os
+from types import SimpleNamespace
+
+import pytest
+from web3 import Web3
+from web3.contract import Contract
+from web3.providers.base import BaseProvider
+
+from helpers.bulksend import PipelinedSender, STATUS_DROPPED, STATUS_REPLACED, STATUS_SUCCESS, STATUS_TIMEOUT
+from helpers.investors import read_investor_data, reconcile_vault
+from helpers.rpc import is_testrpc
+
+
+FAKE_SEED_DATA = os.path.join(os.path.dirname(__file__), "..", "fake_seed_investor_data.csv")
+
+
+@pytest.fixture
+def empty_multivault(chain, team_multisig) -> Contract:
+    """A vault without investors."""
+    args = [
+        team_multisig,
+        1
+    ]
+
+    tx = {
+        "from": team_multisig
+    }
+
+    contract, hash = chain.provider.deploy_contract('MultiVault', deploy_args=args, deploy_transaction=tx)
+    return contract
+
+
+class StuckNode:
+    """Just enough of web3 for PipelinedSender: a node that never mines anything.
+
+    :param keep: Does the node keep our transactions in its pool, or forget them right away
+    :param replace: Does somebody else get a transaction with our nonce mined
+    """
+
+    def __init__(self, keep=True, replace=False):
+        self.keep = keep
+        self.replace = replace
+        self.confirmed_nonce = 0
+        self.sent = []
+        self.currentProvider = None
+        self.version = SimpleNamespace(node="StuckNode/v1.0")
+        self.eth = SimpleNamespace(getTransactionCount=lambda address, block: self.confirmed_nonce)
+        self._requestManager = SimpleNamespace(request_blocking=self.request_blocking)
+
+    def request_blocking(self, method, params):
+        if method == "eth_getTransactionReceipt":
+            return None
+        if method == "eth_getTransactionByHash":
+            return {"hash": params[0]} if self.keep else None
+        raise AssertionError("Unexpected call {}".format(method))
+
+    def send(self, tx):
+        self.sent.append(tx)
+        if self.replace:
+            self.confirmed_nonce = tx["nonce"] + 1
+        return "0x{:064x}".format(len(self.sent))
+
+
+def add_investor_job(contract, row):
+    return row.address, lambda tx: contract.transact(tx).addInvestor(row.address, row.amount)
+
+
+def test_bulk_load(web3, empty_multivault, team_multisig):
+    """All CSV rows get loaded with locally assigned nonces."""
+
+    rows = list(read_investor_data(FAKE_SEED_DATA))
+    sender = PipelinedSender(web3, team_multisig, window=8, poll_interval=0)
+    results = sender.run([add_investor_job(empty_multivault, row) for row in rows])
+
+    assert len(results) == len(rows)
+    assert all(r.status == STATUS_SUCCESS for r in results)
+    assert [r.nonce for r in results] == list(range(results[0].nonce, results[0].nonce + len(rows)))
+    assert empty_multivault.call().investorCount() == len(rows)
+    for row in rows:
+        assert empty_multivault.call().balances(row.address) == row.amount
+
+
+
+def test_reconcile_vault(web3, empty_multivault, team_multisig):
+    """Reconciliation sorts rows to missing, matching and mismatched at one block."""
+
+    rows = list(read_investor_data(FAKE_SEED_DATA))[0:4]
+    empty_multivault.transact({"from": team_multisig}).addInvestor(rows[0].address, rows[0].amount)
+    empty_multivault.transact({"from": team_multisig}).addInvestor(rows[1].address, rows[1].amount + 1)
+
+    reconciliation = reconcile_vault(web3, empty_multivault, rows)
+    assert reconciliation.block_number == web3.eth.blockNumber
+    assert reconciliation.matching == [rows[0]]
+    assert reconciliation.mismatched == [(rows[1], rows[1].amount + 1)]
+    assert reconciliation.missing == rows[2:]
+
+
+def test_reconcile_vault_earlier_block(web3, empty_multivault, team_multisig):
+    """Reconciliation at an earlier block sees the vault as it was then."""
+
+    if is_testrpc(web3):
+        pytest.skip("testrpc answers eth_call at the latest block only")
+
+    rows = list(read_investor_data(FAKE_SEED_DATA))[0:4]
+    block_number = web3.eth.blockNumber
+    empty_multivault.transact({"from": team_multisig}).addInvestor(rows[0].address, rows[0].amount)
+
+    earlier = reconcile_vault(web3, empty_multivault, rows, block_identifier=block_number)
+    assert earlier.missing == rows
+
+
+#: MultiVault.balances(), enough ABI to encode and decode the reconciliation calls
+BALANCES_ABI = [{"type": "function", "name": "balances", "constant": True, "inputs": [{"name": "", "type": "address"}], "outputs": [{"name": "", "type": "uint256"}]}]
+
+
+class HistoricNode:
+    """Just enough of web3 for batched eth_call: a node that answers calls at any past block.
+
+    :param balances: Block number -> address -> vault balance at that block
+    """
+
+    def __init__(self, balances: dict):
+        self.balances = balances
+        self.calls = []
+        self.currentProvider = None
+        self._requestManager = SimpleNamespace(request_blocking=self.request_blocking)
+
+    def request_blocking(self, method, params):
+        if method == "eth_call":
+            tx, block = params
+            self.calls.append(block)
+            address = "0x" + tx["data"][-40:]
+            return "0x{:064x}".format(self.balances[int(block, 16)].get(address, 0))
+        raise AssertionError("Unexpected call {}".format(method))
+
+
+def test_reconcile_vault_pinned_block():
+    """Every balance is read at the pinned block, not at the latest one."""
+
+    rows = list(read_investor_data(FAKE_SEED_DATA))[0:4]
+    node = HistoricNode({
+        10: {rows[0].address.lower(): rows[0].amount},
+        11: {row.address.lower(): row.amount for row in rows},
+    })
+    vault = Web3(BaseProvider()).eth.contract(abi=BALANCES_ABI)(address="0x0000000000000000000000000000000000001000")
+
+    earlier = reconcile_vault(node, vault, rows, block_identifier=10)
+    assert node.calls == [hex(10)] * len(rows)
+    assert earlier.block_number == 10
+    assert earlier.matching == [rows[0]]
+    assert earlier.missing == rows[1:]
+
+    assert reconcile_vault(node, vault, rows, block_identifier=11).matching == rows
+
+
+def test_bulk_load_dropped():
+    """A transaction the node keeps forgetting is resent with the same nonce and then given up."""
+
+    node = StuckNode(keep=False)
+    sender = PipelinedSender(node, "0x0000000000000000000000000000000000000001", poll_interval=0, resend_after=0, max_attempts=3)
+    results = sender.run([("row", node.send)])
+
+    assert results[0].status == STATUS_DROPPED
+    assert results[0].attempts == 3
+    assert [tx["nonce"] for tx in node.sent] == [0, 0, 0]
+
+
+def test_bulk_load_replaced():
+    """Our nonce got mined without our transaction."""
+
+    node = StuckNode(replace=True)
+    sender = PipelinedSender(node, "0x0000000000000000000000000000000000000001", poll_interval=0, resend_after=0)
+    results = sender.run([("row", node.send)])
+
+    assert results[0].status == STATUS_REPLACED
+    assert results[0].attempts == 1
+
+
+def test_bulk_load_timeout():
+    """A transaction that sits in the pool times out, counting from its first broadcast."""
+
+    node = StuckNode()
+    sender = PipelinedSender(node, "0x0000000000000000000000000000000000000001", poll_interval=0.01, resend_after=0, timeout=0.05)
+    results = sender.run([("row", node.send)])
+
+    assert results[0].status == STATUS_TIMEOUT
+    assert results[0].attempts == 1
+    assert len(node.sent) == 1
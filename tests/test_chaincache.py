@@ -0,0 +1,103 @@
+"""On-disk deployed chain image invalidation."""
+import importlib.util
+import os
+import pickle
+from types import SimpleNamespace
+
+import pytest
+
+from helpers import chaincache
+from helpers.chaincache import IMAGE_VERSION, calculate_cache_key, get_image_filename, load_image, remove_stale_images
+
+
+ACCOUNTS = ["0x0000000000000000000000000000000000001000", "0x0000000000000000000000000000000000001001"]
+
+
+@pytest.fixture
+def compiled_project() -> SimpleNamespace:
+    """Stand-in for a populus project with one compiled contract."""
+    return SimpleNamespace(compiled_contracts={
+        "MysteriumToken": {"bytecode": "0x6060", "bytecode_runtime": "0x6061"},
+    })
+
+
+@pytest.fixture
+def yaml_filename(tmpdir) -> str:
+    fname = tmpdir.join("deployment.yml")
+    fname.write("kovan:\n  contracts: {}\n")
+    return str(fname)
+
+
+def load_module(fname: str):
+    spec = importlib.util.spec_from_file_location("deployer", fname)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_cache_key_stable(compiled_project, yaml_filename):
+    """Same inputs give the same image."""
+    assert calculate_cache_key(compiled_project, yaml_filename, ACCOUNTS) == calculate_cache_key(compiled_project, yaml_filename, ACCOUNTS)
+
+
+def test_cache_key_invalidation(tmpdir, monkeypatch, compiled_project, yaml_filename):
+    """Any change to contracts, definition, accounts, deployer code or libraries gives a new key."""
+
+    deployer = tmpdir.join("deployer.py")
+    deployer.write("GAS = 1\n")
+    module = load_module(str(deployer))
+
+    keys = set()
+    keys.add(calculate_cache_key(compiled_project, yaml_filename, ACCOUNTS, [module]))
+
+    compiled_project.compiled_contracts["MysteriumToken"]["bytecode"] = "0x6062"
+    keys.add(calculate_cache_key(compiled_project, yaml_filename, ACCOUNTS, [module]))
+
+    tmpdir.join("deployment.yml").write("kovan:\n  contracts: {token: {}}\n")
+    keys.add(calculate_cache_key(compiled_project, yaml_filename, ACCOUNTS, [module]))
+
+    keys.add(calculate_cache_key(compiled_project, yaml_filename, list(reversed(ACCOUNTS)), [module]))
+
+    deployer.write("GAS = 2\n")
+    keys.add(calculate_cache_key(compiled_project, yaml_filename, ACCOUNTS, [module]))
+
+    versions = chaincache.get_library_versions()
+    versions["populus"] = "0.0.0"
+    monkeypatch.setattr(chaincache, "get_library_versions", lambda: versions)
+    keys.add(calculate_cache_key(compiled_project, yaml_filename, ACCOUNTS, [module]))
+
+    assert len(keys) == 6
+
+
+def test_load_image_stale(tmpdir):
+    """Images stored under another key or format are not restored."""
+
+    fname = str(tmpdir.join("image.pickle"))
+
+    with open(fname, "wb") as out:
+        pickle.dump({"version": IMAGE_VERSION, "key": "old", "contracts": {}}, out)
+    assert load_image(None, fname, "new") is None
+
+    with open(fname, "wb") as out:
+        pickle.dump({"version": IMAGE_VERSION - 1, "key": "new", "contracts": {}}, out)
+    assert load_image(None, fname, "new") is None
+
+    with open(fname, "wb") as out:
+        out.write(b"broken")
+    assert load_image(None, fname, "new") is None
+
+
+def test_remove_stale_images(tmpdir):
+    """Only the current image of a deployment is kept, images of other deployments stay."""
+
+    cache_dir = str(tmpdir.join("chain-cache"))
+    os.makedirs(cache_dir)
+    old, new = "0" * 64, "1" * 64
+    images = (("crowdsales/mysterium.yml", old), ("crowdsales/mysterium.yml", new), ("crowdsales/mysterium-testrpc.yml", old))
+    for yaml_filename, key in images:
+        with open(get_image_filename(cache_dir, yaml_filename, key), "wb") as out:
+            out.write(b"image")
+
+    remove_stale_images(cache_dir, "crowdsales/mysterium.yml", new)
+
+    assert sorted(os.listdir(cache_dir)) == ["mysterium-{}.pickle".format(new), "mysterium-testrpc-{}.pickle".format(old)]
@@ -228,3 +228,103 @@ def test_distribution_14m(chain, mysterium_token, preico_funding_goal, preico_st
 
     assert total_coins + 193 == earlybird_coins + regular_coins + future_round_coins + foundation_coins + team_coins + seed_coins_vault1 + seed_coins_vault2
 
+
+
+def test_cache_caps(started_crowdsale, team_multisig, customer):
+    """The first buy caches the caps, cached caps are the same as converted ones and follow the owner changes."""
+
+    crowdsale = started_crowdsale
+
+    hard_cap = crowdsale.call().getHardCap()
+    minimum = crowdsale.call().getMinimumFundingGoal()
+    assert not crowdsale.call().capsCached()
+
+    crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buy()
+    assert crowdsale.call().capsCached()
+    assert crowdsale.call().getHardCap() == hard_cap
+    assert crowdsale.call().getMinimumFundingGoal() == minimum
+
+    crowdsale.transact({"from": team_multisig}).setHardCapCHF(10000000 * 10000)
+    assert abs(in_chf(crowdsale.call().getHardCap()) - 10000000) < 10
+
+    crowdsale.transact({"from": team_multisig}).setMinimumFundingLimit(1000000 * 10000)
+    assert abs(in_chf(crowdsale.call().getMinimumFundingGoal()) - 1000000) < 10
+
+
+def test_cache_caps_new_pricing(chain, started_crowdsale, team_multisig, customer):
+    """Swapping the pricing after the caps are cached converts them with the new pricing."""
+
+    crowdsale = started_crowdsale
+    crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buy()
+    assert crowdsale.call().capsCached()
+
+    # 240 CHF = 1 ETH, the rate cannot be set after the start so it goes to the constructor
+    tx = {"from": team_multisig}
+    pricing, hash = chain.provider.deploy_contract("MysteriumPricing", deploy_args=[240 * 10000], deploy_transaction=tx)
+    pricing.transact(tx).setCrowdsale(crowdsale.address)
+
+    crowdsale.transact(tx).setPricingStrategy(pricing.address)
+    assert crowdsale.call().capsCached()
+    assert crowdsale.call().getHardCap() == pricing.call().convertToWei(crowdsale.call().hardCapCHF())
+    assert crowdsale.call().getMinimumFundingGoal() == pricing.call().convertToWei(crowdsale.call().minimumFundingCHF())
+    assert abs(in_chf(crowdsale.call().getHardCap()) * 2 - 14000000) < 10
+
+
+def test_cache_caps_early(ready_crowdsale, team_multisig, customer):
+    """Early participant buys do not cache the caps while the CHF rate can still change."""
+
+    crowdsale = ready_crowdsale
+    assert crowdsale.call().getState() == CrowdsaleState.PreFunding
+
+    crowdsale.transact({"from": team_multisig}).setEarlyParicipantWhitelist(customer, True)
+    crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buy()
+    assert not crowdsale.call().capsCached()
+
+
+def test_cached_prices_follow_rate(crowdsale, mysterium_pricing, team_multisig):
+    """Pricing converts the soft cap and token prices again when the rate or soft cap changes."""
+
+    mysterium_pricing.transact({"from": team_multisig}).setConversionRate(240 * 10000)
+    assert mysterium_pricing.call().softCapInWeis() == mysterium_pricing.call().convertToWei(6000000 * 10000)
+    assert mysterium_pricing.call().softCapTokenPrice() == mysterium_pricing.call().convertToWei(10000)
+    assert mysterium_pricing.call().hardCapTokenPrice() == to_wei(1.2/240, "ether")
+
+    mysterium_pricing.transact({"from": team_multisig}).setSoftCapCHF(3000000 * 10000)
+    assert mysterium_pricing.call().getSoftCapInWeis() == mysterium_pricing.call().convertToWei(3000000 * 10000)
+
+
+def test_buy_gas_cached_caps(chain, ready_crowdsale, converting_mysterium_world, team_multisig, customer, customer_2, accounts):
+    """Compare buy() gas before and after caching the caps and prices in wei.
+
+    The before numbers come from the contracts as they were before the caching, see contracts/test/Converting*.sol.
+    Run with ``py.test -s`` to see the numbers.
+    """
+
+    converting_crowdsale = converting_mysterium_world["crowdsale"]
+    token = converting_mysterium_world["token"]
+    finalize_agent = converting_mysterium_world["finalize_agent"]
+    converting_crowdsale.transact({"from": team_multisig}).setFinalizeAgent(finalize_agent.address)
+    token.transact({"from": team_multisig}).setReleaseAgent(team_multisig)
+    token.transact({"from": team_multisig}).setTransferAgent(finalize_agent.address, True)
+    token.transact({"from": team_multisig}).setMintAgent(finalize_agent.address, True)
+
+    # Both crowdsales have the same start time
+    time_travel(chain, ready_crowdsale.call().startsAt() + 1)
+
+    customer_3 = accounts[3]
+    value = to_wei(1, "ether")
+
+    def measure_buy(crowdsale):
+        # The first purchases initialize the totals and cache the caps, so measure the third one
+        assert crowdsale.call().getState() == CrowdsaleState.Funding
+        crowdsale.transact({"from": customer, "value": value}).buy()
+        crowdsale.transact({"from": customer_2, "value": value}).buy()
+        txid = crowdsale.transact({"from": customer_3, "value": value}).buy()
+        return chain.wait.for_receipt(txid)["gasUsed"]
+
+    converted_gas = measure_buy(converting_crowdsale)
+    cached_gas = measure_buy(ready_crowdsale)
+
+    print("buy() gas, caps and prices converted: {}, cached: {}, saved: {}".format(converted_gas, cached_gas, converted_gas - cached_gas))
+    assert ready_crowdsale.call().capsCached()
+    assert cached_gas < converted_gas
@@ -0,0 +1,116 @@
+"""Index crowdsale events to SQLite."""
+from types import SimpleNamespace
+
+import pytest
+from eth_utils import to_wei
+
+from helpers.crowdsale_index import CrowdsaleIndex
+from helpers.events import fetch_logs
+
+
+@pytest.fixture
+def crowdsale_index(web3, started_crowdsale, tmpdir) -> CrowdsaleIndex:
+    return CrowdsaleIndex(web3, started_crowdsale, str(tmpdir.join("crowdsale.sqlite")))
+
+
+def test_index_investments(web3, started_crowdsale, crowdsale_index, customer, customer_2, team_multisig):
+    """Indexed totals match the contract."""
+    crowdsale = started_crowdsale
+    crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buy()
+    crowdsale.transact({"from": customer_2, "value": to_wei(3, "ether")}).buyWithCustomerId(42)
+    crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buyWithCustomerId(42)
+
+    assert crowdsale_index.sync() == 3
+
+    totals = crowdsale_index.get_totals()
+    assert totals["wei_raised"] == crowdsale.call().weiRaised()
+    assert totals["tokens_sold"] == crowdsale.call().tokensSold()
+    assert totals["investor_count"] == crowdsale.call().investorCount()
+
+    for investor in (customer, customer_2):
+        assert crowdsale_index.get_investor(investor) == (crowdsale.call().investedAmountOf(investor), crowdsale.call().tokenAmountOf(investor))
+
+    leaderboard = crowdsale_index.leaderboard(10)
+    assert [row[0] for row in leaderboard] == [customer_2.lower(), customer.lower()]
+    assert leaderboard[1][3] == 2
+
+    customers = crowdsale_index.get_customer_totals()
+    assert customers[42][0] == to_wei(4, "ether")
+    assert customers[0][0] == to_wei(1, "ether")
+
+    series = crowdsale_index.get_wei_raised_series()
+    assert [wei for block_number, timestamp, wei in series] == [to_wei(wei, "ether") for wei in (1, 4, 5)]
+
+
+def test_index_incremental(web3, started_crowdsale, crowdsale_index, customer, team_multisig):
+    """Sync picks up only the new events and follows endsAt changes."""
+    crowdsale = started_crowdsale
+    crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buy()
+    assert crowdsale_index.sync() == 1
+    assert crowdsale_index.get_ends_at() is None
+
+    ends_at = crowdsale.call().endsAt() + 3600
+    crowdsale.transact({"from": team_multisig}).setEndsAt(ends_at)
+    crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buy()
+
+    assert crowdsale_index.sync() == 2
+    assert crowdsale_index.sync() == 0
+    assert crowdsale_index.get_ends_at() == ends_at
+    assert crowdsale_index.get_checkpoint()[0] == web3.eth.blockNumber
+    assert crowdsale_index.get_totals()["wei_raised"] == to_wei(2, "ether")
+
+
+def test_index_rollback(web3, started_crowdsale, crowdsale_index, customer):
+    """Events after a rolled back block are forgotten and indexed again."""
+    crowdsale = started_crowdsale
+    crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buy()
+    crowdsale_index.sync()
+    fork_point = web3.eth.blockNumber
+    crowdsale.transact({"from": customer, "value": to_wei(2, "ether")}).buy()
+    crowdsale_index.sync()
+
+    crowdsale_index.rollback(fork_point)
+    assert crowdsale_index.get_totals()["wei_raised"] == to_wei(1, "ether")
+    assert crowdsale_index.get_checkpoint()[0] == fork_point
+
+    assert crowdsale_index.sync() == 1
+    assert crowdsale_index.get_totals()["wei_raised"] == to_wei(3, "ether")
+
+
+class FilterOnlyNode:
+    """Just enough of web3 for fetch_logs: a node with log filters but no eth_getLogs, like eth-testrpc."""
+
+    def __init__(self, logs: list):
+        self.logs = logs
+        self.filters = {}
+        self.currentProvider = None
+        self._requestManager = SimpleNamespace(request_blocking=self.request_blocking)
+
+    def request_blocking(self, method, params):
+        if method == "eth_getLogs":
+            raise AttributeError("'RPCMethods' object has no attribute 'eth_getLogs'")
+        if method == "eth_newFilter":
+            filter_id = len(self.filters) + 1
+            self.filters[filter_id] = params[0]
+            return filter_id
+        if method == "eth_getFilterLogs":
+            log_filter = self.filters[params[0]]
+            start, end = int(log_filter["fromBlock"], 16), int(log_filter["toBlock"], 16)
+            return [log for log in self.logs if start <= int(log["blockNumber"], 16) <= end and log["topics"][0] == log_filter["topics"][0]]
+        if method == "eth_uninstallFilter":
+            return self.filters.pop(params[0], None) is not None
+        raise AssertionError("Unexpected call {}".format(method))
+
+
+def test_fetch_logs_filter_fallback():
+    """Nodes without eth_getLogs are queried through log filters, which are uninstalled afterwards."""
+    topics = ["0x" + "01" * 32, "0x" + "02" * 32]
+    logs = [{"blockNumber": hex(block_number), "topics": [topic]} for block_number in (1, 5, 9) for topic in topics + ["0x" + "03" * 32]]
+    node = FilterOnlyNode(logs)
+
+    chunks = list(fetch_logs(node, "0x0000000000000000000000000000000000001000", topics, 0, 9, initial_range=4))
+
+    assert [(start, end) for start, end, chunk_logs in chunks] == [(0, 3), (4, 9)]
+    fetched = [log for start, end, chunk_logs in chunks for log in chunk_logs]
+    assert sorted((log["blockNumber"], log["topics"][0]) for log in fetched) == sorted((log["blockNumber"], log["topics"][0]) for log in logs if log["topics"][0] in topics)
+    assert node.filters == {}
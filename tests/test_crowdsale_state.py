@@ -0,0 +1,63 @@
+"""Per block cached crowdsale state."""
+import threading
+
+from eth_utils import to_wei
+
+from ico.state import CrowdsaleState
+
+from helpers.crowdsale_state import CrowdsaleStateCache, read_crowdsale_state
+
+
+def test_read_state(web3, started_crowdsale, mysterium_pricing, customer):
+    """The batch gives the same values as separate calls."""
+    crowdsale = started_crowdsale
+    crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buy()
+
+    state = read_crowdsale_state(web3, crowdsale, mysterium_pricing, web3.eth.blockNumber)
+    assert state.state == CrowdsaleState.Funding
+    assert state.wei_raised == crowdsale.call().weiRaised() == to_wei(1, "ether")
+    assert state.tokens_sold == crowdsale.call().tokensSold()
+    assert state.ends_at == crowdsale.call().endsAt()
+    assert state.soft_cap_reached == crowdsale.call().isSoftCapReached()
+    assert state.soft_cap_triggered == crowdsale.call().softCapTriggered()
+    assert state.crowdsale_full == crowdsale.call().isCrowdsaleFull()
+    assert state.minimum_funding_goal == crowdsale.call().getMinimumFundingGoal()
+    assert state.chf_rate == mysterium_pricing.call().chfRate()
+    assert state.as_dict()["state"] == "Funding"
+
+
+def test_cache_per_block(web3, started_crowdsale, mysterium_pricing, customer):
+    """A block is fetched once, older blocks stay readable."""
+    crowdsale = started_crowdsale
+    cache = CrowdsaleStateCache(web3, crowdsale, mysterium_pricing, block_ttl=0)
+
+    before = cache.get()
+    assert cache.get() is before
+    assert cache.fetches == 1
+
+    crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buy()
+    after = cache.get()
+    assert after.block_number == before.block_number + 1
+    assert after.wei_raised == before.wei_raised + to_wei(1, "ether")
+    assert cache.get(before.block_number) is before
+    assert cache.fetches == 2
+
+
+def test_cache_concurrent_readers(web3, crowdsale, mysterium_pricing):
+    """Readers at the same time share one fetch."""
+    cache = CrowdsaleStateCache(web3, crowdsale, mysterium_pricing)
+    block_number = web3.eth.blockNumber
+    results = []
+
+    def read():
+        results.append(cache.get(block_number))
+
+    threads = [threading.Thread(target=read) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 8
+    assert all(result is results[0] for result in results)
+    assert cache.fetches == 1
@@ -5,11 +5,15 @@ import datetime
 import pytest
 from eth_utils import to_wei
 
+import ico.deploy
+import ico.definition
 from ico.deploy import _deploy_contracts
 from ico.definition import load_crowdsale_definitions
 from ico.state import CrowdsaleState
 from ico.tests.utils import time_travel
 
+from helpers.chaincache import deploy_cached
+
 
 from web3.contract import Contract
 
@@ -32,18 +36,46 @@ def fake_seed_investor(accounts):
     return accounts[7]
 
 
-@pytest.fixture
-def everything_deployed(project, chain, web3, accounts, deploy_address):
-    """Deploy our token plan."""
+#: Where deployed chain images are stored between test runs
+CHAIN_CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "build", "chain-cache")
+
+
+@pytest.fixture(scope="session")
+def session_chain(session_project):
+    """A chain of its own for the full deployment, so that the cached image can replace its whole state."""
+    with session_project.get_chain("tester") as chain:
+        yield chain
+
+
+@pytest.fixture(scope="session", autouse=True)
+def everything_deployed_session(session_project, session_chain):
+    """Deploy our token plan once, or restore it from the on-disk chain image.
+
+    Autouse, so that it is deployed before the first test of this module takes its chain snapshot.
+    """
+    web3 = session_chain.web3
+    deploy_address = web3.eth.accounts[9]
     yaml_filename = os.path.join(os.path.dirname(__file__), "..", "crowdsales", "mysterium-testrpc.yml")
     deployment_name = "kovan"
     chain_data = load_crowdsale_definitions(yaml_filename, deployment_name)
-    runtime_data, statistics, contracts = _deploy_contracts(project, chain, web3, yaml_filename, chain_data, deploy_address)
-    return contracts
+    contract_names = {name: data["contract_name"] for name, data in chain_data["contracts"].items()}
+
+    def deploy():
+        runtime_data, statistics, contracts = _deploy_contracts(session_project, session_chain, web3, yaml_filename, chain_data, deploy_address)
+        return contracts
+
+    deployer_modules = [ico.deploy, ico.definition]
+    return deploy_cached(session_project, session_chain, yaml_filename, web3.eth.accounts, contract_names, deploy, CHAIN_CACHE_DIR, deployer_modules)
+
+
+@pytest.fixture
+def everything_deployed(chain, everything_deployed_session, deploy_address):
+    """Our token plan, changes are reverted after each test."""
+    return everything_deployed_session
 
 
 @pytest.fixture()
-def proxy_buyer_freeze_ends_at(chain, crowdsale) -> Contract:
+def proxy_buyer_freeze_ends_at(chain) -> Contract:
     """When investors can reclaim."""
     return int(datetime.datetime(2017, 6, 10).timestamp())
 
@@ -0,0 +1,138 @@
+"""Deploy the crowdsale definition in dependency waves."""
+import os
+
+import pytest
+
+from ico.definition import load_crowdsale_definitions
+from ico.state import CrowdsaleState
+
+from helpers.bulksend import STATUS_SUCCESS
+from helpers.deploy_dag import DEFAULT_GAS, build_plan, deploy_dag, run_verify_actions, send_wave, write_deployment_report, load_deployment_report, plan_incremental
+
+
+CROWDSALES_DIR = os.path.join(os.path.dirname(__file__), "..", "crowdsales")
+
+
+@pytest.fixture()
+def deploy_address(accounts):
+    """Operational control account"""
+    return accounts[9]
+
+
+def test_plan_mainnet(deploy_address):
+    """Mainnet rollout takes four waves instead of a confirmation per transaction."""
+    chain_data = load_crowdsale_definitions(os.path.join(CROWDSALES_DIR, "mysterium-mainnet.yml"), "mainnet")
+    plan = build_plan(chain_data, deploy_address)
+
+    assert plan.depth == 4
+    assert len(plan.steps) == 23
+
+    names = [[step.name for step in wave if step.kind == "deploy"] for wave in plan.waves]
+    assert "token" in names[0]
+    assert names[1] == ["crowdsale"]
+    assert names[2] == ["token_distribution"]
+    assert names[3] == []
+
+    # Everything goes out from the deploy address, so the post actions share waves
+    assert all(step.sender == deploy_address for step in plan.steps)
+
+
+def test_plan_barrier(deploy_address):
+    """Post actions that are not plain transactions run alone and split the waves."""
+    chain_data = load_crowdsale_definitions(os.path.join(CROWDSALES_DIR, "mysterium-mainnet.yml"), "mainnet")
+    chain_data["post_actions"] = "\n".join([
+        'confirm_tx(token.transact({"from": deploy_address}).setMintAgent(crowdsale.address, True))',
+        'print("Halfway")',
+        'confirm_tx(token.transact({"from": deploy_address}).setReleaseAgent(deploy_address))',
+    ])
+    plan = build_plan(chain_data, deploy_address)
+
+    kinds = [[step.kind for step in wave] for wave in plan.waves[2:]]
+    assert kinds == [["deploy", "tx"], ["barrier"], ["tx"]]
+
+    # Leaving out the barrier keeps the ordering it gave
+    barrier = plan.waves[3][0]
+    plan = plan.without({barrier.key})
+    kinds = [[step.kind for step in wave] for wave in plan.waves[2:]]
+    assert kinds == [["deploy", "tx"], ["tx"]]
+
+
+def test_send_wave_dependent(chain, web3, deploy_address):
+    """A transaction that depends on an earlier one of the same wave is estimated after that is mined."""
+    tx = {
+        "from": deploy_address
+    }
+    token, hash = chain.provider.deploy_contract('MysteriumToken', deploy_args=["Mysterium", "MYST", 0, 8], deploy_transaction=tx)
+
+    jobs = {
+        deploy_address: [
+            ("release_agent", lambda tx: token.transact(tx).setReleaseAgent(deploy_address), None, lambda: token.estimateGas(tx).setReleaseAgent(deploy_address)),
+            ("release", lambda tx: token.transact(tx).releaseTokenTransfer(), None, lambda: token.estimateGas(tx).releaseTokenTransfer()),
+        ]
+    }
+
+    results = send_wave(web3, jobs)
+    assert [result.key for result in results] == ["release_agent", "release"]
+    assert all(result.status == STATUS_SUCCESS for result in results)
+    assert results[1].gas < DEFAULT_GAS
+    assert token.call().released()
+
+
+def test_deploy_dag(chain, web3, deploy_address):
+    """Deploy the test definition wave by wave and run its sanity checks."""
+    yaml_filename = os.path.join(CROWDSALES_DIR, "mysterium-testrpc.yml")
+    chain_data = load_crowdsale_definitions(yaml_filename, "kovan")
+
+    runtime_data, statistics, contracts = deploy_dag(chain, chain_data, deploy_address)
+    assert statistics["waves"] == 4
+    assert statistics["deployed"] == 9
+
+    run_verify_actions(web3, chain_data, runtime_data, contracts)
+
+    token = contracts["token"]
+    crowdsale = contracts["crowdsale"]
+    token_distribution = contracts["token_distribution"]
+
+    assert runtime_data["contracts"]["crowdsale"]["address"] == crowdsale.address
+    assert token.call().mintAgents(crowdsale.address)
+    assert token.call().mintAgents(token_distribution.address)
+    assert crowdsale.call().finalizeAgent() == token_distribution.address
+    assert contracts["pricing_strategy"].call().crowdsale() == crowdsale.address
+    assert crowdsale.call().getState() == CrowdsaleState.PreFunding
+
+
+def test_deploy_incremental(chain, web3, deploy_address, tmpdir):
+    """Deploying again from the report only redeploys what changed and what depends on it."""
+    yaml_filename = str(tmpdir.join("mysterium-testrpc.yml"))
+    chain_data = load_crowdsale_definitions(os.path.join(CROWDSALES_DIR, "mysterium-testrpc.yml"), "kovan")
+
+    # The vault freeze is relative to time(), which would change the arguments on every run
+    chain_data["contracts"]["seed_participant_vault_2"]["arguments"]["_freezeEndsAt"] = 1528391820
+
+    runtime_data, statistics, contracts = deploy_dag(chain, chain_data, deploy_address)
+    write_deployment_report(yaml_filename, runtime_data)
+    report = load_deployment_report(yaml_filename)
+
+    # Nothing changed
+    incremental_data, plan, reasons, executed_actions = plan_incremental(chain, chain_data, deploy_address, report)
+    assert all(reason is None for reason in reasons.values())
+    assert plan.depth == 0
+    assert len(executed_actions) == len(report["executed_actions"])
+
+    # The crowdsale refers to the intermediate vault, and the token distribution to the crowdsale
+    chain_data["contracts"]["intermediate_vault"]["arguments"]["_unlockedAt"] = 2
+    incremental_data, plan, reasons, executed_actions = plan_incremental(chain, chain_data, deploy_address, report)
+    redeployed = {name for name, reason in reasons.items() if reason}
+    assert redeployed == {"intermediate_vault", "crowdsale", "token_distribution"}
+    assert reasons["intermediate_vault"] == "constructor arguments changed"
+    assert all(step.refs & redeployed for step in plan.steps)
+
+    runtime_data, statistics, new_contracts = deploy_dag(chain, incremental_data, deploy_address, plan=plan, executed_actions=executed_actions)
+    assert statistics["deployed"] == 3
+    run_verify_actions(web3, incremental_data, runtime_data, new_contracts)
+
+    assert new_contracts["token"].address == contracts["token"].address
+    assert new_contracts["crowdsale"].address != contracts["crowdsale"].address
+    assert new_contracts["token"].call().mintAgents(new_contracts["crowdsale"].address)
+    assert new_contracts["seed_participant_vault"].call().crowdsale() == new_contracts["crowdsale"].address
+    assert set(runtime_data["executed_actions"]) == set(report["executed_actions"])
@@ -0,0 +1,80 @@
+"""Distribution model against the spreadsheet values and the minted constants."""
+import time
+
+import numpy as np
+
+from helpers.distribution_model import calculate_distribution, calculate_distribution_exact, get_distribute_constants, DECIMAL_SCALE
+
+
+#: Tokens sold in the 14M CHF test scenario, see test_distribution_14m
+EARLYBIRD_COINS_14M = 771459337903602
+REGULAR_COINS_14M = 757142793161612
+
+
+def test_distribute_constants():
+    """Exact mode reproduces what MysteriumTokenDistribution.distribute() mints."""
+    constants = get_distribute_constants(14 * 1000000, 204, EARLYBIRD_COINS_14M, REGULAR_COINS_14M)
+    assert constants == {
+        "future_round_coins": 486500484333000,
+        "foundation_coins": 291900290600000,
+        "team_coins": 324333656222000,
+        "seed_coins_vault1": 122400000000000,
+        "seed_coins_vault2": 489600000000000,
+    }
+
+
+def test_distribute_constants_onchain(mysterium_finalize_agent, team_multisig):
+    """Compare to the values the contract stores."""
+    mysterium_finalize_agent.transact({"from": team_multisig}).distribute(14 * 1000000, 204)
+
+    constants = get_distribute_constants(14 * 1000000, 204, EARLYBIRD_COINS_14M, REGULAR_COINS_14M)
+    for name, value in constants.items():
+        assert getattr(mysterium_finalize_agent.call(), name)() == value
+
+
+def test_total_coins_exact():
+    dist = calculate_distribution_exact(14 * 1000000, 204, EARLYBIRD_COINS_14M, REGULAR_COINS_14M)
+    assert dist["seed_coins"] == 612000000000000
+    assert dist["total_coins"] == 3243336562220021
+
+
+def test_calculator_example():
+    """Values the old coins_calculator script printed for 80M CHF raised at 88 CHF/ETH."""
+    dist = calculate_distribution(80000000, 88)
+    assert dist["earlybird_coins"] == 7200000
+    assert dist["regular_coins"] == 74000000
+    assert dist["seed_multiplier"] == 5
+    assert dist["seed_coins"] == 2640000
+    assert dist["future_round_percentage"] == 15
+    assert dist["seed_coins_vault1"] == 528000
+    assert dist["seed_coins_vault2"] == 2112000
+
+
+def test_piecewise_segments():
+    """Seed multiplier and future round percentage at the segment ends and in the sloped part."""
+    dist = calculate_distribution(np.array([1000000, 2000000, 4000000, 6000000, 10000000]), 100)
+    assert list(dist["seed_multiplier"]) == [1, 1, 3, 5, 5]
+    assert list(dist["future_round_percentage"]) == [50, 50, 32.5, 15, 15]
+
+
+def test_exact_matches_float():
+    """Both modes agree over a grid, apart from float precision."""
+    raised, price = np.meshgrid(np.arange(1000000, 20000000, 250000), np.arange(50, 400, 10))
+    dist = calculate_distribution(raised, price)
+    exact = calculate_distribution_exact(raised, price)
+
+    for name in ("earlybird_coins", "regular_coins", "seed_coins", "total_coins", "future_round_coins", "seed_coins_vault1", "seed_coins_vault2"):
+        tokens = exact[name].astype(np.float64) / DECIMAL_SCALE
+        assert np.allclose(tokens, dist[name], rtol=1e-12, atol=1e-6), name
+
+
+def test_grid_speed():
+    """A 1000x1000 scenario grid is evaluated in one pass."""
+    raised, price = np.meshgrid(np.linspace(1e6, 20e6, 1000), np.linspace(50, 400, 1000))
+
+    started = time.time()
+    dist = calculate_distribution(raised, price)
+    duration = time.time() - started
+
+    assert dist["total_coins"].shape == (1000, 1000)
+    assert duration < 1.0
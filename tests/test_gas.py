@@ -0,0 +1,170 @@
+"""Gas used by the entry points our users pay for.
+
+Checked against tests/gas-baseline.json, see helpers.gasbench.
+"""
+import time
+
+import pytest
+from eth_utils import to_wei
+from web3.contract import Contract
+
+from ico.tests.utils import time_travel
+
+from helpers.gasbench import check_gas, format_comparison, load_baseline, merge_shard_baselines, save_baseline
+
+
+@pytest.fixture
+def released_token(chain, team_multisig) -> Contract:
+    """Token with initial supply in team multisig and transfers released."""
+    tx = {
+        "from": team_multisig
+    }
+    token, hash = chain.provider.deploy_contract('MysteriumToken', deploy_args=["Mysterium", "MYST", 1000000, 8], deploy_transaction=tx)
+    token.transact(tx).setReleaseAgent(team_multisig)
+    token.transact(tx).releaseTokenTransfer()
+    return token
+
+
+def deploy_multivault(chain, contract_name, token, freeze_ends_at, team_multisig) -> Contract:
+    tx = {
+        "from": team_multisig
+    }
+    contract, hash = chain.provider.deploy_contract(contract_name, deploy_args=[team_multisig, freeze_ends_at], deploy_transaction=tx)
+    contract.transact(tx).setToken(token.address)
+    return contract
+
+
+def test_gas_buy(started_crowdsale, mysterium_pricing, team_multisig, customer, customer_2, gas_meter):
+    """buy() of a new and a returning investor, below and above the soft cap, and the one triggering it."""
+    crowdsale = started_crowdsale
+    value = to_wei(1, "ether")
+
+    txid = crowdsale.transact({"from": customer, "value": value}).buy()
+    gas_meter.record("Crowdsale.buy/first_investment", txid)
+
+    txid = crowdsale.transact({"from": customer_2, "value": value}).buy()
+    gas_meter.record("Crowdsale.buy/new_investor", txid)
+
+    txid = crowdsale.transact({"from": customer_2, "value": value}).buy()
+    gas_meter.record("Crowdsale.buy/returning_investor", txid)
+
+    mysterium_pricing.transact({"from": team_multisig}).setSoftCapCHF(6000000 * 10000)
+    cap = mysterium_pricing.call().getSoftCapInWeis()
+    txid = crowdsale.transact({"from": customer, "value": cap}).buy()
+    assert crowdsale.call().softCapTriggered()
+    gas_meter.record("Crowdsale.buy/trigger_soft_cap", txid)
+
+    txid = crowdsale.transact({"from": customer_2, "value": value}).buy()
+    gas_meter.record("Crowdsale.buy/above_soft_cap", txid)
+
+
+def test_gas_buy_with_customer_id(started_crowdsale, customer, gas_meter):
+    """buyWithCustomerId() records the customer totals too."""
+    txid = started_crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buyWithCustomerId(1)
+    gas_meter.record("Crowdsale.buyWithCustomerId/first_investment", txid)
+
+
+def test_gas_distribute(started_crowdsale, mysterium_finalize_agent, team_multisig, gas_meter):
+    """Token distribution mints to all the vaults."""
+    txid = mysterium_finalize_agent.transact({"from": team_multisig}).distribute(14 * 1000000, 204)
+    gas_meter.record("MysteriumTokenDistribution.distribute", txid)
+
+
+def test_gas_multivault(chain, released_token, freeze_ends_at, team_multisig, customer, customer_2, gas_meter):
+    """Loading investors, fetching the balance and claiming, in MultiVault and in the packed layout side by side."""
+    vaults = [(name, deploy_multivault(chain, name, released_token, freeze_ends_at, team_multisig)) for name in ("MultiVault", "PackedMultiVault")]
+    gas = {}
+
+    def record(contract_name, entry_point, txid):
+        gas[contract_name, entry_point] = gas_meter.record("{}.{}".format(contract_name, entry_point), txid)
+
+    for name, vault in vaults:
+        record(name, "addInvestor/new_investor", vault.transact({"from": team_multisig}).addInvestor(customer, 30))
+        record(name, "addInvestor/next_investor", vault.transact({"from": team_multisig}).addInvestor(customer_2, 70))
+
+        released_token.transact({"from": team_multisig}).transfer(vault.address, 1000)
+        record(name, "fetchTokenBalance", vault.transact({"from": team_multisig}).fetchTokenBalance())
+
+    time_travel(chain, freeze_ends_at + 1)
+    for name, vault in vaults:
+        before = released_token.call().balanceOf(customer)
+        record(name, "claimAll", vault.transact({"from": customer}).claimAll())
+        assert released_token.call().balanceOf(customer) - before == 300
+        assert vault.call().claimed(customer) == 300
+
+    # No investor counter to update, and the claimed amount shares the slot with the balance
+    for entry_point in ("addInvestor/new_investor", "addInvestor/next_investor", "claimAll"):
+        assert gas["PackedMultiVault", entry_point] < gas["MultiVault", entry_point]
+
+
+def test_gas_intermediate_vault_unlock(chain, web3, team_multisig, customer, gas_meter):
+    """Unlocking sends the vault balance to the team multisig."""
+    opens_at = int(time.time() + 30*24*3600)
+    vault, hash = chain.provider.deploy_contract('IntermediateVault', deploy_args=[team_multisig, opens_at], deploy_transaction={"from": team_multisig})
+    web3.eth.sendTransaction({"from": customer, "value": to_wei(10, "ether"), "to": vault.address})
+
+    time_travel(chain, opens_at + 1)
+    txid = vault.transact({"from": customer}).unlock()
+    gas_meter.record("IntermediateVault.unlock", txid)
+
+
+def test_gas_transfer(released_token, team_multisig, customer, gas_meter):
+    """Transfer to an address without and with a balance."""
+    txid = released_token.transact({"from": team_multisig}).transfer(customer, 100)
+    gas_meter.record("StandardToken.transfer/new_holder", txid)
+
+    txid = released_token.transact({"from": team_multisig}).transfer(customer, 100)
+    gas_meter.record("StandardToken.transfer/existing_holder", txid)
+
+
+def test_gas_upgrade(chain, released_token, team_multisig, gas_meter):
+    """The first upgrade starts the Upgrading state, later ones do not."""
+    tx = {
+        "from": team_multisig
+    }
+    target, hash = chain.provider.deploy_contract('TestMigrationTarget', deploy_args=[released_token.address], deploy_transaction=tx)
+    released_token.transact(tx).setUpgradeAgent(target.address)
+
+    txid = released_token.transact(tx).upgrade(1000)
+    gas_meter.record("UpgradeableToken.upgrade/first", txid)
+
+    txid = released_token.transact(tx).upgrade(1000)
+    gas_meter.record("UpgradeableToken.upgrade/next", txid)
+    assert target.call().balanceOf(team_multisig) == 2000
+
+
+def test_check_gas_strict():
+    """Entry points without a baseline pass unless strict."""
+    baseline = {"Crowdsale.buy": 100000}
+    assert check_gas("Crowdsale.buy", 102000, baseline) is None
+    assert "baseline 100000" in check_gas("Crowdsale.buy", 102001, baseline)
+    assert check_gas("MultiVault.claimAll", 50000, baseline) is None
+    assert "no baseline" in check_gas("MultiVault.claimAll", 50000, baseline, strict=True)
+
+
+def test_merge_shard_baselines(tmpdir):
+    """Gas measured by shard workers is folded to the baseline file."""
+    fname = str(tmpdir.join("gas-baseline.json"))
+    save_baseline(fname, {"a": 1, "b": 2})
+    save_baseline(fname + ".shard0", {"b": 3})
+    save_baseline(fname + ".shard2", {"c": 4})
+
+    merge_shard_baselines(fname, 3)
+
+    assert load_baseline(fname) == {"a": 1, "b": 3, "c": 4}
+    assert tmpdir.listdir() == [tmpdir.join("gas-baseline.json")]
+
+
+def test_format_comparison():
+    """Entry points both contracts have are listed side by side."""
+    baseline = {
+        "MultiVault.claimAll": 50000,
+        "PackedMultiVault.claimAll": 35000,
+        "MultiVault.distributeRange": 90000,
+        "Crowdsale.buy": 100000,
+    }
+    assert format_comparison(baseline, "MultiVault", "PackedMultiVault") == [
+        "| Entry point | MultiVault | PackedMultiVault | Change |",
+        "|---|---|---|---|",
+        "| `claimAll` | 50000 | 35000 | -15000 |",
+    ]
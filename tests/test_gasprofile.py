@@ -0,0 +1,44 @@
+"""Gas profile of traced transactions."""
+import pytest
+from eth_utils import decode_hex, to_wei
+
+from helpers.gasprofile import ContractResolver, GasProfile, INTRINSIC, add_tester_transactions, compile_source_maps, get_intrinsic_gas, parse_source_map, record_tester_traces
+
+
+@pytest.fixture(scope="module")
+def compiled_source_maps(session_project):
+    return compile_source_maps(session_project)
+
+
+def test_parse_source_map():
+    """Empty fields repeat the previous instruction."""
+    assert parse_source_map("1:2:0:-;;3::1:i;:5") == [(1, 2, 0, "-"), (1, 2, 0, "-"), (3, 2, 1, "i"), (3, 5, 1, "i")]
+
+
+def test_profile_buy(web3, started_crowdsale, customer, compiled_source_maps):
+    """buy() gas splits to the crowdsale functions, the token and SafeMathLib."""
+    crowdsale = started_crowdsale
+
+    with record_tester_traces() as recorder:
+        txid = crowdsale.transact({"from": customer, "value": to_wei(1, "ether")}).buy()
+        # Calls are traced too, but they are not charged
+        crowdsale.call().weiRaised()
+
+    profile = GasProfile(ContractResolver(web3, compiled_source_maps))
+    add_tester_transactions(web3, profile, recorder, root="buy")
+
+    gas_used = web3.eth.getTransactionReceipt(txid)["gasUsed"]
+    assert profile.transactions == 1
+    assert profile.gas_used == gas_used
+
+    # The last op of each call is charged its static fee, so memory expansion on return may be missed
+    charged = sum(profile.stacks.values())
+    assert abs(charged - gas_used) < gas_used * 0.01
+    data = decode_hex(web3.eth.getTransaction(txid)["input"])
+    assert profile.stacks["buy;" + INTRINSIC] == get_intrinsic_gas(data, create=False)
+
+    paths = list(profile.stacks.keys())
+    assert any("Crowdsale.buy" in path for path in paths)
+    assert any("MintableToken.mint" in path for path in paths)
+    assert any("SafeMathLib." in path for path in paths)
+    assert profile.storage
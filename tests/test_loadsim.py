@@ -0,0 +1,64 @@
+"""Crowdsale load simulator."""
+import os
+from types import SimpleNamespace
+
+from eth_utils import to_wei
+
+from ico.definition import load_crowdsale_definitions
+
+from helpers.bulksend import STATUS_ERROR
+from helpers.deploy_dag import deploy_dag
+from helpers.loadsim import KIND_CUSTOMER_ID, KIND_EARLY, KIND_PROXY, KIND_RETAIL, Purchase, drive, generate_population, simulate
+
+
+DEPLOYMENT_FILE = os.path.join(os.path.dirname(__file__), "..", "crowdsales", "mysterium-testrpc.yml")
+
+
+def test_generate_population():
+    """Same seed gives the same buyers, purchases add up to the asked total."""
+    total = to_wei(100000, "ether")
+    buyers = generate_population(100, total, seed=3)
+
+    assert buyers == generate_population(100, total, seed=3)
+    assert len(set(b.address for b in buyers)) == 100
+    assert sum(1 for b in buyers if b.kind == KIND_EARLY) == 2
+    assert sum(1 for b in buyers if b.kind == KIND_PROXY) == 5
+    assert all(b.customer_id for b in buyers if b.kind == KIND_CUSTOMER_ID)
+    assert abs(sum(b.value for b in buyers) - total) < to_wei(1, "ether")
+
+
+def test_drive_error():
+    """Purchases that blow up in an unexpected way are counted as errors."""
+
+    def send(purchase):
+        raise RuntimeError("Connection reset")
+
+    purchases = [Purchase(KIND_RETAIL, "0x0000000000000000000000000000000000001000", 1) for i in range(3)]
+    waiter = SimpleNamespace(web3=SimpleNamespace(currentProvider=None))
+    drive(purchases, send, waiter, 2, 1)
+
+    assert [p.status for p in purchases] == [STATUS_ERROR] * 3
+    assert all(p.error == "Connection reset" and p.latency is not None for p in purchases)
+
+
+def test_simulate(chain, web3, accounts):
+    """Oversubscribed sale triggers the soft cap, rejects over the hard cap and sells what the model expects."""
+    deploy_address = accounts[9]
+    chain_data = load_crowdsale_definitions(DEPLOYMENT_FILE, "kovan")
+    runtime_data, statistics, contracts = deploy_dag(chain, chain_data, deploy_address)
+
+    hard_cap = contracts["crowdsale"].call().getHardCap()
+    buyers = generate_population(40, int(hard_cap * 1.3), seed=2, early_share=0.05, proxy_share=0.05)
+    report = simulate(web3, chain, contracts, deploy_address, accounts[0], buyers, workers=4)
+
+    assert report["buyers"][KIND_EARLY] == 2
+    assert report["phases"]["spike"]["transactions"] == 36
+    assert report["phases"]["spike"]["tps"] > 0
+    assert report["phases"]["spike"]["latency"]["p50"] <= report["phases"]["spike"]["latency"]["max"]
+
+    assert report["soft_cap_triggered"] and report["expected_soft_cap_triggered"]
+    assert report["ends_at"] == report["expected_ends_at"] < report["ends_at_before"]
+
+    assert 0 < report["cap_rejections"] == report["failed"]
+    assert report["wei_raised"] == report["expected_wei_raised"] <= hard_cap
+    assert report["tokens_sold"] == report["expected_tokens_sold"]
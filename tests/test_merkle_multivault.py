@@ -0,0 +1,149 @@
+"""Merkle root vault."""
+
+import os
+from enum import IntEnum
+
+import pytest
+from ethereum.tester import TransactionFailed
+from web3.contract import Contract
+
+from helpers.investors import InvestorRow, read_investor_data
+from helpers.merkle import MerkleTree, CachedProofs, build_from_csv
+
+
+class MultiVaultState(IntEnum):
+    Unknown = 0
+    Holding = 1
+    Distributing = 2
+
+
+@pytest.fixture
+def investor_rows(customer, customer_2) -> list:
+    """Two real investors and some filler so that the proofs have depth."""
+    rows = [
+        InvestorRow(1, customer, 30),
+        InvestorRow(2, customer_2, 70),
+    ]
+    for i in range(5):
+        rows.append(InvestorRow(3 + i, "0x{:040x}".format(0x1000 + i), 20))
+    return rows
+
+
+@pytest.fixture
+def merkle_tree(investor_rows) -> MerkleTree:
+    return MerkleTree(investor_rows)
+
+
+@pytest.fixture
+def merkle_vault(chain, mysterium_mv_token, merkle_tree, team_multisig) -> Contract:
+    """A vault that unlocks immediately after the token balance is fetched."""
+    args = [
+        team_multisig,
+        1,
+        merkle_tree.root,
+        merkle_tree.total,
+    ]
+
+    tx = {
+        "from": team_multisig
+    }
+
+    contract, hash = chain.provider.deploy_contract('MerkleMultiVault', deploy_args=args, deploy_transaction=tx)
+    contract.transact({"from": team_multisig}).setToken(mysterium_mv_token.address)
+    return contract
+
+
+@pytest.fixture
+def distributing_merkle_vault(merkle_vault, mysterium_mv_token, team_multisig) -> Contract:
+    mysterium_mv_token.transact({"from": team_multisig}).transfer(merkle_vault.address, mysterium_mv_token.call().totalSupply())
+    merkle_vault.transact({"from": team_multisig}).fetchTokenBalance()
+    assert merkle_vault.call().getState() == MultiVaultState.Distributing
+    return merkle_vault
+
+
+def test_merkle_tree_proofs(merkle_tree, investor_rows):
+    """Every leaf verifies with its proof and wrong balances do not."""
+    for row in investor_rows:
+        proof = merkle_tree.get_proof(row.address)
+        assert merkle_tree.verify(row.address, row.amount, proof)
+        assert not merkle_tree.verify(row.address, row.amount + 1, proof)
+
+
+def test_merkle_tree_export(tmpdir, merkle_tree, customer):
+    """Exported proofs load back without rebuilding the tree."""
+    fname = str(tmpdir.join("proofs.json"))
+    merkle_tree.export_json(fname)
+    cached = CachedProofs.load(fname)
+    assert cached.root_hex == merkle_tree.root_hex
+    assert cached.total == merkle_tree.total
+    assert cached.get_proof_hex(customer) == merkle_tree.get_proof_hex(customer)
+
+
+def test_build_from_csv_cache(tmpdir):
+    """A cache hit gives the same proofs as a fresh build."""
+    fname = os.path.join(os.path.dirname(__file__), "..", "fake_seed_investor_data.csv")
+    cache_dir = str(tmpdir.join("merkle"))
+    rows = list(read_investor_data(fname))
+    tree = MerkleTree(rows)
+
+    built = build_from_csv(fname, cache_dir=cache_dir)
+    cached = build_from_csv(fname, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+
+    for proofs in (built, cached):
+        assert isinstance(proofs, CachedProofs)
+        assert proofs.root == tree.root
+        assert proofs.total == tree.total
+        for row in rows:
+            assert tree.verify(row.address, proofs.get_balance(row.address), proofs.get_proof(row.address))
+
+
+def test_merkle_vault_initial(merkle_vault, merkle_tree, investor_rows, customer):
+    """Vault knows the root and verifies proofs."""
+    assert merkle_vault.call().weiRaisedTotal() == merkle_tree.total
+    assert merkle_vault.call().getState() == MultiVaultState.Holding
+
+    for row in investor_rows:
+        assert merkle_vault.call().isValidProof(row.address, row.amount, merkle_tree.get_proof(row.address))
+
+    assert not merkle_vault.call().isValidProof(customer, 31, merkle_tree.get_proof(customer))
+
+
+def test_merkle_vault_claim(distributing_merkle_vault, merkle_tree, mysterium_mv_token, customer, customer_2):
+    """Investors claim pro-rata like in MultiVault."""
+    vault = distributing_merkle_vault
+
+    # 200 tokens, total balance 200
+    vault.transact({"from": customer}).claimAll(30, merkle_tree.get_proof(customer))
+    assert mysterium_mv_token.call().balanceOf(customer) == 30
+    assert vault.call().getClaimLeft(customer) == 0
+    assert vault.call().getClaimAmountOf(30) == 30
+
+    # Claim in two batches, the second one does not need a valid proof
+    vault.transact({"from": customer_2}).claim(70, merkle_tree.get_proof(customer_2), 20)
+    vault.transact({"from": customer_2}).claim(70, [], 50)
+    assert mysterium_mv_token.call().balanceOf(customer_2) == 70
+    assert vault.call().getClaimLeft(customer_2) == 0
+
+
+def test_merkle_vault_bad_proof(distributing_merkle_vault, merkle_tree, customer, customer_2, malicious_address):
+    """Wrong balances and other people's proofs are rejected."""
+    vault = distributing_merkle_vault
+
+    with pytest.raises(TransactionFailed):
+        vault.transact({"from": customer}).claimAll(31, merkle_tree.get_proof(customer))
+
+    with pytest.raises(TransactionFailed):
+        vault.transact({"from": malicious_address}).claimAll(70, merkle_tree.get_proof(customer_2))
+
+
+def test_merkle_vault_claim_too_much(distributing_merkle_vault, merkle_tree, customer):
+    """Somebody tries to claim too many tokens."""
+    with pytest.raises(TransactionFailed):
+        distributing_merkle_vault.transact({"from": customer}).claim(30, merkle_tree.get_proof(customer), 31)
+
+
+def test_merkle_vault_claim_early(merkle_vault, merkle_tree, customer):
+    """Tokens cannot be claimed before the owner fetches the balance."""
+    with pytest.raises(TransactionFailed):
+        merkle_vault.transact({"from": customer}).claimAll(30, merkle_tree.get_proof(customer))
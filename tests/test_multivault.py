@@ -1,6 +1,5 @@
 """Basic token properties"""
 
-import time
 from enum import IntEnum
 
 import pytest
@@ -10,6 +9,11 @@ from web3.contract import Contract
 
 from ico.tests.utils import time_travel
 
+from helpers.bulksend import STATUS_SUCCESS
+from helpers.distribute import distribute_vault
+from helpers.entitlements import read_entitlements
+from helpers.investors import ADD_INVESTORS_BASE_GAS, ADD_INVESTORS_PER_INVESTOR_GAS, estimate_page_gas
+
 
 
 class MultiVaultState(IntEnum):
@@ -33,30 +37,6 @@ def mysterium_release_agent(chain, team_multisig, mysterium_mv_token) -> Contrac
     return contract
 
 
-@pytest.fixture
-def mysterium_mv_token(chain, team_multisig, token_name, token_symbol, initial_supply) -> Contract:
-    """Create the token contract."""
-
-    args = ["Mysterium", "MYST", 200, 8]  # Owner set
-
-    tx = {
-        "from": team_multisig
-    }
-
-    contract, hash = chain.provider.deploy_contract('MysteriumToken', deploy_args=args, deploy_transaction=tx)
-
-    contract.transact({"from": team_multisig}).setReleaseAgent(team_multisig)
-    contract.transact({"from": team_multisig}).releaseTokenTransfer()
-
-    return contract
-
-
-@pytest.fixture
-def freeze_ends_at() -> int:
-    """Timestamp when the vault unlocks."""
-    return int(time.time() + 1000)
-
-
 @pytest.fixture
 def mysterium_multivault(chain, mysterium_mv_token, freeze_ends_at, customer, customer_2, team_multisig) -> Contract:
     args = [
@@ -252,3 +232,214 @@ def test_multi_vault_distribute_require_fetch(chain, mysterium_multivault_zero_d
     mysterium_multivault.transact({"from": customer_2}).claim(120)
     assert mysterium_mv_token.call().balanceOf(customer_2) == 140
     assert mysterium_multivault.call().getClaimLeft(customer_2) == 0
+
+
+def make_investor_addresses(count: int, offset: int=0) -> list:
+    """Generate synthetic investor addresses."""
+    return ["0x{:040x}".format(0x1000 + offset + i) for i in range(count)]
+
+
+@pytest.fixture
+def mysterium_multivault_empty(chain, team_multisig, freeze_ends_at) -> Contract:
+    """A vault without investors."""
+    args = [
+        team_multisig,
+        freeze_ends_at
+    ]
+
+    tx = {
+        "from": team_multisig
+    }
+
+    contract, hash = chain.provider.deploy_contract('MultiVault', deploy_args=args, deploy_transaction=tx)
+    return contract
+
+
+def test_add_investors(mysterium_multivault_empty, team_multisig, customer, customer_2):
+    """Batch loading gives the same state as loading investors one by one."""
+
+    vault = mysterium_multivault_empty
+    vault.transact({"from": team_multisig}).addInvestors([customer, customer_2], [30, 70])
+
+    assert vault.call().balances(customer) == 30
+    assert vault.call().balances(customer_2) == 70
+    assert vault.call().investorCount() == 2
+    assert vault.call().investors(0) == customer
+    assert vault.call().investors(1) == customer_2
+    assert vault.call().weiRaisedTotal() == 100
+
+
+def test_add_investors_duplicate(mysterium_multivault, team_multisig, customer, malicious_address):
+    """Batch loading rejects investors that are already loaded or duplicated within the batch."""
+
+    with pytest.raises(TransactionFailed):
+        mysterium_multivault.transact({"from": team_multisig}).addInvestors([malicious_address, customer], [1, 1])
+
+    with pytest.raises(TransactionFailed):
+        mysterium_multivault.transact({"from": team_multisig}).addInvestors([malicious_address, malicious_address], [1, 1])
+
+    assert mysterium_multivault.call().balances(malicious_address) == 0
+
+
+def test_add_investors_bad_input(mysterium_multivault_empty, team_multisig, customer, customer_2, malicious_address):
+    """Batch loading rejects bad argument lists and non-owners."""
+
+    vault = mysterium_multivault_empty
+
+    with pytest.raises(TransactionFailed):
+        vault.transact({"from": team_multisig}).addInvestors([customer, customer_2], [1])
+
+    with pytest.raises(TransactionFailed):
+        vault.transact({"from": team_multisig}).addInvestors([customer], [0])
+
+    with pytest.raises(TransactionFailed):
+        vault.transact({"from": malicious_address}).addInvestors([customer], [1])
+
+
+def test_add_investors_gas_benchmark(chain, web3, team_multisig, freeze_ends_at):
+    """Measure addInvestors() gas per investor for different batch sizes.
+
+    Run with ``py.test -s`` to see the table.
+    """
+
+    # The largest page the loader would send on the test chain
+    block_gas_limit = web3.eth.getBlock("latest")["gasLimit"]
+    largest_page = (block_gas_limit - ADD_INVESTORS_BASE_GAS) // ADD_INVESTORS_PER_INVESTOR_GAS
+    per_investor = {}
+
+    for batch_size in (1, 10, largest_page):
+        vault, hash = chain.provider.deploy_contract('MultiVault', deploy_args=[team_multisig, freeze_ends_at], deploy_transaction={"from": team_multisig})
+        addresses = make_investor_addresses(batch_size)
+
+        gas = estimate_page_gas(batch_size)
+        txid = vault.transact({"from": team_multisig, "gas": gas}).addInvestors(addresses, [1] * batch_size)
+        receipt = chain.wait.for_receipt(txid)
+
+        assert vault.call().investorCount() == batch_size
+        per_investor[batch_size] = receipt["gasUsed"] // batch_size
+        print("Batch size {}: {} gas total, {} gas per investor".format(batch_size, receipt["gasUsed"], per_investor[batch_size]))
+
+    # Batching amortizes the transaction base fee
+    assert per_investor[10] < per_investor[1]
+    sizes = sorted(per_investor.keys())
+    for smaller, larger in zip(sizes, sizes[1:]):
+        assert per_investor[larger] <= per_investor[smaller]
+
+
+@pytest.fixture
+def distributing_multivault(chain, mysterium_multivault_zero_days, mysterium_mv_token, team_multisig) -> Contract:
+    """Zero days vault with all tokens loaded and balance fetched."""
+    vault = mysterium_multivault_zero_days
+    mysterium_mv_token.transact({"from": team_multisig}).transfer(vault.address, mysterium_mv_token.call().totalSupply())
+    vault.transact({"from": team_multisig}).fetchTokenBalance()
+    assert vault.call().getState() == MultiVaultState.Distributing
+    return vault
+
+
+def test_distribute_range(distributing_multivault, mysterium_mv_token, team_multisig, customer, customer_2):
+    """Owner pushes tokens to investors page by page."""
+
+    vault = distributing_multivault
+
+    vault.transact({"from": team_multisig}).distributeRange(0, 1)
+    assert mysterium_mv_token.call().balanceOf(customer) == 60
+    assert mysterium_mv_token.call().balanceOf(customer_2) == 0
+    assert vault.call().distributionCursor() == 1
+
+    # Count past the end is capped
+    vault.transact({"from": team_multisig}).distributeRange(1, 100)
+    assert mysterium_mv_token.call().balanceOf(customer_2) == 140
+    assert vault.call().distributionCursor() == 2
+    assert vault.call().getClaimLeft(customer) == 0
+    assert vault.call().getClaimLeft(customer_2) == 0
+
+    # Running the same range again does not pay twice
+    vault.transact({"from": team_multisig}).distributeRange(0, 2)
+    assert mysterium_mv_token.call().balanceOf(customer) == 60
+    assert mysterium_mv_token.call().balanceOf(customer_2) == 140
+
+
+def test_distribute_vault(chain, web3, mysterium_mv_token, team_multisig, customer, customer_2):
+    """The driver pushes tokens page by page past investors who have claimed some or all already."""
+
+    tx = {
+        "from": team_multisig
+    }
+
+    vault, hash = chain.provider.deploy_contract('MultiVault', deploy_args=[team_multisig, 1], deploy_transaction=tx)
+    vault.transact(tx).setToken(mysterium_mv_token.address)
+    investors = [customer] + make_investor_addresses(3) + [customer_2] + make_investor_addresses(3, offset=3)
+    vault.transact(tx).addInvestors(investors, [10] * len(investors))
+
+    mysterium_mv_token.transact(tx).transfer(vault.address, mysterium_mv_token.call().totalSupply())
+    vault.transact(tx).fetchTokenBalance()
+    vault.transact({"from": customer}).claimAll()
+    vault.transact({"from": customer_2}).claim(10)
+
+    results = distribute_vault(web3, vault, team_multisig, page_size=3)
+    assert [r.key for r in results] == [0, 3, 6]
+    assert all(r.status == STATUS_SUCCESS for r in results)
+    assert vault.call().distributionCursor() == len(investors)
+
+    for investor in investors:
+        assert vault.call().getClaimLeft(investor) == 0
+        assert mysterium_mv_token.call().balanceOf(investor) == 25
+
+    # Nothing left to do
+    assert distribute_vault(web3, vault, team_multisig) == []
+
+
+def test_distribute_range_after_claim(distributing_multivault, mysterium_mv_token, team_multisig, customer, customer_2):
+    """Push distribution pays only what the investor has not claimed yet."""
+
+    vault = distributing_multivault
+    vault.transact({"from": customer_2}).claim(20)
+    vault.transact({"from": team_multisig}).distributeRange(0, 2)
+    assert mysterium_mv_token.call().balanceOf(customer) == 60
+    assert mysterium_mv_token.call().balanceOf(customer_2) == 140
+
+
+def test_distribute_range_restrictions(mysterium_multivault, mysterium_mv_token, team_multisig, malicious_address):
+    """Only owner can push and only when distributing."""
+
+    vault = mysterium_multivault
+
+    with pytest.raises(TransactionFailed):
+        vault.transact({"from": team_multisig}).distributeRange(0, 2)
+
+    mysterium_mv_token.transact({"from": team_multisig}).transfer(vault.address, mysterium_mv_token.call().totalSupply())
+    vault.transact({"from": team_multisig}).fetchTokenBalance()
+
+    # Still frozen
+    with pytest.raises(TransactionFailed):
+        vault.transact({"from": team_multisig}).distributeRange(0, 2)
+
+    with pytest.raises(TransactionFailed):
+        vault.transact({"from": malicious_address}).distributeRange(0, 2)
+
+
+def test_get_claim_range(distributing_multivault, team_multisig, customer, customer_2):
+    """Claim table for a slice of investors."""
+
+    vault = distributing_multivault
+    vault.transact({"from": customer_2}).claim(20)
+
+    investors, amounts, claimed, left = vault.call().getClaimRange(0, 10)
+    assert investors == [customer, customer_2]
+    assert amounts == [60, 140]
+    assert claimed == [0, 20]
+    assert left == [60, 120]
+
+    investors, amounts, claimed, left = vault.call().getClaimRange(1, 1)
+    assert investors == [customer_2]
+
+    investors, amounts, claimed, left = vault.call().getClaimRange(5, 1)
+    assert investors == []
+
+
+def test_read_entitlements(web3, distributing_multivault, customer, customer_2):
+    """Entitlement table is read in pages at one block."""
+
+    table = read_entitlements(web3, distributing_multivault, page_size=1)
+    assert table.block_number == web3.eth.blockNumber
+    assert [(e.address, e.amount, e.left) for e in table.entitlements] == [(customer, 60, 60), (customer_2, 140, 140)]
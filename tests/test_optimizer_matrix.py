@@ -0,0 +1,30 @@
+"""Optimizer settings benchmark."""
+import os
+
+from ico.definition import load_crowdsale_definitions
+
+from helpers.optimizer_matrix import compile_contracts, get_matrix, run_setting
+
+
+DEPLOYMENT_FILE = os.path.join(os.path.dirname(__file__), "..", "crowdsales", "mysterium-testrpc.yml")
+
+
+def test_optimizer_runs_change_code(session_project):
+    """More optimizer runs trade code size for cheaper calls."""
+    few_runs = compile_contracts(session_project, {"optimize": True, "optimize_runs": 1})
+    many_runs = compile_contracts(session_project, {"optimize": True, "optimize_runs": 10000})
+    assert set(few_runs.keys()) == set(many_runs.keys())
+    assert len(few_runs["MysteriumCrowdsale"]["bytecode_runtime"]) <= len(many_runs["MysteriumCrowdsale"]["bytecode_runtime"])
+
+
+def test_run_setting(session_project):
+    """One setting deploys the world and replays the scenario."""
+    setting = get_matrix([200])[1]
+    chain_data = load_crowdsale_definitions(DEPLOYMENT_FILE, "kovan")
+    result = run_setting(compile_contracts(session_project, setting), chain_data)
+
+    assert result["deploy_gas"]["total"] > result["deploy_gas"]["crowdsale"] > 0
+    assert result["deploy_gas"]["post_actions"] > 0
+    assert result["runtime_gas"]["Crowdsale.buy/trigger_soft_cap"] > result["runtime_gas"]["Crowdsale.buy/returning_investor"]
+    assert result["runtime_gas"]["MultiVault.claimAll"] > 0
+    assert result["code_size"]["MysteriumCrowdsale"]["runtime"] > 0
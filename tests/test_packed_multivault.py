@@ -0,0 +1,120 @@
+"""MultiVault with packed investor records."""
+
+from enum import IntEnum
+
+import pytest
+from ethereum.tester import TransactionFailed
+from web3.contract import Contract
+
+from ico.tests.utils import time_travel
+
+
+class MultiVaultState(IntEnum):
+    Unknown = 0
+    Holding = 1
+    Distributing = 2
+
+
+@pytest.fixture
+def packed_multivault(chain, mysterium_mv_token, freeze_ends_at, customer, customer_2, team_multisig) -> Contract:
+    args = [
+        team_multisig,
+        freeze_ends_at
+    ]
+
+    tx = {
+        "from": team_multisig
+    }
+
+    contract, hash = chain.provider.deploy_contract('PackedMultiVault', deploy_args=args, deploy_transaction=tx)
+    contract.transact({"from": team_multisig}).setToken(mysterium_mv_token.address)
+    contract.transact({"from": team_multisig}).addInvestor(customer, 30)
+    contract.transact({"from": team_multisig}).addInvestor(customer_2, 70)
+    return contract
+
+
+@pytest.fixture
+def distributing_packed_multivault(chain, packed_multivault, mysterium_mv_token, freeze_ends_at, team_multisig) -> Contract:
+    mysterium_mv_token.transact({"from": team_multisig}).transfer(packed_multivault.address, mysterium_mv_token.call().totalSupply())
+    packed_multivault.transact({"from": team_multisig}).fetchTokenBalance()
+    time_travel(chain, freeze_ends_at + 1)
+    assert packed_multivault.call().getState() == MultiVaultState.Distributing
+    return packed_multivault
+
+
+def get_functions(abi: list) -> set:
+    """Function signatures with their outputs."""
+    return {
+        (entry["name"], tuple(i["type"] for i in entry["inputs"]), tuple(o["type"] for o in entry["outputs"]), entry["constant"])
+        for entry in abi if entry["type"] == "function"
+    }
+
+
+def test_abi_compatible(project):
+    """Everything scripts call on MultiVault is there with the same types."""
+    compiled = project.compiled_contract_data
+    assert get_functions(compiled["MultiVault"]["abi"]) == get_functions(compiled["PackedMultiVault"]["abi"])
+
+
+def test_packed_initial(packed_multivault, customer, customer_2, freeze_ends_at, team_multisig):
+    """Getters read the packed records."""
+    vault = packed_multivault
+    assert vault.call().balances(customer) == 30
+    assert vault.call().balances(customer_2) == 70
+    assert vault.call().claimed(customer) == 0
+    assert vault.call().investorCount() == 2
+    assert vault.call().investors(1) == customer_2
+    assert vault.call().weiRaisedTotal() == 100
+    assert vault.call().getState() == MultiVaultState.Holding
+    assert vault.call().freezeEndsAt() == freeze_ends_at
+    assert vault.call().owner() == team_multisig
+
+
+def test_packed_add_investor_once(packed_multivault, customer, team_multisig):
+    """Loading the same investor again throws, like in MultiVault."""
+    with pytest.raises(TransactionFailed):
+        packed_multivault.transact({"from": team_multisig}).addInvestor(customer, 30)
+
+
+def test_packed_add_investor_too_large(packed_multivault, malicious_address, team_multisig):
+    """Balances must fit the record."""
+    with pytest.raises(TransactionFailed):
+        packed_multivault.transact({"from": team_multisig}).addInvestor(malicious_address, 2**128)
+
+    packed_multivault.transact({"from": team_multisig}).addInvestor(malicious_address, 2**128 - 1)
+    assert packed_multivault.call().balances(malicious_address) == 2**128 - 1
+
+
+def test_packed_claim(distributing_packed_multivault, mysterium_mv_token, customer, customer_2):
+    """Claimed tokens are kept next to the balance."""
+    vault = distributing_packed_multivault
+
+    vault.transact({"from": customer}).claimAll()
+    assert mysterium_mv_token.call().balanceOf(customer) == 60
+    assert vault.call().claimed(customer) == 60
+    assert vault.call().balances(customer) == 30
+    assert vault.call().getClaimLeft(customer) == 0
+
+    vault.transact({"from": customer_2}).claim(40)
+    vault.transact({"from": customer_2}).claim(100)
+    assert vault.call().claimed(customer_2) == 140
+    assert vault.call().balances(customer_2) == 70
+
+    with pytest.raises(TransactionFailed):
+        vault.transact({"from": customer_2}).claim(1)
+
+
+def test_packed_distribute_range(distributing_packed_multivault, mysterium_mv_token, customer, customer_2, team_multisig):
+    """Pushing tokens skips the investors who have claimed."""
+    vault = distributing_packed_multivault
+    vault.transact({"from": customer}).claimAll()
+
+    vault.transact({"from": team_multisig}).distributeRange(0, 10)
+    assert vault.call().distributionCursor() == 2
+    assert mysterium_mv_token.call().balanceOf(customer) == 60
+    assert mysterium_mv_token.call().balanceOf(customer_2) == 140
+
+    investors, amounts, claimed, left = vault.call().getClaimRange(0, 10)
+    assert investors == [customer, customer_2]
+    assert amounts == claimed == [60, 140]
+    assert left == [0, 0]
@@ -0,0 +1,57 @@
+"""Offline pricing model against MysteriumPricing.calculatePrice()."""
+import random
+
+import pytest
+
+from eth_utils import to_wei
+
+from helpers.pricing_model import MysteriumPricingModel, ContractThrow, compare_with_contract
+
+
+def make_cases(soft_cap_in_weis: int, count: int, seed: int=1) -> list:
+    """Purchases on both sides of the soft cap, including the exact edge."""
+    rand = random.Random(seed)
+    edges = [0, soft_cap_in_weis - 1, soft_cap_in_weis, soft_cap_in_weis + 1]
+    values = [1, 7, to_wei(1 / 120, "ether"), to_wei(1, "ether"), to_wei(12345, "ether") + 1]
+
+    cases = [(value, wei_raised) for value in values for wei_raised in edges]
+    for i in range(count):
+        cases.append((rand.randint(1, to_wei(50000, "ether")), rand.randint(0, 2 * soft_cap_in_weis)))
+    return cases
+
+
+def test_model_parameters(mysterium_pricing):
+    """Model reads the same state as the contract uses."""
+    model = MysteriumPricingModel.from_contract(mysterium_pricing)
+    assert model.chf_rate == 120 * 10000
+    assert model.get_soft_cap_in_weis() == mysterium_pricing.call().getSoftCapInWeis()
+    assert model.convert_to_wei(12000) == mysterium_pricing.call().convertToWei(12000)
+    assert model.get_eth_chf_price() == mysterium_pricing.call().getEthChfPrice()
+
+
+@pytest.mark.parametrize("chf_rate", [120 * 10000, 1203458, 3])
+def test_differential(mysterium_pricing, team_multisig, chf_rate):
+    """Model and contract agree bit for bit, also with rates that do not divide evenly."""
+    mysterium_pricing.transact({"from": team_multisig}).setConversionRate(chf_rate)
+
+    model = MysteriumPricingModel.from_contract(mysterium_pricing)
+    cases = make_cases(model.get_soft_cap_in_weis(), 200)
+
+    assert compare_with_contract(model, mysterium_pricing, cases) == []
+
+
+def test_single_quote():
+    """Known prices below and above the soft cap."""
+    model = MysteriumPricingModel(120 * 10000)
+    assert model.calculate_price(to_wei(1 / 120, "ether"), 0) == 1 * 10**8
+    assert model.calculate_price(to_wei(1.2 / 120, "ether"), model.get_soft_cap_in_weis() + 1) == 1 * 10**8
+
+
+def test_overflow_throws():
+    """SafeMathLib overflow is reported like a contract throw."""
+    model = MysteriumPricingModel(120 * 10000)
+    with pytest.raises(ContractThrow):
+        model.calculate_price(2**255, 0)
+
+    with pytest.raises(ContractThrow):
+        MysteriumPricingModel(0).calculate_price(1, 0)
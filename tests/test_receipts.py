@@ -0,0 +1,128 @@
+"""Wait for transaction receipts in batches."""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from helpers.receipts import ReceiptWaiter, ReceiptTimeout, TransactionThrew
+
+
+def send_transfers(web3, accounts, count: int) -> list:
+    return [web3.eth.sendTransaction({"from": accounts[0], "to": accounts[1], "value": i + 1}) for i in range(count)]
+
+
+def test_wait_many(web3, accounts):
+    """Receipts come back in the txid order, with the gas used counted."""
+    txids = send_transfers(web3, accounts, 10)
+    waiter = ReceiptWaiter(web3, poll_interval=0.1)
+
+    receipts = waiter.wait(txids, timeout=10)
+
+    assert [receipt["transactionHash"] for receipt in receipts] == txids
+    assert waiter.gas_used == 10 * 21000
+
+    # Everything was mined already, so one batch was enough
+    assert waiter.batches == 1
+
+
+def test_wait_threads(web3, accounts):
+    """Callers in different threads share the poller."""
+    waiter = ReceiptWaiter(web3, poll_interval=0.1)
+    batches = [send_transfers(web3, accounts, 3) for i in range(4)]
+    results = {}
+
+    def confirm(idx):
+        results[idx] = waiter.wait(batches[idx], timeout=10)
+
+    threads = [threading.Thread(target=confirm, args=(idx,)) for idx in range(len(batches))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results.keys()) == [0, 1, 2, 3]
+    assert waiter.gas_used == 12 * 21000
+
+
+def test_wait_timeout(web3, accounts):
+    """Transactions the node does not know time out as a batch."""
+    txids = send_transfers(web3, accounts, 1)
+    unknown = "0x" + "12" * 32
+    waiter = ReceiptWaiter(web3, poll_interval=0.1)
+
+    with pytest.raises(ReceiptTimeout) as e:
+        waiter.wait(txids + [unknown], timeout=0.5)
+
+    assert e.value.txids == [unknown]
+    assert not waiter.pending
+
+
+def test_wait_mined_in_seen_block(web3, accounts):
+    """A transaction watched after the poller has seen its block resolves without a new block."""
+    unknown = "0x" + "12" * 32
+    waiter = ReceiptWaiter(web3, poll_interval=0.05)
+
+    # Keep the poller running. testrpc has no block filters, so it follows the block number.
+    waiter.watch(unknown)
+    txids = send_transfers(web3, accounts, 1)
+    deadline = time.time() + 10
+    while waiter.last_block != web3.eth.blockNumber:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+    receipts = waiter.wait(txids, timeout=5)
+    assert receipts[0]["transactionHash"] == txids[0]
+    waiter.forget([unknown])
+
+
+class MinedNode:
+    """Just enough of web3 for ReceiptWaiter: a node without block filters where the given receipts are mined."""
+
+    def __init__(self, receipts: dict):
+        self.receipts = receipts
+        self.currentProvider = None
+        self.eth = SimpleNamespace(blockNumber=1)
+        self._requestManager = SimpleNamespace(request_blocking=self.request_blocking)
+
+    def request_blocking(self, method, params):
+        if method == "eth_newBlockFilter":
+            raise NotImplementedError("RPC method not implemented")
+        if method == "eth_getTransactionReceipt":
+            return self.receipts.get(params[0])
+        raise AssertionError("Unexpected call {}".format(method))
+
+
+def test_wait_receipt_status():
+    """Receipt status tells if a transaction threw, whatever gas it used."""
+    succeeded = "0x" + "01" * 32
+    failed = "0x" + "02" * 32
+    node = MinedNode({
+        succeeded: {"transactionHash": succeeded, "gasUsed": "0x30d40", "status": "0x1"},
+        failed: {"transactionHash": failed, "gasUsed": "0x5208", "status": "0x0"},
+    })
+    waiter = ReceiptWaiter(node, poll_interval=0.01)
+
+    assert waiter.wait([succeeded], timeout=5)[0]["transactionHash"] == succeeded
+
+    with pytest.raises(TransactionThrew) as e:
+        waiter.wait([failed], timeout=5)
+    assert e.value.txid == failed
+
+
+def test_wait_serializes_in_process_provider():
+    """The poller and the callers take turns in an in-process provider, which is restored afterwards."""
+    txid = "0x" + "01" * 32
+    node = MinedNode({txid: {"transactionHash": txid, "gasUsed": "0x5208", "status": "0x1"}})
+    provider = SimpleNamespace(make_request=lambda method, params: {"result": None})
+    node.currentProvider = provider
+    make_request = provider.make_request
+
+    waiter = ReceiptWaiter(node, poll_interval=0.01)
+    future = waiter.watch(txid)
+    thread = waiter.thread
+    assert provider.make_request is not make_request
+
+    future.result(5)
+    thread.join(5)
+    assert provider.make_request is make_request
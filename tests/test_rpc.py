@@ -0,0 +1,46 @@
+"""Raw JSON-RPC helpers."""
+import threading
+import time
+from types import SimpleNamespace
+
+from helpers.rpc import serialize_requests
+
+
+class InProcessProvider:
+    """Provider that notices when two threads are inside it at once."""
+
+    def __init__(self):
+        self.inside = 0
+        self.overlaps = 0
+
+    def make_request(self, method, params):
+        self.inside += 1
+        if self.inside > 1:
+            self.overlaps += 1
+        time.sleep(0.01)
+        self.inside -= 1
+        return {"result": None}
+
+
+def request_from_threads(provider, count: int):
+    threads = [threading.Thread(target=provider.make_request, args=("eth_blockNumber", [])) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_serialize_requests():
+    """Inside the block one thread at a time gets in the provider, after it the provider is as it was."""
+    provider = InProcessProvider()
+    web3 = SimpleNamespace(currentProvider=provider)
+
+    with serialize_requests(web3):
+        with serialize_requests(web3):
+            request_from_threads(provider, 4)
+        request_from_threads(provider, 4)
+    assert provider.overlaps == 0
+    assert "make_request" not in vars(provider)
+
+    request_from_threads(provider, 4)
+    assert provider.overlaps > 0
@@ -0,0 +1,124 @@
+"""Tiered pricing against its Python model, and the tier lookup gas cost."""
+import random
+
+import pytest
+
+from eth_utils import to_wei
+from web3.contract import Contract
+
+from helpers.pricing_model import TieredPricingModel, compare_with_contract
+
+
+#: 120 CHF/ETH as in the other tests
+CHF_RATE = 120 * 10000
+
+
+def make_tiers(count: int) -> tuple:
+    """Tiers of 1M CHF each, token price rising from 0.80 CHF by 0.025 CHF per tier."""
+    limits = [(i + 1) * 1000000 * 10000 for i in range(count)]
+    prices = [8000 + i * 250 for i in range(count)]
+    return limits, prices
+
+
+def deploy_tiered_pricing(chain, web3, owner: str, count: int) -> Contract:
+    limits, prices = make_tiers(count)
+    gas = min(web3.eth.getBlock("latest")["gasLimit"], 500000 + count * 90000)
+    pricing, hash = chain.provider.deploy_contract('TieredPricing', deploy_args=[CHF_RATE, limits, prices], deploy_transaction={"from": owner, "gas": gas})
+    return pricing
+
+
+@pytest.fixture
+def tiered_pricing(chain, web3, team_multisig) -> Contract:
+    """Pricing with 8 tiers."""
+    return deploy_tiered_pricing(chain, web3, team_multisig, 8)
+
+
+@pytest.fixture
+def tiered_model(tiered_pricing) -> TieredPricingModel:
+    return TieredPricingModel.from_contract(tiered_pricing)
+
+
+def test_tiers(tiered_pricing, tiered_model):
+    """Tiers are stored as given and converted to wei."""
+    limits, prices = make_tiers(8)
+    assert tiered_pricing.call().getTierCount() == 8
+    assert tiered_model.tier_limits_chf == limits
+    assert tiered_model.tier_prices_chf == prices
+
+    for i in range(8):
+        assert tiered_pricing.call().weiTiers(i) == [tiered_model.tier_limits_in_wei[i], tiered_model.tier_prices_in_wei[i]]
+
+
+def test_tier_index(tiered_pricing, tiered_model):
+    """Tier lookup at and around the limits."""
+    for limit in tiered_model.tier_limits_in_wei:
+        for wei_raised in (limit - 1, limit, limit + 1):
+            assert tiered_pricing.call().getTierIndex(wei_raised) == tiered_model.get_tier_index(wei_raised)
+
+    assert tiered_pricing.call().getTierIndex(0) == 0
+    assert tiered_pricing.call().getTierIndex(10**30) == 7
+
+
+def test_single_tier_price(tiered_pricing):
+    """1.2 ETH is 144 CHF, which buys 180 tokens at 0.80 CHF."""
+    tokens = tiered_pricing.call().calculatePrice(to_wei(1.2, "ether"), 0, 0, '0x0000000000000000000000000000000000000000', 8)
+    assert tokens == 180 * 10**8
+
+
+def test_split_purchase(tiered_pricing, tiered_model):
+    """A purchase crossing two limits is priced in three tiers."""
+    limits = tiered_model.tier_limits_in_wei
+    prices = tiered_model.tier_prices_in_wei
+    ether = to_wei(1, "ether")
+
+    value = limits[2] - limits[0] + 2 * ether
+    wei_raised = limits[0] - ether
+    expected = ether * 10**8 // prices[0] + (limits[1] - limits[0]) * 10**8 // prices[1] + (limits[2] - limits[1]) * 10**8 // prices[2] + ether * 10**8 // prices[3]
+
+    assert tiered_model.calculate_price(value, wei_raised) == expected
+    assert tiered_pricing.call().calculatePrice(value, wei_raised, 0, '0x0000000000000000000000000000000000000000', 8) == expected
+
+
+def test_differential(tiered_pricing, tiered_model):
+    """Model and contract agree on random purchases and on the tier limits."""
+    rand = random.Random(1)
+    top = tiered_model.tier_limits_in_wei[-1]
+
+    cases = [(1, limit) for limit in tiered_model.tier_limits_in_wei]
+    cases += [(rand.randint(1, top // 2), rand.randint(0, top + top // 8)) for i in range(200)]
+
+    assert compare_with_contract(tiered_model, tiered_pricing, cases) == []
+
+
+@pytest.mark.parametrize("chf_rate", [1203458, 3])
+def test_differential_rates(chain, web3, team_multisig, chf_rate):
+    """Rounding in the wei conversion matches with rates that do not divide evenly."""
+    limits, prices = make_tiers(4)
+    pricing, hash = chain.provider.deploy_contract('TieredPricing', deploy_args=[chf_rate, limits, prices], deploy_transaction={"from": team_multisig})
+    model = TieredPricingModel(chf_rate, limits, prices)
+
+    rand = random.Random(chf_rate)
+    top = model.tier_limits_in_wei[-1]
+    cases = [(rand.randint(1, top), rand.randint(0, top)) for i in range(100)]
+
+    assert compare_with_contract(model, pricing, cases) == []
+
+
+def test_tier_lookup_gas_benchmark(chain, web3, team_multisig):
+    """Measure calculatePrice() gas for 2, 8 and 32 tiers.
+
+    The purchase is priced in the last tier, the worst case for a linear scan.
+    Run with ``py.test -s`` to see the table.
+    """
+
+    gas = {}
+    for count in (2, 8, 32):
+        pricing = deploy_tiered_pricing(chain, web3, team_multisig, count)
+        model = TieredPricingModel.from_contract(pricing)
+        wei_raised = model.tier_limits_in_wei[-2] + 1
+        gas[count] = pricing.estimateGas().calculatePrice(to_wei(1, "ether"), wei_raised, 0, '0x0000000000000000000000000000000000000000', 8)
+        print("{} tiers: calculatePrice() {} gas".format(count, gas[count]))
+
+    # Binary search takes 1, 3 and 5 steps, so quadrupling the tiers adds the same cost each time.
+    # A linear scan would take 24 more steps from 8 to 32 tiers, versus 6 from 2 to 8.
+    assert gas[32] - gas[8] < (gas[8] - gas[2]) * 2
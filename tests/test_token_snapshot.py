@@ -0,0 +1,144 @@
+"""Token holder snapshots from event replay."""
+import io
+from types import SimpleNamespace
+
+import pytest
+from eth_utils import decode_hex
+from web3 import Web3
+from web3.providers.base import BaseProvider
+
+from helpers.rpc import is_testrpc
+from helpers.snapshot import BalanceTable, Snapshot, take_snapshot, check_snapshot, WORD_MAX
+
+
+INITIAL_SUPPLY = 1000 * 10**8
+
+
+@pytest.fixture
+def token(chain, team_multisig, accounts):
+    """Token with minted and transferred balances."""
+    token, hash = chain.provider.deploy_contract('MysteriumToken', deploy_args=["Mysterium", "MYST", INITIAL_SUPPLY, 8], deploy_transaction={"from": team_multisig})
+    token.transact({"from": team_multisig}).setMintAgent(team_multisig, True)
+    token.transact({"from": team_multisig}).setReleaseAgent(team_multisig)
+    for idx, account in enumerate(accounts[5:9]):
+        token.transact({"from": team_multisig}).mint(account, (idx + 1) * 10**8)
+    token.transact({"from": team_multisig}).releaseTokenTransfer()
+    return token
+
+
+def test_balance_table():
+    """Balances too big for a word move to the dict and back."""
+    table = BalanceTable()
+    address = b"\x01" * 20
+    table.credit(address, WORD_MAX)
+    table.credit(address, 1)
+    assert table.balance_of("0x" + "01" * 20) == WORD_MAX + 1
+    assert table.big
+
+    table.debit(address, 2)
+    assert table.balance_of("0x" + "01" * 20) == WORD_MAX - 1
+    assert not table.big
+    assert table.total() == WORD_MAX - 1
+
+
+def test_snapshot(web3, token, team_multisig, accounts):
+    """Snapshot before and after transfers match the token."""
+    before = web3.eth.blockNumber
+
+    token.transact({"from": accounts[5]}).transfer(accounts[1], 10**8)
+    token.transact({"from": team_multisig}).transfer(accounts[2], 5 * 10**8)
+    token.transact({"from": accounts[8]}).transfer(accounts[5], 2 * 10**8)
+    after = web3.eth.blockNumber
+
+    initial_balances = {team_multisig: INITIAL_SUPPLY}
+
+    snapshot = take_snapshot(web3, token, before, 0, initial_balances)
+    assert snapshot.events == 4
+    assert snapshot.table.balance_of(accounts[5]) == 10**8
+    assert snapshot.table.balance_of(accounts[1]) == 0
+
+    snapshot = take_snapshot(web3, token, after, 0, initial_balances)
+    assert snapshot.events == 7
+    assert snapshot.table.balance_of(accounts[5]) == 2 * 10**8
+    assert snapshot.table.balance_of(accounts[2]) == 5 * 10**8
+    assert not check_snapshot(web3, token, snapshot, seed=1)
+
+    out = io.StringIO()
+    snapshot.write_csv(out)
+    rows = out.getvalue().splitlines()
+    assert rows[0] == "address,balance"
+    assert len(rows) == 1 + 7
+
+
+def test_snapshot_earlier_block(web3, token, team_multisig, accounts):
+    """Snapshot at an earlier block is checked against the token as it was then."""
+
+    if is_testrpc(web3):
+        pytest.skip("testrpc answers eth_call at the latest block only")
+
+    before = web3.eth.blockNumber
+    token.transact({"from": accounts[5]}).transfer(accounts[1], 10**8)
+
+    snapshot = take_snapshot(web3, token, before, 0, {team_multisig: INITIAL_SUPPLY})
+    assert not check_snapshot(web3, token, snapshot, seed=1)
+
+
+#: Enough of the token ABI for check_snapshot()
+TOKEN_ABI = [
+    {"type": "function", "name": "totalSupply", "constant": True, "inputs": [], "outputs": [{"name": "", "type": "uint256"}]},
+    {"type": "function", "name": "balanceOf", "constant": True, "inputs": [{"name": "", "type": "address"}], "outputs": [{"name": "", "type": "uint256"}]},
+]
+
+
+class HistoricToken:
+    """Just enough of web3 for batched token calls: a node that answers calls at any past block.
+
+    :param balances: Block number -> address -> token balance at that block
+    """
+
+    def __init__(self, balances: dict):
+        self.balances = balances
+        self.calls = []
+        self.currentProvider = None
+        self._requestManager = SimpleNamespace(request_blocking=self.request_blocking)
+
+    def request_blocking(self, method, params):
+        if method != "eth_call":
+            raise AssertionError("Unexpected call {}".format(method))
+        tx, block = params
+        balances = self.balances[int(block, 16)]
+        if tx["data"].startswith("0x18160ddd"):
+            self.calls.append(("totalSupply", block))
+            value = sum(balances.values())
+        else:
+            self.calls.append(("balanceOf", block))
+            value = balances.get("0x" + tx["data"][-40:], 0)
+        return "0x{:064x}".format(value)
+
+
+def test_check_snapshot_block():
+    """totalSupply and balanceOf are read at the snapshot block."""
+    holders = ["0x" + "{:02x}".format(idx) * 20 for idx in range(1, 4)]
+    node = HistoricToken({
+        10: {holders[0]: 100, holders[1]: 50},
+        11: {holders[0]: 70, holders[1]: 50, holders[2]: 30},
+    })
+    token = Web3(BaseProvider()).eth.contract(abi=TOKEN_ABI)(address="0x0000000000000000000000000000000000001000")
+
+    table = BalanceTable()
+    table.credit(decode_hex(holders[0]), 100)
+    table.credit(decode_hex(holders[1]), 50)
+    snapshot = Snapshot(10, table, 2)
+
+    assert not check_snapshot(node, token, snapshot, seed=1)
+    assert node.calls == [("totalSupply", hex(10))] + [("balanceOf", hex(10))] * 2
+
+    # The same balances checked at a later block, where a holder has moved tokens
+    assert check_snapshot(node, token, Snapshot(11, table, 2), seed=1) == [(holders[0], 70, 100)]
+
+
+def test_snapshot_mismatch(web3, token, team_multisig):
+    """Leaving out the initial supply is caught by the checks."""
+    snapshot = take_snapshot(web3, token, web3.eth.blockNumber)
+    mismatches = check_snapshot(web3, token, snapshot)
+    assert mismatches[0][0] == "totalSupply"
@@ -0,0 +1,63 @@
+"""Verify deployed contracts against the local compilation."""
+import pytest
+
+from helpers.chaincache import get_compiled_contracts
+from helpers.verify import CompilerMismatch, check_solc_version, split_metadata, verify_deployment, STATUS_VERIFIED, STATUS_MISMATCH, STATUS_NO_CODE, STATUS_NOT_COMPILED
+
+
+@pytest.fixture
+def deployment_report(chain, mysterium_world) -> dict:
+    """Deployment report of the session contracts, as the deployer would write it."""
+    library, txid = chain.provider.get_or_deploy_contract("SafeMathLib")
+    libraries = {"SafeMathLib": library.address}
+    return {
+        "chain": "tester",
+        "contracts": {
+            "token": {"contract_name": "MysteriumToken", "address": mysterium_world["token"].address, "libraries": libraries},
+            "pricing_strategy": {"contract_name": "MysteriumPricing", "address": mysterium_world["pricing"].address, "libraries": libraries},
+            "crowdsale": {"contract_name": "MysteriumCrowdsale", "address": mysterium_world["crowdsale"].address, "libraries": libraries},
+            "token_distribution": {"contract_name": "MysteriumTokenDistribution", "address": mysterium_world["finalize_agent"].address, "libraries": libraries},
+        }
+    }
+
+
+def test_split_metadata():
+    """The swarm hash solc appends is cut off."""
+    swarm = "ab" * 32
+    assert split_metadata("0x6060604052" + "a165627a7a72305820" + swarm + "0029") == ("6060604052", swarm)
+    assert split_metadata("0x6060604052") == ("6060604052", None)
+
+
+def test_check_solc_version():
+    """Only the pinned compiler is accepted."""
+    check_solc_version("solc, the solidity compiler commandline interface\nVersion: 0.4.8+commit.60cc1668.Linux.g++\n")
+    with pytest.raises(CompilerMismatch) as e:
+        check_solc_version("solc, the solidity compiler commandline interface\nVersion: 0.4.11+commit.68ef5810.Linux.g++\n")
+    assert "0.4.11" in str(e.value)
+
+
+def test_verify_deployment(project, web3, deployment_report):
+    """The session contracts and their library match the compiled code."""
+    result = verify_deployment(web3, get_compiled_contracts(project), deployment_report)
+
+    assert result["verified"]
+    assert result["block_number"] == web3.eth.blockNumber
+    assert set(result["contracts"].keys()) == {"token", "pricing_strategy", "crowdsale", "token_distribution", "SafeMathLib"}
+    assert all(contract["status"] == STATUS_VERIFIED for contract in result["contracts"].values())
+    assert all(contract["metadata_match"] for contract in result["contracts"].values())
+
+
+def test_verify_mismatch(project, web3, deployment_report):
+    """Wrong contracts, empty addresses and unknown contracts are reported."""
+    contracts = deployment_report["contracts"]
+    contracts["token"]["contract_name"] = "MysteriumPricing"
+    contracts["pricing_strategy"]["address"] = "0x" + "1" * 40
+    contracts["crowdsale"]["contract_name"] = "NoSuchContract"
+
+    result = verify_deployment(web3, get_compiled_contracts(project), deployment_report)
+
+    assert not result["verified"]
+    assert result["contracts"]["token"]["status"] == STATUS_MISMATCH
+    assert result["contracts"]["pricing_strategy"]["status"] == STATUS_NO_CODE
+    assert result["contracts"]["crowdsale"]["status"] == STATUS_NOT_COMPILED
+    assert result["contracts"]["token_distribution"]["status"] == STATUS_VERIFIED